@@ -17,6 +17,10 @@ CLASS: CPSC 326
 
 import pytest
 import io
+import multiprocessing
+import os
+import sys
+import zlib
 
 from mypl_error import *
 from mypl_iowrapper import *
@@ -26,6 +30,14 @@ from mypl_ast_parser import *
 from mypl_var_table import *
 from mypl_code_gen import *
 from mypl_vm import *
+from mypl_optimizer import *
+from mypl_semantic_checker import *
+from mypl_const_folder import *
+from mypl_register import *
+from mypl_py_gen import *
+from mypl_py_runtime import *
+from mypl_bytecode import *
+from mypl_cache import *
 
 
 #----------------------------------------------------------------------
@@ -104,9 +116,9 @@ def test_var_table_multiple_environments():
 #----------------------------------------------------------------------
 
 # helper function to build and return a vm from the program string
-def build(program):
+def build(program, vm=None):
     in_stream = FileWrapper(io.StringIO(program))
-    vm = VM()
+    vm = VM() if vm is None else vm
     cg = CodeGenerator(vm)
     ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse().accept(cg)
     return vm
@@ -1153,3 +1165,1308 @@ def test_string_get(capsys):
 # looking for places in your code that are not tested by the above.
 #----------------------------------------------------------------------
 
+
+#----------------------------------------------------------------------
+# DISPATCH MODES
+#----------------------------------------------------------------------
+
+def test_every_opcode_has_a_handler():
+    vm = VM()
+    for opcode in OpCode:
+        assert opcode in vm.handlers
+
+def test_switch_and_table_dispatch_agree(capsys):
+    program = (
+        'int fib(int n) { \n'
+        '  if (n <= 1) {return n;} \n'
+        '  return fib(n - 2) + fib(n - 1); \n'
+        '} \n'
+        'void main() { \n'
+        '  for (int i = 0; i < 10; i = i + 1) { \n'
+        '    print(itos(fib(i)) + " "); \n'
+        '  } \n'
+        '} \n'
+    )
+    build(program, VM('switch')).run()
+    switch_out = capsys.readouterr().out
+    build(program, VM('table')).run()
+    table_out = capsys.readouterr().out
+    assert switch_out == table_out == '0 1 1 2 3 5 8 13 21 34 '
+
+def test_table_dispatch_reports_errors():
+    program = (
+        'void main() { \n'
+        '  int x = null; \n'
+        '  int y = x + 1; \n'
+        '} \n'
+    )
+    with pytest.raises(MyPLError) as e:
+        build(program, VM('table')).run()
+    assert str(e.value).startswith('VM Error: null in add')
+
+def test_link_keeps_instructions():
+    program = (
+        'void main() { \n'
+        '  double x = 1.0; \n'
+        '  int y = 1; \n'
+        '  bool z = true; \n'
+        '  print(itos(y) + dtos(x)); \n'
+        '} \n'
+    )
+    vm = build(program)
+    template = vm.frame_templates['main']
+    before = [(i.opcode, type(i.operand), i.operand) for i in template.instructions]
+    vm.link()
+    assert template.is_linked()
+    after = [(i.opcode, type(i.operand), i.operand) for i in template.instructions]
+    assert before == after
+    assert len(template.opcodes) == len(template.operands) == len(before)
+
+def test_linked_program_runs_on_switch_dispatch(capsys):
+    vm = build('void main() { print(1 + 2); }', VM('switch'))
+    vm.link()
+    vm.run()
+    assert capsys.readouterr().out == '3'
+
+def test_switch_dispatch_runs_typed_and_fused_opcodes(capsys):
+    program = (
+        'struct P {int x; double y;} \n'
+        'int loop(int n, int acc) { \n'
+        '  if (n <= 0) {return acc;} \n'
+        '  return loop(n - 1, acc + n); \n'
+        '} \n'
+        'void main() { \n'
+        '  P p = new P(2, 2.5); \n'
+        '  for (int i = 0; i < 3; i = i + 1) { \n'
+        '    print(itos(p.x * i / 2) + dtos(p.y - 0.5) + " "); \n'
+        '  } \n'
+        '  print(loop(10, 0)); \n'
+        '  print(true and i_am_false() or 1 < 2); \n'
+        '} \n'
+        'bool i_am_false() {return false;} \n'
+    )
+    vm = build_checked(program)
+    PeepholeOptimizer().optimize(vm)
+    used = {i.opcode for t in vm.frame_templates.values() for i in t.instructions}
+    assert {OpCode.INITS, OpCode.TCALL, OpCode.JMPFP, OpCode.MULI} <= used
+    # without the table dispatch handlers to fall back on
+    switch = VM('switch')
+    switch.frame_templates = vm.frame_templates
+    switch.handlers = {}
+    switch.run()
+    assert capsys.readouterr().out == '02.0 02.0 22.0 55true'
+
+def test_generic_code_generation():
+    program = 'int f(int x, double y) { return x + 1; } void main() {}'
+    vm = VM()
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    ast.accept(SemanticChecker())
+    ast.accept(CodeGenerator(vm, typed=False))
+    opcodes = [i.opcode for i in vm.frame_templates['f'].instructions]
+    assert OpCode.ADD in opcodes and OpCode.ADDI not in opcodes
+
+
+#----------------------------------------------------------------------
+# GARBAGE COLLECTION
+#----------------------------------------------------------------------
+
+def test_gc_frees_unreachable_structs(capsys):
+    program = (
+        'struct Node {int val; Node next;} \n'
+        'void main() { \n'
+        '  Node keep = new Node(1, null); \n'
+        '  for (int i = 0; i < 100; i = i + 1) { \n'
+        '    Node tmp = new Node(i, keep); \n'
+        '  } \n'
+        '  print(keep.val); \n'
+        '} \n'
+    )
+    vm = build(program, VM(gc_threshold=10))
+    vm.run()
+    assert capsys.readouterr().out == '1'
+    assert vm.gc_collections == 10
+    assert vm.gc_freed >= 90
+    assert len(vm.struct_heap) <= 11
+
+def test_gc_keeps_reachable_objects(capsys):
+    program = (
+        'struct Node {int val; Node next;} \n'
+        'Node build(int n) { \n'
+        '  Node head = null; \n'
+        '  for (int i = 0; i < n; i = i + 1) { \n'
+        '    array int junk = new int[2]; \n'
+        '    head = new Node(i, head); \n'
+        '  } \n'
+        '  return head; \n'
+        '} \n'
+        'void main() { \n'
+        '  Node p = build(20); \n'
+        '  int sum = 0; \n'
+        '  while (p != null) { \n'
+        '    sum = sum + p.val; \n'
+        '    p = p.next; \n'
+        '  } \n'
+        '  print(sum); \n'
+        '} \n'
+    )
+    vm = build(program, VM(gc_threshold=3))
+    vm.run()
+    assert capsys.readouterr().out == '190'
+    assert vm.gc_collections > 0
+
+def test_gc_ignores_ints_equal_to_object_ids(capsys):
+    program = (
+        'struct Node {int val; Node next;} \n'
+        'void main() { \n'
+        '  Node head = null; \n'
+        '  for (int i = 0; i < 3000; i = i + 1) { head = new Node(i, head); } \n'
+        '  int n = head.val; \n'
+        '  head = null; \n'
+        '  array int a = new int[1]; \n'
+        '  print(n); \n'
+        '} \n'
+    )
+    vm = build(program, VM(gc_threshold=3001))
+    vm.run()
+    assert capsys.readouterr().out == '2999'
+    # the node vals (0 to 2999) overlap the object ids
+    assert vm.gc_collections == 1
+    assert vm.gc_freed == 3000
+
+def test_gc_disabled():
+    program = (
+        'void main() { \n'
+        '  for (int i = 0; i < 50; i = i + 1) { \n'
+        '    array int xs = new int[1]; \n'
+        '  } \n'
+        '} \n'
+    )
+    vm = build(program, VM(gc_threshold=0))
+    vm.run()
+    assert vm.gc_collections == 0
+    assert len(vm.array_heap) == 50
+
+
+#----------------------------------------------------------------------
+# REF HEAP MODE
+#----------------------------------------------------------------------
+
+def test_ref_heap_tree(capsys):
+    program = (
+        'struct Node {int val; Node left; Node right;} \n'
+        'int total(Node n) { \n'
+        '  if (n == null) {return 0;} \n'
+        '  return n.val + total(n.left) + total(n.right); \n'
+        '} \n'
+        'void main() { \n'
+        '  Node t = new Node(1, new Node(2, null, null), new Node(3, null, null)); \n'
+        '  array Node ns = new Node[2]; \n'
+        '  ns[1] = t; \n'
+        '  ns[1].left.val = 10; \n'
+        '  print(total(ns[1])); \n'
+        '  print(length(ns)); \n'
+        '} \n'
+    )
+    vm = build(program, VM(heap='ref'))
+    vm.run()
+    assert capsys.readouterr().out == '142'
+    assert vm.struct_heap == {} and vm.array_heap == {}
+
+def test_ref_heap_compares_by_identity(capsys):
+    program = (
+        'struct P {int x;} \n'
+        'void main() { \n'
+        '  P p1 = new P(1); \n'
+        '  P p2 = new P(1); \n'
+        '  P p3 = p1; \n'
+        '  array int a1 = new int[2]; \n'
+        '  array int a2 = new int[2]; \n'
+        '  print((p1 == p2) or (a1 == a2)); \n'
+        '  print(" "); \n'
+        '  print((p1 == p3) and (p1 != p2) and (a1 != a2) and (p1 != null)); \n'
+        '} \n'
+    )
+    build(program, VM(heap='ref')).run()
+    assert capsys.readouterr().out == 'false true'
+
+def test_ref_heap_compares_cyclic_structs(capsys):
+    program = (
+        'struct N {int x; N next;} \n'
+        'N cycle() { N n = new N(1, null); n.next = n; return n; } \n'
+        'void main() { \n'
+        '  N a = null; \n'
+        '  N b = null; \n'
+        '  for (int i = 0; i < 50; i = i + 1) { a = cycle(); b = cycle(); } \n'
+        '  print((a == b) or (a.next != a)); \n'
+        '} \n'
+    )
+    build(program, VM(heap='ref')).run()
+    build(program, VM(heap='ref', jit=True, jit_threshold=3)).run()
+    assert capsys.readouterr().out == 'falsefalse'
+
+def test_ref_heap_null_field_access():
+    program = (
+        'struct P {int x;} \n'
+        'void main() { \n'
+        '  P p = null; \n'
+        '  int y = p.x; \n'
+        '} \n'
+    )
+    with pytest.raises(MyPLError) as e:
+        build(program, VM(heap='ref')).run()
+    assert str(e.value).startswith('VM Error: bad head index')
+
+def test_ref_heap_needs_table_dispatch():
+    with pytest.raises(MyPLError):
+        VM('switch', heap='ref')
+
+
+#----------------------------------------------------------------------
+# STRUCT FIELD SLOTS
+#----------------------------------------------------------------------
+
+def test_field_names_resolve_to_offsets():
+    program = (
+        'struct A {int x; int y;} \n'
+        'void main() { \n'
+        '  A a = new A(1, 2); \n'
+        '  a.y = a.x; \n'
+        '} \n'
+    )
+    vm = build(program)
+    instrs = vm.frame_templates['main'].instructions
+    fields = [(i.operand, i.comment) for i in instrs if i.opcode in [OpCode.GETF, OpCode.SETF]]
+    assert fields == [(0, 'x'), (1, 'y')]
+
+def test_same_field_name_in_different_structs(capsys):
+    program = (
+        'struct A {int x; B b;} \n'
+        'struct B {array int ys; int x;} \n'
+        'void main() { \n'
+        '  A a = new A(1, new B(new int[3], 2)); \n'
+        '  a.b.ys[1] = 5; \n'
+        '  array A as = new A[1]; \n'
+        '  as[0] = a; \n'
+        '  as[0].b.x = as[0].b.ys[1] + a.x; \n'
+        '  print(itos(a.x) + " " + itos(a.b.x) + " " + itos(as[0].b.ys[1])); \n'
+        '} \n'
+    )
+    build(program).run()
+    assert capsys.readouterr().out == '1 6 5'
+    build(program, VM(heap='ref')).run()
+    assert capsys.readouterr().out == '1 6 5'
+
+def test_field_shadowed_variable_types(capsys):
+    program = (
+        'struct A {int x; int y;} \n'
+        'struct B {int y; int x;} \n'
+        'void main() { \n'
+        '  A v = new A(1, 2); \n'
+        '  if (true) { \n'
+        '    B v = new B(3, 4); \n'
+        '    print(v.x); \n'
+        '  } \n'
+        '  print(v.x); \n'
+        '} \n'
+    )
+    build(program).run()
+    assert capsys.readouterr().out == '41'
+
+def test_struct_built_by_one_instruction(capsys):
+    program = (
+        'struct A {int x; string y; A next;} \n'
+        'void main() { \n'
+        '  A a = new A(1, "b", new A(2, "c", null)); \n'
+        '  print(itos(a.x) + a.y + itos(a.next.x) + a.next.y); \n'
+        '} \n'
+    )
+    vm = build(program)
+    ops = [i.opcode for i in vm.frame_templates['main'].instructions]
+    assert ops.count(OpCode.INITS) == 2
+    assert OpCode.ALLOCS not in ops and OpCode.SETF not in ops
+    vm.run()
+    assert capsys.readouterr().out == '1b2c'
+    build(program, VM(heap='ref')).run()
+    assert capsys.readouterr().out == '1b2c'
+
+
+#----------------------------------------------------------------------
+# PEEPHOLE OPTIMIZER
+#----------------------------------------------------------------------
+
+def test_peephole_fixes_jumps_after_removal():
+    vm = VM()
+    main = VMFrameTemplate('main', 0)
+    main.instructions.append(PUSH(True))
+    main.instructions.append(JMPF(6))
+    main.instructions.append(PUSH('a'))
+    main.instructions.append(WRITE())
+    main.instructions.append(JMP(8))
+    main.instructions.append(JMP(6))
+    main.instructions.append(NOP())
+    main.instructions.append(PUSH('b'))
+    main.instructions.append(NOP())
+    main.instructions.append(PUSH(None))
+    main.instructions.append(RET())
+    vm.add_frame_template(main)
+    optimizer = PeepholeOptimizer()
+    optimizer.optimize(vm)
+    ops = [(i.opcode, i.operand) for i in main.instructions]
+    assert ops == [(OpCode.PUSH, True), (OpCode.JMPF, 5), (OpCode.PUSH, 'a'),
+                   (OpCode.WRITE, None), (OpCode.JMP, 6), (OpCode.PUSH, 'b'),
+                   (OpCode.PUSH, None), (OpCode.RET, None)]
+    assert optimizer.removed['main'] == 3
+
+def test_peephole_rewrites_patterns():
+    vm = VM()
+    main = VMFrameTemplate('main', 0)
+    main.instructions.append(PUSH(1))
+    main.instructions.append(STORE(0))
+    main.instructions.append(LOAD(0))
+    main.instructions.append(STORE(0))
+    main.instructions.append(PUSH(2))
+    main.instructions.append(POP())
+    main.instructions.append(LOAD(0))
+    main.instructions.append(PUSH(2))
+    main.instructions.append(CMPEQ())
+    main.instructions.append(NOT())
+    main.instructions.append(WRITE())
+    vm.add_frame_template(main)
+    PeepholeOptimizer().optimize(vm)
+    ops = [i.opcode for i in main.instructions]
+    assert ops == [OpCode.PUSH, OpCode.STORE, OpCode.LOAD, OpCode.PUSH,
+                   OpCode.CMPNE, OpCode.WRITE]
+
+def test_peephole_keeps_program_output(capsys):
+    program = (
+        'int f(int n) { \n'
+        '  if (n <= 1) { return 1; } \n'
+        '  else { return n * f(n - 1); } \n'
+        '} \n'
+        'void main() { \n'
+        '  int i = 0; \n'
+        '  while (i < 4) { \n'
+        '    if (i != 2) { print(f(i)); } \n'
+        '    i = i + 1; \n'
+        '  } \n'
+        '} \n'
+    )
+    vm = build(program)
+    before = len(vm.frame_templates['f'].instructions)
+    PeepholeOptimizer().optimize(vm)
+    assert len(vm.frame_templates['f'].instructions) < before
+    vm.run()
+    assert capsys.readouterr().out == '116'
+
+
+#----------------------------------------------------------------------
+# CONSTANT FOLDING
+#----------------------------------------------------------------------
+
+def build_folded(program):
+    vm = VM()
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    ast.accept(ConstantFolder())
+    ast.accept(CodeGenerator(vm))
+    return vm
+
+def test_fold_arithmetic_and_comparisons(capsys):
+    program = (
+        'void main() { \n'
+        '  print(itos(2 + 3 * 4) + " " + itos(0 - 7 / 2) + " "); \n'
+        '  print(dtos(1.5 * 2.0) + " " + itos(1 + 2 + stoi("3"))); \n'
+        '  print(" " + "a" + "b\\n"); \n'
+        '  print(not (not (1 < 2)) and 2.0 >= 3.5); \n'
+        '  print(null == null); \n'
+        '} \n'
+    )
+    vm = build_folded(program)
+    ops = [i.opcode for i in vm.frame_templates['main'].instructions]
+    assert OpCode.MUL not in ops and OpCode.DIV not in ops
+    assert OpCode.CMPLT not in ops and OpCode.NOT not in ops
+    assert ops.count(OpCode.ADD) == 6
+    vm.run()
+    assert capsys.readouterr().out == '14 -3 3.0 6 ab\ntruetrue'
+
+def test_fold_keeps_runtime_errors(capsys):
+    program = 'void main() { print(itos(1 + 4 / 0)); }'
+    vm = build_folded(program)
+    with pytest.raises(MyPLError) as e:
+        vm.run()
+    assert str(e.value).startswith('VM Error: Divide by 0')
+    program = 'void main() { int x = 1 + null; }'
+    vm = build_folded(program)
+    with pytest.raises(MyPLError) as e:
+        vm.run()
+    assert str(e.value).startswith('VM Error: null in add')
+
+
+#----------------------------------------------------------------------
+# SHORT CIRCUIT AND/OR
+#----------------------------------------------------------------------
+
+def test_and_or_skip_rest(capsys):
+    program = (
+        'bool f(string s, bool b) { print(s); return b; } \n'
+        'void main() { \n'
+        '  bool x = f("a", false) and f("b", true); \n'
+        '  bool y = f("c", true) or f("d", true); \n'
+        '  bool z = f("e", true) and f("f", false) or f("g", true); \n'
+        '  print(" "); print(x); print(y); print(z); \n'
+        '  array int xs = new int[2]; \n'
+        '  int i = 0; \n'
+        '  while ((i < 2) and (xs[i] == null)) { i = i + 1; } \n'
+        '  print(i); \n'
+        '} \n'
+    )
+    for vm in [VM(), VM('switch'), VM(heap='ref')]:
+        vm = build(program, vm)
+        instrs = vm.frame_templates['main'].instructions
+        # AND/OR only check a right operand for null (with true/false)
+        for i, instr in enumerate(instrs):
+            if instr.opcode in [OpCode.AND, OpCode.OR]:
+                check = instrs[i - 1]
+                assert check.opcode == OpCode.PUSH
+                assert check.operand is (instr.opcode == OpCode.AND)
+        vm.run()
+        assert capsys.readouterr().out == 'acefg falsetruetrue2'
+
+def test_and_or_null_first_operand():
+    program = 'void main() { bool x = null; bool y = x and true; }'
+    with pytest.raises(MyPLError) as e:
+        build(program).run()
+    assert str(e.value).startswith('VM Error: null in and')
+    program = 'void main() { bool x = null; bool y = x or true; }'
+    with pytest.raises(MyPLError) as e:
+        build(program).run()
+    assert str(e.value).startswith('VM Error: null in or')
+
+def test_and_or_null_rest_operand(capsys):
+    for op, first, message in [('and', 'true', 'null in and'),
+                               ('or', 'false', 'null in or')]:
+        program = ('bool f() { return null; } \n'
+                   f'void main() {{ bool x = {first} {op} f(); print(x); }}')
+        for vm in [VM(), VM('switch'), RegisterVM()]:
+            with pytest.raises(MyPLError) as e:
+                build(program, vm).run()
+            assert str(e.value).startswith('VM Error: ' + message)
+        with pytest.raises(MyPLError) as e:
+            mypl_exec(translate(program))
+        assert str(e.value) == 'VM Error: ' + message
+    assert capsys.readouterr().out == ''
+
+
+#----------------------------------------------------------------------
+# TAIL CALLS
+#----------------------------------------------------------------------
+
+def test_tail_calls_reuse_frame(capsys):
+    program = (
+        'int sum(int n, int acc) { \n'
+        '  if (n == 0) { return acc; } \n'
+        '  return sum(n - 1, acc + n); \n'
+        '} \n'
+        'int fac(int n) { \n'
+        '  if (n <= 1) { return 1; } \n'
+        '  return n * fac(n - 1); \n'
+        '} \n'
+        'void count(int n) { \n'
+        '  if (n > 0) { count(n - 1); } \n'
+        '  else { print("done "); } \n'
+        '} \n'
+        'void main() { \n'
+        '  print(itos(sum(10000, 0)) + " " + itos(fac(5)) + " "); \n'
+        '  count(10000); \n'
+        '} \n'
+    )
+    vm = build(program)
+    def ops(name):
+        return [i.opcode for i in vm.frame_templates[name].instructions]
+    assert OpCode.TCALL in ops('sum') and OpCode.CALL not in ops('sum')
+    assert OpCode.TCALL not in ops('fac')
+    assert OpCode.TCALL in ops('count')
+    assert OpCode.TCALL in ops('main')
+    depths = []
+    op_tcall = vm.handlers[OpCode.TCALL]
+    def tcall(frame, operand):
+        depths.append(len(vm.call_stack))
+        return op_tcall(frame, operand)
+    vm.handlers[OpCode.TCALL] = tcall
+    vm.op_table[OpCode.TCALL.value] = tcall
+    vm.run()
+    assert capsys.readouterr().out == '50005000 120 done '
+    assert max(depths) == 2
+
+
+#----------------------------------------------------------------------
+# TYPED OPERATORS
+#----------------------------------------------------------------------
+
+def build_checked(program):
+    vm = VM()
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    ast.accept(SemanticChecker())
+    ast.accept(CodeGenerator(vm))
+    return vm
+
+def test_typed_operators(capsys):
+    program = (
+        'void main() { \n'
+        '  int i = 7; double d = 2.5; string s = "a"; \n'
+        '  print(itos(i + 1) + " " + itos(i - 9) + " " + itos(i * 2)); \n'
+        '  print(" " + itos(0 - i / 2) + " " + dtos(d / 2.0) + " "); \n'
+        '  print(i < 8); print(i >= 8); print(d < 2.0); \n'
+        '  array int xs = new int[1]; \n'
+        '  print(xs == null); \n'
+        '} \n'
+    )
+    vm = build_checked(program)
+    ops = [i.opcode for i in vm.frame_templates['main'].instructions]
+    for op in [OpCode.ADDI, OpCode.SUBI, OpCode.MULI, OpCode.DIVI,
+               OpCode.DIVD, OpCode.ADDS, OpCode.CMPLTI, OpCode.CMPLEI]:
+        assert op in ops
+    assert OpCode.ADD not in ops and OpCode.CMPLE not in ops
+    # doubles compare with the generic opcode
+    assert OpCode.CMPLT in ops
+    vm.run()
+    assert capsys.readouterr().out == '8 -2 14 -3 1.25 truefalsefalsefalse'
+
+def test_typed_operators_null_errors():
+    for op, msg in [('+', 'add'), ('-', 'sub'), ('*', 'mul'), ('/', 'div'),
+                    ('<', 'cmplt'), ('<=', 'cmple')]:
+        program = f'void main() {{ int x = null; int y = 1; print(y {op} x); }}'
+        vm = build_checked(program)
+        with pytest.raises(MyPLError) as e:
+            vm.run()
+        assert str(e.value).startswith(f'VM Error: null in {msg}')
+    program = 'void main() { int x = null; int y = 0; print(x / y); }'
+    with pytest.raises(MyPLError) as e:
+        build_checked(program).run()
+    assert str(e.value).startswith('VM Error: Divide by 0')
+
+
+#----------------------------------------------------------------------
+# QUICKENING
+#----------------------------------------------------------------------
+
+def test_quicken_generic_operators(capsys):
+    program = (
+        'void main() { \n'
+        '  int i = 0; int s = 0; \n'
+        '  while (i < 10) { s = s + i; i = i + 1; } \n'
+        '  print(s); \n'
+        '} \n'
+    )
+    vm = build(program)
+    vm.run()
+    assert capsys.readouterr().out == '45'
+    ops = list(vm.frame_templates['main'].opcodes)
+    assert OpCode.QADDI.value in ops and OpCode.QCMPLTI.value in ops
+    assert OpCode.ADD.value not in ops
+    assert vm.stats()['quickened instructions'] == 3
+    vm = build(program, VM(quicken=False))
+    vm.run()
+    assert capsys.readouterr().out == '45'
+    assert OpCode.ADD.value in vm.frame_templates['main'].opcodes
+    assert 'quickened instructions' not in vm.stats()
+
+def test_quicken_deoptimize(capsys):
+    program = (
+        'string f(string a, string b) { return a + b; } \n'
+        'void main() { \n'
+        '  for (int i = 0; i < 10; i = i + 1) { \n'
+        '    print(f(1, 2)); print(f("a", "b")); \n'
+        '  } \n'
+        '} \n'
+    )
+    vm = build(program)
+    vm.run()
+    assert capsys.readouterr().out == '3ab' * 10
+    assert vm.deoptimized == MAX_DEOPTS
+    # i < 10 and i + 1 in main, and f after each of its deopts
+    assert vm.quickened == 2 + MAX_DEOPTS
+    assert OpCode.ADD.value in vm.frame_templates['f'].opcodes
+
+
+#----------------------------------------------------------------------
+# SUPERINSTRUCTIONS
+#----------------------------------------------------------------------
+
+def test_superinstructions_selected(capsys):
+    program = (
+        'struct N {int v; N next;} \n'
+        'void main() { \n'
+        '  N n = new N(3, null); \n'
+        '  int k = 4; \n'
+        '  for (int i = 0; i < k; i = i + 1) { \n'
+        '    int j = 10; \n'
+        '    while (j <= 12) { j = j + 1; } \n'
+        '    k = k - 1; \n'
+        '    print(itos(i + n.v) + " "); \n'
+        '  } \n'
+        '} \n'
+    )
+    for heap in HEAP_MODES:
+        vm = build(program, VM(heap=heap))
+        optimizer = PeepholeOptimizer()
+        optimizer.optimize(vm)
+        ops = [i.opcode for i in vm.frame_templates['main'].instructions]
+        for op in [OpCode.JNLTVV, OpCode.JNLEVK, OpCode.INCL, OpCode.DECL,
+                   OpCode.LOADGETF]:
+            assert op in ops
+        assert optimizer.fused['main'] == 6
+        vm.run()
+        assert capsys.readouterr().out == '3 4 '
+
+def test_superinstructions_respect_jump_targets():
+    vm = VM()
+    main = VMFrameTemplate('main', 0)
+    main.instructions.append(PUSH(0))
+    main.instructions.append(STORE(0))
+    main.instructions.append(LOAD(0))
+    main.instructions.append(JMP(5))
+    main.instructions.append(LOAD(0))
+    main.instructions.append(PUSH(1))
+    main.instructions.append(ADD())
+    main.instructions.append(STORE(0))
+    main.instructions.append(LOAD(0))
+    main.instructions.append(PUSH(3))
+    main.instructions.append(CMPLT())
+    main.instructions.append(JMPF(14))
+    main.instructions.append(JMP(4))
+    main.instructions.append(NOP())
+    main.instructions.append(PUSH(None))
+    main.instructions.append(RET())
+    vm.add_frame_template(main)
+    PeepholeOptimizer().optimize(vm)
+    ops = [(i.opcode, i.operand) for i in main.instructions]
+    # the jump to offset 5 (the PUSH) keeps the increment unfused
+    assert (OpCode.INCL, (0, 1)) not in ops
+    assert (OpCode.JNLTVK, (0, 3, 10)) in ops
+
+
+#----------------------------------------------------------------------
+# REGISTER IR
+#----------------------------------------------------------------------
+
+def test_register_vm_matches_stack_vm(capsys):
+    program = (
+        'struct Node {int val; Node next;} \n'
+        'int sum(Node n, int acc) { \n'
+        '  if (n == null) { return acc; } \n'
+        '  return sum(n.next, acc + n.val); \n'
+        '} \n'
+        'bool small(int x) { return x < 3; } \n'
+        'void main() { \n'
+        '  Node head = null; \n'
+        '  array int xs = new int[4]; \n'
+        '  for (int i = 0; i < 4; i = i + 1) { \n'
+        '    xs[i] = i * i; \n'
+        '    head = new Node(xs[i], head); \n'
+        '  } \n'
+        '  head.next.val = head.next.val + 10; \n'
+        '  print(itos(sum(head, 0)) + " "); \n'
+        '  int j = 0; \n'
+        '  while (small(j) and (xs[j] < 4) or (j == 10)) { j = j + 1; } \n'
+        '  print(j); print(" " + get(1, "abc") + " "); \n'
+        '  print(not (length("ab") == 2)); \n'
+        '} \n'
+    )
+    build(program).run()
+    expected = capsys.readouterr().out
+    assert expected == '24 2 b false'
+    vm = build(program, RegisterVM())
+    vm.run()
+    assert capsys.readouterr().out == expected
+
+def test_register_vm_fewer_instructions():
+    program = (
+        'int f(int x, int y) { \n'
+        '  int z = x * y + 2; \n'
+        '  return z - (x / y); \n'
+        '} \n'
+        'void main() { print(f(6, 3)); } \n'
+    )
+    vm = build(program, RegisterVM())
+    stack_count = len(vm.frame_templates['f'].instructions)
+    vm.lower()
+    register_count = len(vm.reg_templates['f'].instructions)
+    assert register_count < stack_count / 2
+    # the prologue stores are gone: the arguments arrive in v0 and v1
+    assert str(vm).count('MOV') == 0
+    assert 'v0 = ' not in str(vm).split('Frame main')[0]
+
+def test_register_vm_errors():
+    program = 'void main() { int x = null; print(1 + x); }'
+    with pytest.raises(MyPLError) as e:
+        build(program, RegisterVM()).run()
+    assert str(e.value).startswith('VM Error: null in add')
+    with pytest.raises(MyPLError):
+        RegisterVM(heap='ref')
+
+def test_register_vm_error_location_shows_register_instruction():
+    program = 'struct P {int x;} void main() { P p = null; int i = 2; p.x = i; }'
+    with pytest.raises(MyPLError) as e:
+        build(program, RegisterVM()).run()
+    assert str(e.value) == 'VM Error: bad heap index (in main at 2: SETF v0, 0, v1)'
+    program = 'void main() { int x = null; print(1 + x); }'
+    with pytest.raises(MyPLError) as e:
+        build(program, RegisterVM()).run()
+    assert str(e.value) == 'VM Error: null in add (in main at 1: t0 = ADD 1, v0)'
+
+
+#----------------------------------------------------------------------
+# PYTHON BACKEND
+#----------------------------------------------------------------------
+
+def translate(program):
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    ast.accept(SemanticChecker())
+    generator = PythonGenerator()
+    ast.accept(generator)
+    return generator.source()
+
+def test_python_backend_matches_vm(capsys):
+    program = (
+        'struct Node { int val; Node next; } \n'
+        'int sum(Node n, int total) { \n'
+        '  if (n == null) { return total; } \n'
+        '  return sum(n.next, total + n.val); \n'
+        '} \n'
+        'void main() { \n'
+        '  Node head = null; \n'
+        '  array int xs = new int[4]; \n'
+        '  for (int i = 0; i < 4; i = i + 1) { \n'
+        '    xs[i] = i * i; \n'
+        '    head = new Node(xs[i], head); \n'
+        '  } \n'
+        '  head.next.val = head.next.val + 10; \n'
+        '  print(itos(sum(head, 0)) + " "); \n'
+        '  int x = 1; \n'
+        '  if (true) { int x = 2; print(x); } \n'
+        '  print(x); print(" "); print((0 - 7) / 2); print(" "); \n'
+        '  print(xs == xs); print(xs == new int[4]); print(" "); \n'
+        '  print(not (length("ab") == 2)); int z; print(z); \n'
+        '} \n'
+    )
+    build_checked(program).run()
+    expected = capsys.readouterr().out
+    assert expected == '24 21 -3 truefalse falsenull'
+    source = translate(program)
+    assert 'class S_Node:' in source and 'def f_sum(v_n_0, v_total_0):' in source
+    mypl_exec(source)
+    assert capsys.readouterr().out == expected
+
+def test_python_backend_errors():
+    program = 'void main() { array int xs = new int[2]; print(xs[0 - 1]); }'
+    with pytest.raises(MyPLError) as e:
+        mypl_exec(translate(program))
+    assert str(e.value) == 'VM Error: bad array index'
+    program = 'void main() { int x = null; print(1 + x); }'
+    with pytest.raises(MyPLError) as e:
+        mypl_exec(translate(program))
+    assert str(e.value) == 'VM Error: null in add'
+
+@pytest.mark.skipif(sys.version_info < (3, 11), reason='needs C-stackless calls')
+def test_python_backend_deep_recursion(capsys):
+    program = (
+        'int f(int n) { if (n == 0) { return 0; } return 1 + f(n - 1); } \n'
+        'void main() { print(f(1200000)); } \n'
+    )
+    mypl_exec(translate(program))
+    assert capsys.readouterr().out == '1200000'
+
+def test_python_backend_error_messages_match_vm():
+    programs = [
+        'void main() { double d = null; print(d / 0.0); }',
+        'void main() { int i = null; print(i / 0); }',
+        'struct P {int x;} void main() { P p = null; p.x = 1; }',
+        'struct P {int x;} void main() { P p = null; print(p.x); }',
+    ]
+    for program in programs:
+        with pytest.raises(MyPLError) as expected:
+            build_checked(program).run()
+        with pytest.raises(MyPLError) as e:
+            mypl_exec(translate(program))
+        assert str(expected.value).startswith(str(e.value) + ' (')
+
+def test_python_backend_deep_and_non_finite_programs(capsys):
+    big = '1' + '0' * 300 + '.0'
+    program = (
+        'void main() { \n'
+        f'  print({"(" * 5000}1{")" * 5000}); print(" "); \n'
+        f'  print({big} * {big}); print(" "); \n'
+        f'  print(({big} * {big}) - ({big} * {big})); \n'
+        '} \n'
+    )
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    ast.accept(SemanticChecker())
+    ast.accept(ConstantFolder())
+    generator = PythonGenerator()
+    ast.accept(generator)
+    mypl_exec(generator.source())
+    assert capsys.readouterr().out == '1 inf nan'
+    # Python cannot compile blocks (or parentheses) nested this deeply
+    ifs = 'void main() { ' + 'if (true) { ' * 3000 + '} ' * 3000 + '}'
+    terms = 'void main() { print(' + ' + '.join(['1'] * 300) + '); }'
+    for program in [ifs, terms]:
+        ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+        generator = PythonGenerator()
+        ast.accept(generator)
+        assert generator.too_deep
+        with pytest.raises(MyPLError) as e:
+            generator.source()
+        assert str(e.value).startswith('Translation Error: ')
+
+def test_python_backend_runs_long_elseif_chain_on_vm(capsys):
+    from mypl import run_python_mode
+    # each Python elif nests in the one before it
+    branches = ' '.join(f'elseif (x == {i}) {{ print({i}); }}' for i in range(1, 5000))
+    program = ('void main() { int x = 4999; \n'
+               f'  if (x == 0) {{ print(0); }} {branches} \n'
+               '  else { print("none"); } \n'
+               '} \n')
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    generator = PythonGenerator()
+    ast.accept(generator)
+    assert generator.too_deep
+    run_python_mode(FileWrapper(io.StringIO(program)))
+    assert capsys.readouterr().out == '4999'
+    # the Python compiler's own limits are also caught
+    for count in [5000, 10000]:
+        with pytest.raises(MyPLError) as e:
+            mypl_compile('if x: pass\n' + 'elif x: pass\n' * count)
+        assert str(e.value).startswith('Translation Error: ')
+
+
+#----------------------------------------------------------------------
+# TIERED JIT
+#----------------------------------------------------------------------
+
+def build_jit(program, threshold, osr_threshold=JIT_OSR_THRESHOLD):
+    vm = VM(jit=True, jit_threshold=threshold, osr_threshold=osr_threshold)
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    ast.accept(SemanticChecker())
+    ast.accept(CodeGenerator(vm))
+    return vm
+
+def test_jit_matches_interpreter(capsys):
+    program = (
+        'struct P { int x; P next; } \n'
+        'int fib(int n) { if (n <= 1) { return n; } \n'
+        '  return fib(n - 2) + fib(n - 1); } \n'
+        'P push(P p, int x) { return new P(x, p); } \n'
+        'int count(int n, int acc) { if (n == 0) { return acc; } \n'
+        '  return count(n - 1, acc + 1); } \n'
+        'void main() { \n'
+        '  P p = null; \n'
+        '  for (int i = 0; i < 5; i = i + 1) { p = push(p, fib(i + 10)); } \n'
+        '  print(itos(p.x) + " " + itos(p.next.x) + " "); \n'
+        '  print(count(5000, 0)); \n'
+        '} \n'
+    )
+    build_checked(program).run()
+    expected = capsys.readouterr().out
+    assert expected == '377 233 5000'
+    vm = build_jit(program, 3)
+    vm.run()
+    assert capsys.readouterr().out == expected
+    for name in ['fib', 'push', 'count']:
+        assert vm.frame_templates[name].native is not None
+    assert vm.frame_templates['main'].native is None
+    assert vm.jit.stats()['jit fib'].startswith('tier-up at call 3 ')
+
+def test_jit_deep_recursion_runs_in_interpreter_frames(capsys):
+    program = (
+        'int f(int n) { if (n == 0) { return 0; } return 1 + g(n - 1); } \n'
+        'int g(int n) { if (n == 0) { return 0; } return 1 + f(n - 1); } \n'
+        'int h(int n) { if (n == 0) { return 0; } return 1 + h(n - 1); } \n'
+        'void main() { print(itos(f(200000)) + " " + itos(h(200000))); } \n'
+    )
+    vm = build_jit(program, 3)
+    vm.run()
+    assert capsys.readouterr().out == '200000 200000'
+    assert vm.frame_templates['f'].native is not None
+    assert vm.frame_templates['h'].native is not None
+    assert vm.native_depth == 0
+
+def test_jit_deopt_reports_interpreter_error(capsys):
+    program = (
+        'int add(int x, int y) { int z = x + 1; return z + y; } \n'
+        'void main() { \n'
+        '  for (int i = 0; i < 5; i = i + 1) { print(add(i, i)); } \n'
+        '  print(add(1, null)); \n'
+        '} \n'
+    )
+    with pytest.raises(MyPLError) as expected:
+        build_checked(program).run()
+    vm = build_jit(program, 2)
+    with pytest.raises(MyPLError) as e:
+        vm.run()
+    assert str(e.value) == str(expected.value)
+    assert 'null in add' in str(e.value)
+    assert capsys.readouterr().out == '13579' * 2
+    assert vm.jit.profiles['add'].deopts == 1
+
+def test_jit_osr_enters_hot_loop_in_main(capsys):
+    program = (
+        'int sq(int x) { return x * x; } \n'
+        'void main() { \n'
+        '  int total = 0; \n'
+        '  for (int i = 0; i < 50; i = i + 1) { \n'
+        '    string s = itos(i); \n'
+        '    while (length(s) < 3) { s = "0" + s; } \n'
+        '    total = total + sq(i); \n'
+        '    if (i == 49) { print(s + " "); } \n'
+        '  } \n'
+        '  print(total); \n'
+        '} \n'
+    )
+    build_checked(program).run()
+    expected = capsys.readouterr().out
+    assert expected == '049 40425'
+    vm = build_jit(program, 1000, 10)
+    vm.run()
+    assert capsys.readouterr().out == expected
+    assert vm.frame_templates['main'].native is None
+    assert len(vm.frame_templates['main'].osr) == 1
+    assert 'OSR into loop' in vm.jit.stats()['jit main']
+
+def test_jit_osr_deopt_reports_interpreter_error(capsys):
+    program = (
+        'struct N { int v; N next; } \n'
+        'void main() { \n'
+        '  N n = null; \n'
+        '  for (int i = 0; i < 20; i = i + 1) { n = new N(i, n); } \n'
+        '  while (true) { print(n.v); n = n.next; } \n'
+        '} \n'
+    )
+    with pytest.raises(MyPLError) as expected:
+        build_checked(program).run()
+    expected_out = capsys.readouterr().out
+    vm = build_jit(program, 1000, 5)
+    with pytest.raises(MyPLError) as e:
+        vm.run()
+    assert str(e.value) == str(expected.value)
+    assert capsys.readouterr().out == expected_out
+    assert vm.jit.profiles['main'].deopts == 1
+
+
+#----------------------------------------------------------------------
+# COMPILED BYTECODE FILES
+#----------------------------------------------------------------------
+
+def test_bytecode_file_round_trip(capsys, tmp_path):
+    program = (
+        'struct P { double x; P next; } \n'
+        'int big() { return 123456789012345678901234567890 * 10; } \n'
+        'void main() { \n'
+        '  P p = new P(1.5, null); \n'
+        '  for (int i = 0; i < 30; i = i + 1) { p = new P(p.x * 2.0, p); } \n'
+        '  print(dtos(p.x) + " " + itos(big()) + " ünï\\n"); \n'
+        '} \n'
+    )
+    vm = build_checked(program)
+    PeepholeOptimizer().optimize(vm)
+    filename = str(tmp_path / 'p.myplc')
+    save_bytecode(vm, filename, FLAG_OPTIMIZED | FLAG_FUSED)
+    vm.run()
+    expected = capsys.readouterr().out
+    assert expected == '1610612736.0 1234567890123456789012345678900 ünï\n'
+    loaded = VM()
+    assert load_bytecode(filename, loaded) == FLAG_OPTIMIZED | FLAG_FUSED
+    assert str(loaded) == str(vm)
+    loaded.run()
+    assert capsys.readouterr().out == expected
+    # quickening rewrote the mapped opcodes, but not the file
+    again = VM(quicken=False)
+    load_bytecode(filename, again)
+    assert str(again) == str(vm)
+
+def test_constant_pools_keep_negative_zero(capsys, tmp_path):
+    program = ('void main() { print(0.0); print(" "); \n'
+               '  print(0.0 * (0.0 - 1.0)); print(" "); print(0.0); }')
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    ast.accept(SemanticChecker())
+    ast.accept(ConstantFolder())
+    vm = VM()
+    ast.accept(CodeGenerator(vm))
+    filename = str(tmp_path / 'p.myplc')
+    save_bytecode(vm, filename)
+    vm.run()
+    loaded = VM()
+    load_bytecode(filename, loaded)
+    loaded.run()
+    assert capsys.readouterr().out == '0.0 -0.0 0.0' * 2
+
+def test_bytecode_file_errors(tmp_path):
+    vm = build_checked('void main() { print("hi"); }')
+    filename = str(tmp_path / 'p.myplc')
+    save_bytecode(vm, filename)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    for bad, message in [(b'XXXX' + data[4:], 'not a compiled MyPL file'),
+                         (data[:-1] + b'!', 'bad checksum'),
+                         (data[:4] + b'\x63' + data[5:], 'different version')]:
+        with open(filename, 'wb') as f:
+            f.write(bad)
+        with pytest.raises(MyPLError) as e:
+            load_bytecode(filename, VM())
+        assert str(e.value).startswith('Bytecode Error: ')
+        assert message in str(e.value)
+
+def test_bytecode_file_bad_opcode(tmp_path):
+    vm = build_checked('void main() { print("hi"); }')
+    instrs = vm.frame_templates['main'].instructions
+    data = bytearray(BytecodeWriter().write(vm.frame_templates, 0))
+    opcodes = bytes(instr.opcode.value for instr in instrs)
+    data[data.rfind(opcodes)] = 255
+    # (a valid checksum, so only the opcode check can catch it)
+    data[HEADER.size - 4:HEADER.size] = U32.pack(zlib.crc32(data[HEADER.size:]))
+    filename = str(tmp_path / 'p.myplc')
+    with open(filename, 'wb') as f:
+        f.write(data)
+    with pytest.raises(MyPLError) as e:
+        load_bytecode(filename, VM())
+    assert str(e.value) == 'Bytecode Error: bad opcode in function main'
+
+
+#----------------------------------------------------------------------
+# COMPILE CACHE
+#----------------------------------------------------------------------
+
+def test_compile_cache_hit_and_miss(capsys, tmp_path):
+    cache = CompileCache(str(tmp_path / 'cache'))
+    source = b'void main() { for (int i = 0; i < 3; i = i + 1) { print(i); } }'
+    key = cache.key(source)
+    assert key != cache.key(source, optimize=False)
+    assert key != cache.key(source, typed=False)
+    assert key != cache.key(source + b' ')
+    assert cache.load(key, VM()) is None
+    vm = build_checked(source.decode())
+    PeepholeOptimizer().optimize(vm)
+    cache.store(key, vm, FLAG_OPTIMIZED | FLAG_FUSED)
+    loaded = VM()
+    assert cache.load(key, loaded) == FLAG_OPTIMIZED | FLAG_FUSED
+    loaded.run()
+    assert capsys.readouterr().out == '012'
+    # damaged entries are misses (and are compiled and stored again)
+    with open(cache.path(key), 'r+b') as f:
+        f.seek(30)
+        f.write(b'!!')
+    assert cache.load(key, VM()) is None
+    stats = cache.stats()
+    assert (stats['cache hits'], stats['cache misses'], stats['cache errors']) == (1, 2, 1)
+    assert CompileCache(str(tmp_path / 'cache')).totals() == [1, 2, 0]
+
+def test_compile_cache_evicts_least_recently_used(tmp_path):
+    cache = CompileCache(str(tmp_path))
+    keys = []
+    for i in range(4):
+        vm = build_checked(f'void main() {{ print({i}); }}')
+        keys.append(cache.key(str(i).encode()))
+        cache.store(keys[-1], vm, 0)
+        os.utime(cache.path(keys[-1]), (i, i))
+    size = os.path.getsize(cache.path(keys[0]))
+    cache.max_bytes = 4 * size
+    cache.load(keys[0], VM())
+    cache.store(cache.key(b'new'), build_checked('void main() {}'), 0)
+    assert [os.path.exists(cache.path(key)) for key in keys] == [True, False, True, True]
+    assert cache.evictions == 1
+
+def test_compile_cache_totals_from_concurrent_runs(tmp_path):
+    def lookups(n):
+        cache = CompileCache(str(tmp_path))
+        for i in range(n):
+            cache.update_totals(i % 2 == 0)
+    runs = [multiprocessing.get_context('fork').Process(target=lookups, args=(100,))
+            for _ in range(4)]
+    for run in runs:
+        run.start()
+    for run in runs:
+        run.join()
+    cache = CompileCache(str(tmp_path))
+    assert cache.totals() == [200, 200, 0]
+    cache.update_totals(None, 0)
+    assert sorted(os.listdir(tmp_path)) == [STATS_FILE]
+
+
+#----------------------------------------------------------------------
+# INPUT WRAPPERS
+#----------------------------------------------------------------------
+
+def test_file_wrapper_reads_mapped_file(tmp_path):
+    path = tmp_path / 'p.mypl'
+    path.write_bytes('int x = 1; // ünï\r\nstring s = "é";\r\n'.encode('utf-8'))
+    in_stream = FileWrapper(open(path, 'r', encoding='utf-8'))
+    assert in_stream.peek_char() == 'i' and in_stream.read_char() == 'i'
+    lexer = Lexer(in_stream)
+    tokens = []
+    while (token := lexer.next_token()).token_type != TokenType.EOS:
+        tokens.append((token.lexeme, token.line))
+    assert tokens[-3:] == [('=', 2), ('é', 2), (';', 2)]
+    assert in_stream.read_char() == '' and in_stream.peek_char() == ''
+    in_stream.close()
+    empty = tmp_path / 'empty.mypl'
+    empty.write_bytes(b'')
+    assert FileWrapper(open(empty, 'r', encoding='utf-8')).peek_char() == ''
+
+def test_stdin_wrapper_decodes_across_chunks():
+    text = 'void main() { print("ünï €𝄞"); }\n'
+    for chunk_size in [1, 2, 3, 1024]:
+        stdin = io.TextIOWrapper(io.BytesIO(text.encode('utf-8')))
+        in_stream = StdInWrapper(stdin, chunk_size)
+        chars = []
+        while in_stream.peek_char() != '':
+            chars.append(in_stream.read_char())
+        assert ''.join(chars) == text
+        assert in_stream.read_char() == ''
+
+
+#----------------------------------------------------------------------
+# BULK TOKENIZER
+#----------------------------------------------------------------------
+
+def next_tokens(program):
+    lexer = Lexer(FileWrapper(io.StringIO(program)))
+    tokens = [lexer.next_token()]
+    while tokens[-1].token_type != TokenType.EOS:
+        tokens.append(lexer.next_token())
+    return tokens
+
+def test_tokenize_matches_next_token():
+    program = (
+        'struct S { int x_1; } // note: ünï \n'
+        '\tbool f(double d) { return d >= 1.5 and not (d != 2.0); }\n'
+        'void main() {\r\n  string s = "a // b"; x.y[0] = 10 <= 3 == true;\n'
+        '  int café = 1..5; x²=0; \n'
+        '}  \n\n'
+    )
+    tokens = Lexer(FileWrapper(io.StringIO(program))).tokenize()
+    assert tokens == next_tokens(program)
+    assert tokens[-1] == Token(TokenType.EOS, '', 8, 1)
+    assert Token(TokenType.ID, 'café', 5, 7) in tokens
+    assert Token(TokenType.COMMENT, ' note: ünï ', 1, 23) in tokens
+    lexer = Lexer(FileWrapper(io.StringIO(program)))
+    first = lexer.next_token()
+    assert [first] + lexer.tokenize() == tokens
+
+def test_tokens_raise_errors_in_order():
+    program = 'void main() { int x = 01; }'
+    with pytest.raises(MyPLError) as e:
+        Lexer(FileWrapper(io.StringIO(program))).tokenize()
+    assert str(e.value).startswith('Lexer Error: ')
+    lexer = Lexer(FileWrapper(io.StringIO(program)))
+    tokens = lexer.tokens()
+    assert [next(tokens).lexeme for _ in range(7)] == ['void', 'main', '(', ')', '{', 'int', 'x']
+    # a syntax error before a lexer error is still the one reported
+    program = 'void main() { int x = ; x = 1 ? 2; }'
+    with pytest.raises(MyPLError) as e:
+        ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    assert str(e.value).startswith('Parser Error: ')
+
+def test_token_buffer_slices_lexemes_from_source():
+    program = 'void main() { string s = "hi"; // end\n  int é = 10; }'
+    buffer = Lexer(FileWrapper(io.StringIO(program))).token_buffer()
+    assert [buffer.token(i) for i in range(len(buffer))] == next_tokens(program)
+    assert buffer.types.itemsize == 1 and buffer.starts.typecode == 'I'
+    # lexemes are stored as offsets into the source (without quotes)
+    i = [buffer.lexeme(i) for i in range(len(buffer))].index('hi')
+    assert program[buffer.starts[i] - 1:buffer.ends[i] + 1] == '"hi"'
+    assert buffer.token_type(len(buffer) - 1) == TokenType.EOS
+    assert buffer.next_token().lexeme == 'void'
+
+def test_token_buffer_defers_lexer_errors():
+    program = 'void main() { int x = 1 ! 2; }'
+    buffer = Lexer(FileWrapper(io.StringIO(program))).token_buffer()
+    assert [buffer.next_token().lexeme for _ in range(9)][-1] == '1'
+    with pytest.raises(MyPLError) as e:
+        buffer.next_token()
+    assert str(e.value).startswith('Lexer Error: ')
+    # the parser reads tokens from the buffer
+    program = 'void main() { int ü = 1; print(ü); }'
+    lexer = Lexer(FileWrapper(io.StringIO(program)))
+    ASTParser(lexer).parse()
+    assert (lexer.line, lexer.column) == (1, len(program) + 1)
+
+def test_precedence_parsing(capsys):
+    program = ('void main() { print(2 + 3 * 4 - 1 - 1); print(" "); '
+               'print(10 - 4 - 3); print(" "); print(not false and false); '
+               'print(" "); print((1 + 2) * 3 == 9 or 1 / 0 < 1); }')
+    vm = VM()
+    lexer = Lexer(FileWrapper(io.StringIO(program)))
+    ASTParser(lexer, precedence=True).parse().accept(CodeGenerator(vm))
+    vm.run()
+    assert capsys.readouterr().out == '12 3 false true'
+    # without precedence, operators still group to the right
+    build(program).run()
+    assert capsys.readouterr().out.startswith('14 9 true')
+
+def test_precedence_balances_and_or_chains():
+    def depth(expr):
+        first = expr.first
+        first_depth = depth(first.expr) if isinstance(first, ComplexTerm) else 0
+        rest_depth = depth(expr.rest) if expr.rest is not None else 0
+        return 1 + max(first_depth, rest_depth)
+    chain = ' and '.join(['x < 1'] * 64)
+    program = f'void main() {{ int x = 0; bool b = {chain}; }}'
+    for precedence, expected in [(True, 8), (False, 128)]:
+        lexer = Lexer(FileWrapper(io.StringIO(program)))
+        ast = ASTParser(lexer, precedence).parse()
+        assert depth(ast.fun_defs[0].stmts[1].expr) == expected
+
+def test_programs_nested_past_the_recursion_limit(capsys):
+    n = 2 * sys.getrecursionlimit()
+    program = ('void main() { int x = 0; '
+               + 'while (x < 1) { ' * n + 'x = x + 1;' + ' }' * n
+               + ' if (x == 0) { print(0); }'
+               + ''.join(f' elseif (x == {i}) {{ print({i}); }}' for i in range(1, n))
+               + ' print(" "); print(' + '(x + ' * n + '1' + ')' * n + '); }')
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    ast.accept(SemanticChecker())
+    ast.accept(ConstantFolder())
+    vm = VM()
+    ast.accept(CodeGenerator(vm))
+    vm.run()
+    assert capsys.readouterr().out == f'1 {n + 1}'
+
+def test_walk_visits_children_in_order():
+    class LiteralLister(Visitor):
+        def __init__(self):
+            self.lexemes = []
+        def visit_expr(self, expr):
+            yield expr.first
+            if expr.rest is not None:
+                yield expr.rest
+        def visit_simple_term(self, simple_term):
+            yield simple_term.rvalue
+        def visit_complex_term(self, complex_term):
+            yield complex_term.expr
+        def visit_simple_rvalue(self, simple_rvalue):
+            self.lexemes.append(simple_rvalue.value.lexeme)
+    program = 'void main() { int x = 1 + (2 * (3 - 4)) / 5; }'
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    visitor = LiteralLister()
+    walk(visitor, ast.fun_defs[0].stmts[0].expr)
+    assert visitor.lexemes == ['1', '2', '3', '4', '5']
+
+def test_ast_nodes_and_tokens_are_compact():
+    program = '\n' * 300 + 'void main() { int count_1 = 1; count_1 = count_1 + 1000; }'
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    decl, assign = ast.fun_defs[0].stmts
+    # slotted nodes and tokens (no per-instance dictionaries)
+    for obj in [ast, decl, decl.var_def, assign.expr, assign.expr.first, decl.var_def.var_name]:
+        assert not hasattr(obj, '__dict__')
+    # one string per name, and one line number per line
+    decl_name = decl.var_def.var_name
+    use_name = assign.expr.first.rvalue.path[0].var_name
+    assert use_name.lexeme is decl_name.lexeme
+    assert use_name.line is decl_name.line and decl_name.line == 301
+
+def test_file_wrapper_read_rest_releases_text():
+    in_stream = FileWrapper(io.StringIO('void main() { print("hi"); }'))
+    lexer = Lexer(in_stream)
+    assert lexer.next_token().lexeme == 'void'
+    buffer = lexer.token_buffer()
+    assert in_stream.text == '' and in_stream.read_char() == ''
+    assert [buffer.next_token().lexeme for _ in range(3)] == ['main', '(', ')']
@@ -19,8 +19,34 @@ from mypl_simple_parser import SimpleParser
 from mypl_ast_parser import ASTParser
 from mypl_printer import PrintVisitor
 from mypl_semantic_checker import SemanticChecker
+from mypl_const_folder import ConstantFolder
 from mypl_code_gen import CodeGenerator
-from mypl_vm import VM
+from mypl_optimizer import PeepholeOptimizer
+from mypl_vm import VM, DISPATCH_MODES, HEAP_MODES, GC_THRESHOLD
+from mypl_jit import JIT_THRESHOLD, JIT_OSR_THRESHOLD
+from mypl_register import RegisterVM
+from mypl_py_gen import PythonGenerator
+from mypl_py_runtime import mypl_compile, mypl_exec
+from mypl_bytecode import (save_bytecode, load_bytecode, FLAG_OPTIMIZED,
+                           FLAG_FUSED)
+from mypl_cache import CompileCache
+
+BACKENDS = ['vm', 'python']
+
+# file name extensions of mypl programs and of compiled programs
+SOURCE_EXT = '.mypl'
+BYTECODE_EXT = '.myplc'
+
+
+def print_stats(stats):
+    """Prints name: value statistics lines to standard error.
+
+    Args:
+        stats -- Dictionary of statistic names to values.
+
+    """
+    for name, value in stats.items():
+        print(f'{name}: {value}', file=sys.stderr)
 
 
 def run_lex_mode(in_stream):
@@ -33,11 +59,8 @@ def run_lex_mode(in_stream):
     """
     try: 
         lexer = Lexer(in_stream)
-        t = lexer.next_token()
-        while t.token_type != TokenType.EOS:
+        for t in lexer.tokens():
             print(t)
-            t = lexer.next_token()
-        print(t)
     except MyPLError as ex:
         print(ex)
         exit(1)
@@ -63,17 +86,18 @@ def run_parse_mode(in_stream):
 
     
     
-def run_print_mode(in_stream):
+def run_print_mode(in_stream, precedence=False):
     """Runs the pretty printer on the given mypl program and prints to
     standard output a formatted version of the program.
 
     Args: 
         in_stream -- A wrapped input stream containing a mypl program.
+        precedence -- If true, parse expressions with operator precedence.
 
     """
     try: 
         lexer = Lexer(in_stream)
-        parser = ASTParser(lexer)
+        parser = ASTParser(lexer, precedence)
         ast = parser.parse()
         visitor = PrintVisitor()
         ast.accept(visitor)
@@ -83,18 +107,19 @@ def run_print_mode(in_stream):
 
         
     
-def run_check_mode(in_stream):
+def run_check_mode(in_stream, precedence=False):
     """Runs the semantic checker on the given mypl program any prints any
     semantic errors it finds. If no errors, the mypl program is
     considered semantically well formed.
 
     Args: 
         in_stream -- A wrapped input stream containing a mypl program.
+        precedence -- If true, parse expressions with operator precedence.
 
     """
     try: 
         lexer = Lexer(in_stream)
-        parser = ASTParser(lexer)
+        parser = ASTParser(lexer, precedence)
         ast = parser.parse()
         visitor = SemanticChecker()
         ast.accept(visitor)
@@ -105,54 +130,231 @@ def run_check_mode(in_stream):
 
 
     
-def run_ir_mode(in_stream):
+def run_ir_mode(in_stream, optimize=True, register=False, backend='vm',
+                precedence=False):
     """Generates the intermediate representation (VM instructions) for the
     given mypl program and prints to standard output the resulting
     instructions.
 
     Args: 
         in_stream -- A wrapped input stream containing a mypl program.
+        optimize -- If true, print the optimized (constant folded and
+            peephole-optimized) instructions.
+        register -- If true, print the register form of the instructions.
+        backend -- The code generator ('vm', or 'python' to print the
+            generated Python module instead).
+        precedence -- If true, parse expressions with operator precedence.
 
     """
     try: 
         lexer = Lexer(in_stream)
-        parser = ASTParser(lexer)
+        parser = ASTParser(lexer, precedence)
         ast = parser.parse()
         visitor = SemanticChecker()
         ast.accept(visitor)
-        vm = VM()
+        if optimize:
+            ast.accept(ConstantFolder())
+        if backend == 'python':
+            generator = PythonGenerator()
+            ast.accept(generator)
+            print(generator.source(), end='')
+            return
+        vm = RegisterVM() if register else VM()
         codegen = CodeGenerator(vm)
         ast.accept(codegen)
+        if optimize:
+            PeepholeOptimizer(fuse=not register).optimize(vm)
         print(vm)
     except MyPLError as ex:
         print(ex)
         exit(1)
 
     
-def run_normal_mode(in_stream):
+def run_normal_mode(in_stream, dispatch='table', gc_threshold=GC_THRESHOLD,
+                    heap='oid', stats=False, optimize=True, quicken=True,
+                    register=False, jit=False, jit_threshold=JIT_THRESHOLD,
+                    osr_threshold=JIT_OSR_THRESHOLD, cache=None, source=None,
+                    precedence=False):
     """Executes the given mypl program. Any output produced by the program
     is printed to standard output. 
 
     Args: 
         in_stream -- A wrapped input stream containing a mypl program.
+        dispatch -- The VM instruction dispatch mode ('table' or 'switch').
+        gc_threshold -- Heap allocations between garbage collections.
+        heap -- The VM heap mode ('oid' or 'ref').
+        stats -- If true, print VM statistics to standard error.
+        optimize -- If true, fold constants and run the peephole optimizer
+            before executing.
+        quicken -- If true, let the VM quicken generic operators.
+        register -- If true, run the register form of the instructions.
+        jit -- If true, compile frequently called functions to Python.
+        jit_threshold -- Number of calls before a function is compiled.
+        osr_threshold -- Number of loop iterations before a running loop
+            is compiled.
+        cache -- If given, a CompileCache to look up (and store) the
+            generated code in, keyed by source.
+        source -- The program source (bytes) when using a cache.
+        precedence -- If true, parse expressions with operator precedence.
+
+    """
+    try: 
+        if register:
+            vm = RegisterVM(dispatch, gc_threshold, heap)
+        else:
+            vm = VM(dispatch, gc_threshold, heap, quicken, jit, jit_threshold,
+                    osr_threshold)
+        # the switch loop is the original VM: it runs the generic,
+        # unfused instructions it was written for (typed and fused ones
+        # are tested at the end of its chain)
+        typed = dispatch == 'table'
+        folder = ConstantFolder()
+        optimizer = PeepholeOptimizer(fuse=typed and not register)
+        cached = False
+        if cache is not None:
+            key = cache.key(source, optimize, register, precedence, typed)
+            cached = cache.load(key, vm) is not None
+        if not cached:
+            lexer = Lexer(in_stream)
+            parser = ASTParser(lexer, precedence)
+            ast = parser.parse()
+            visitor = SemanticChecker()
+            ast.accept(visitor)
+            if optimize:
+                ast.accept(folder)
+            codegen = CodeGenerator(vm, typed)
+            ast.accept(codegen)
+            flags = 0
+            if optimize:
+                optimizer.optimize(vm)
+                flags = FLAG_OPTIMIZED | FLAG_FUSED if optimizer.fuse else FLAG_OPTIMIZED
+            if cache is not None:
+                cache.store(key, vm, flags)
+            # free the AST (and the tokens and source text it came from)
+            # before running
+            del lexer, parser, ast, visitor, codegen
+        vm.run()
+        if stats:
+            if not cached:
+                print_stats(folder.stats())
+                print_stats(optimizer.stats())
+            if cache is not None:
+                print_stats(cache.stats())
+            print_stats(vm.stats())
+    except MyPLError as ex:
+        print(ex)
+        exit(1)
+
+
+
+def run_compile_mode(in_stream, out_filename, optimize=True, register=False,
+                     precedence=False):
+    """Generates the VM instructions for the given mypl program and writes
+    them to a compiled (.myplc) file.
+
+    Args: 
+        in_stream -- A wrapped input stream containing a mypl program.
+        out_filename -- The compiled file to write.
+        optimize -- If true, fold constants and run the peephole optimizer.
+        register -- If true, leave out superinstructions so that the file
+            can be run with --register.
+        precedence -- If true, parse expressions with operator precedence.
 
     """
     try: 
         lexer = Lexer(in_stream)
-        parser = ASTParser(lexer)
+        parser = ASTParser(lexer, precedence)
         ast = parser.parse()
         visitor = SemanticChecker()
         ast.accept(visitor)
+        if optimize:
+            ast.accept(ConstantFolder())
         vm = VM()
         codegen = CodeGenerator(vm)
         ast.accept(codegen)
+        flags = 0
+        if optimize:
+            PeepholeOptimizer(fuse=not register).optimize(vm)
+            flags = FLAG_OPTIMIZED if register else FLAG_OPTIMIZED | FLAG_FUSED
+        save_bytecode(vm, out_filename, flags)
+    except MyPLError as ex:
+        print(ex)
+        exit(1)
+
+
+def run_bytecode_mode(filename, dispatch='table', gc_threshold=GC_THRESHOLD,
+                      heap='oid', stats=False, quicken=True, register=False,
+                      jit=False, jit_threshold=JIT_THRESHOLD,
+                      osr_threshold=JIT_OSR_THRESHOLD):
+    """Executes a compiled (.myplc) mypl program. Any output produced by
+    the program is printed to standard output. 
+
+    Args: 
+        filename -- The compiled file.
+        (the remaining arguments are as for run_normal_mode)
+
+    """
+    try: 
+        if register:
+            vm = RegisterVM(dispatch, gc_threshold, heap)
+        else:
+            vm = VM(dispatch, gc_threshold, heap, quicken, jit, jit_threshold,
+                    osr_threshold)
+        flags = load_bytecode(filename, vm)
+        if register and flags & FLAG_FUSED:
+            print(f"ERROR: '{filename}' has superinstructions, "
+                  'compile it with --register to run it with --register')
+            exit(1)
         vm.run()
+        if stats:
+            print_stats(vm.stats())
+    except MyPLError as ex:
+        print(ex)
+        exit(1)
+
+
+def run_python_mode(in_stream, optimize=True, precedence=False):
+    """Translates the given mypl program to Python and runs it (on the VM
+    if it nests too deeply for Python). Any output produced by the
+    program is printed to standard output.
+
+    Args: 
+        in_stream -- A wrapped input stream containing a mypl program.
+        optimize -- If true, fold constants before translating.
+        precedence -- If true, parse expressions with operator precedence.
+
+    """
+    try: 
+        lexer = Lexer(in_stream)
+        parser = ASTParser(lexer, precedence)
+        ast = parser.parse()
+        visitor = SemanticChecker()
+        ast.accept(visitor)
+        if optimize:
+            ast.accept(ConstantFolder())
+        generator = PythonGenerator()
+        ast.accept(generator)
+        try:
+            program = mypl_compile(generator.source())
+        except MyPLError:
+            program = None
+        if program is None:
+            # Python cannot compile the translation: run on the VM instead
+            vm = VM()
+            ast.accept(CodeGenerator(vm))
+            if optimize:
+                PeepholeOptimizer().optimize(vm)
+            del lexer, parser, ast, visitor, generator
+            vm.run()
+            return
+        # free the AST before running
+        del lexer, parser, ast, visitor, generator
+        mypl_exec(program)
     except MyPLError as ex:
         print(ex)
         exit(1)
 
 
-    
 if __name__ == '__main__':
     # initial help/usage info
     about = ('Run the mypl interpreter.\n'
@@ -171,9 +373,56 @@ if __name__ == '__main__':
     group.add_argument('--check', action='store_true', help=help_msg)
     help_msg = 'displays intermediate code'
     group.add_argument('--ir', action='store_true', help=help_msg)
-    help_msg = 'mypl program file (optional)'
+    help_msg = f'writes the compiled program to a {BYTECODE_EXT} file'
+    group.add_argument('--compile', action='store_true', help=help_msg)
+    help_msg = 'VM instruction dispatch (default: table)'
+    argparser.add_argument('--dispatch', choices=DISPATCH_MODES,
+                           default='table', help=help_msg)
+    help_msg = f'allocations between garbage collections, 0 to disable (default: {GC_THRESHOLD})'
+    argparser.add_argument('--gc-threshold', type=int, default=GC_THRESHOLD,
+                           help=help_msg)
+    help_msg = 'VM struct and array representation (default: oid)'
+    argparser.add_argument('--heap', choices=HEAP_MODES, default='oid',
+                           help=help_msg)
+    help_msg = 'print runtime statistics to standard error'
+    argparser.add_argument('--stats', action='store_true', help=help_msg)
+    help_msg = 'do not fold constants or run the peephole optimizer'
+    argparser.add_argument('--no-opt', action='store_true', help=help_msg)
+    help_msg = 'do not rewrite generic operators into quickened ones'
+    argparser.add_argument('--no-quicken', action='store_true', help=help_msg)
+    help_msg = 'run (or with --ir, print) the register-based form of the code'
+    argparser.add_argument('--register', action='store_true', help=help_msg)
+    help_msg = 'compile frequently called functions to Python'
+    argparser.add_argument('--jit', action='store_true', help=help_msg)
+    help_msg = f'calls before a function is compiled (default: {JIT_THRESHOLD})'
+    argparser.add_argument('--jit-threshold', type=int, default=JIT_THRESHOLD,
+                           help=help_msg)
+    help_msg = ('loop iterations before a running loop is compiled '
+                f'(default: {JIT_OSR_THRESHOLD})')
+    argparser.add_argument('--osr-threshold', type=int,
+                           default=JIT_OSR_THRESHOLD, help=help_msg)
+    help_msg = ('run on the VM or translate to Python and run that (before '
+                'Python 3.11, the python backend allows only 10000 nested '
+                'calls) (default: vm)')
+    argparser.add_argument('--backend', choices=BACKENDS, default='vm',
+                           help=help_msg)
+    help_msg = 'parse expressions with operator precedence (* and / before + and -, and so on)'
+    argparser.add_argument('--precedence', action='store_true', help=help_msg)
+    help_msg = 'do not look up or store the compiled program in the cache'
+    argparser.add_argument('--no-cache', action='store_true', help=help_msg)
+    help_msg = (f'compiled file to write (default: the program name with '
+                f'{BYTECODE_EXT}, or a{BYTECODE_EXT})')
+    argparser.add_argument('-o', '--output', help=help_msg)
+    help_msg = f'mypl program file, or {BYTECODE_EXT} file to run (optional)'
     argparser.add_argument('filename', nargs='?', help=help_msg)
     args = argparser.parse_args()
+    # compiled programs are run without reading the source
+    if args.filename and args.filename.endswith(BYTECODE_EXT):
+        run_bytecode_mode(args.filename, args.dispatch, args.gc_threshold,
+                          args.heap, args.stats, not args.no_quicken,
+                          args.register, args.jit, args.jit_threshold,
+                          args.osr_threshold)
+        exit(0)
     # get the input (file or standard in)
     in_stream = StdInWrapper(sys.stdin)
     if args.filename:
@@ -188,13 +437,38 @@ if __name__ == '__main__':
     elif args.parse:
         run_parse_mode(in_stream)
     elif args.print:
-        run_print_mode(in_stream)
+        run_print_mode(in_stream, args.precedence)
     elif args.check:
-        run_check_mode(in_stream)
+        run_check_mode(in_stream, args.precedence)
+    elif args.compile:
+        out_filename = args.output
+        if out_filename is None and args.filename:
+            stem = args.filename
+            if stem.endswith(SOURCE_EXT):
+                stem = stem[:-len(SOURCE_EXT)]
+            out_filename = stem + BYTECODE_EXT
+        elif out_filename is None:
+            out_filename = 'a' + BYTECODE_EXT
+        run_compile_mode(in_stream, out_filename, not args.no_opt,
+                         args.register, args.precedence)
     elif args.ir:
-        run_ir_mode(in_stream)
+        run_ir_mode(in_stream, not args.no_opt, args.register, args.backend,
+                    args.precedence)
+    elif args.backend == 'python':
+        run_python_mode(in_stream, not args.no_opt, args.precedence)
     else:
-        run_normal_mode(in_stream)
+        # programs read from files are cached (keyed by their contents)
+        cache = None
+        source = None
+        if args.filename and not args.no_cache:
+            cache = CompileCache()
+            with open(args.filename, 'rb') as source_file:
+                source = source_file.read()
+        run_normal_mode(in_stream, args.dispatch, args.gc_threshold,
+                        args.heap, args.stats, not args.no_opt,
+                        not args.no_quicken, args.register, args.jit,
+                        args.jit_threshold, args.osr_threshold, cache,
+                        source, args.precedence)
     # close the (wrapped) input stream
     in_stream.close()
 
@@ -15,7 +15,11 @@ from typing import List
 #----------------------------------------------------------------------
 
 class Visitor:
-    """Visitor interface for navigating and processing AST."""
+    """Visitor interface for navigating and processing AST. A visit
+    function either visits child nodes by calling their accept, or is a
+    generator that yields them (and is run with walk).
+
+    """
 
     def visit_program(self, program):
         pass
@@ -73,166 +77,196 @@ class Visitor:
     
 
     
+def walk(visitor, node):
+    """Visits a node with an explicit stack instead of recursion.
+
+    A visit function that visits child nodes is written as a generator
+    that yields each child node (instead of calling its accept) and is
+    resumed once the child has been visited. Visit functions that are
+    not generators are simply called. Since no Python call is made per
+    level, how deeply a program nests is limited by memory instead of
+    Python's recursion limit.
+
+    Args:
+        visitor -- The visitor.
+        node -- The AST node to visit.
+
+    """
+    visit = node.accept(visitor)
+    if visit is None:
+        return
+    stack = [visit]
+    while stack:
+        child = next(stack[-1], None)
+        if child is None:
+            stack.pop()
+            continue
+        visit = child.accept(visitor)
+        if visit is not None:
+            stack.append(visit)
+
+
 #----------------------------------------------------------------------
 # AST Classes
 #----------------------------------------------------------------------
 
 # General Program-Related Basic AST Classes
 
-@dataclass
+@dataclass(slots=True)
 class DataType:
     is_array: bool
     type_name: Token
     def accept(self, visitor):
-        visitor.visit_data_type(self)
+        return visitor.visit_data_type(self)
 
-@dataclass
+@dataclass(slots=True)
 class VarDef:
     data_type: DataType
     var_name: Token
     def accept(self, visitor):
-        visitor.visit_var_def(self)
+        return visitor.visit_var_def(self)
 
-@dataclass
+@dataclass(slots=True)
 class Stmt:
     pass
 
-@dataclass
+@dataclass(slots=True)
 class StructDef:
     struct_name: Token
     fields: List[VarDef]
     def accept(self, visitor):
-        visitor.visit_struct_def(self)
+        return visitor.visit_struct_def(self)
 
-@dataclass
+@dataclass(slots=True)
 class FunDef:
     return_type: DataType
     fun_name: Token
     params: List[VarDef]
     stmts: List[Stmt]
     def accept(self, visitor):
-        visitor.visit_fun_def(self)
+        return visitor.visit_fun_def(self)
 
-@dataclass
+@dataclass(slots=True)
 class Program: 
     struct_defs: List[StructDef]
     fun_defs: List[FunDef]
     def accept(self, visitor):
-        visitor.visit_program(self)
+        return visitor.visit_program(self)
 
 
 # Expression Related Classes
 
-@dataclass
+@dataclass(slots=True)
 class RValue:
     pass                        
 
-@dataclass
+@dataclass(slots=True)
 class ExprTerm:
     pass                        
 
-@dataclass
+@dataclass(slots=True)
 class Expr:
     not_op: bool
     first: ExprTerm
     op: Token
     rest: 'Expr'
+    op_type: DataType = None    # operand type, set by the semantic checker
     def accept(self, visitor):
-        visitor.visit_expr(self)
+        return visitor.visit_expr(self)
 
-@dataclass
+@dataclass(slots=True)
 class CallExpr(Stmt, RValue):
     fun_name: Token
     args: List[Expr]
     def accept(self, visitor):
-        visitor.visit_call_expr(self)
+        return visitor.visit_call_expr(self)
         
-@dataclass
+@dataclass(slots=True)
 class SimpleTerm(ExprTerm):
     rvalue: RValue
     def accept(self, visitor):
-        visitor.visit_simple_term(self)
+        return visitor.visit_simple_term(self)
         
-@dataclass
+@dataclass(slots=True)
 class ComplexTerm(ExprTerm):
     expr: Expr
     def accept(self, visitor):
-        visitor.visit_complex_term(self)
+        return visitor.visit_complex_term(self)
 
-@dataclass
+@dataclass(slots=True)
 class SimpleRValue(RValue):
     value: Token
     def accept(self, visitor):
-        visitor.visit_simple_rvalue(self)
+        return visitor.visit_simple_rvalue(self)
 
-@dataclass
+@dataclass(slots=True)
 class NewRValue(RValue):
     type_name: Token
     array_expr: Expr
     struct_params: List[Expr]
     def accept(self, visitor):
-        visitor.visit_new_rvalue(self)
+        return visitor.visit_new_rvalue(self)
     
-@dataclass
+@dataclass(slots=True)
 class VarRef:
     var_name: Token
     array_expr: Expr
         
-@dataclass
+@dataclass(slots=True)
 class VarRValue(RValue):
     path: List[VarRef]
     def accept(self, visitor):
-        visitor.visit_var_rvalue(self)
+        return visitor.visit_var_rvalue(self)
 
         
 # Statement Related Classes
 
-@dataclass
+@dataclass(slots=True)
 class ReturnStmt(Stmt):
     expr: Expr
     def accept(self, visitor):
-        visitor.visit_return_stmt(self)
+        return visitor.visit_return_stmt(self)
 
-@dataclass
+@dataclass(slots=True)
 class VarDecl(Stmt):
     var_def: VarDef
     expr: Expr
     def accept(self, visitor):
-        visitor.visit_var_decl(self)
+        return visitor.visit_var_decl(self)
 
-@dataclass
+@dataclass(slots=True)
 class AssignStmt(Stmt):
     lvalue: List[VarRef]
     expr: Expr
     def accept(self, visitor):
-        visitor.visit_assign_stmt(self)
+        return visitor.visit_assign_stmt(self)
 
-@dataclass
+@dataclass(slots=True)
 class WhileStmt(Stmt):
     condition: Expr
     stmts: List[Stmt]
     def accept(self, visitor):
-        visitor.visit_while_stmt(self)
+        return visitor.visit_while_stmt(self)
         
-@dataclass
+@dataclass(slots=True)
 class ForStmt(Stmt):
     var_decl: VarDecl
     condition: Expr
     assign_stmt: AssignStmt
     stmts: List[Stmt]
     def accept(self, visitor):
-        visitor.visit_for_stmt(self)
+        return visitor.visit_for_stmt(self)
 
-@dataclass
+@dataclass(slots=True)
 class BasicIf:
     condition: Expr
     stmts: List[Stmt]
 
-@dataclass
+@dataclass(slots=True)
 class IfStmt(Stmt):
     if_part: BasicIf
     else_ifs: List[BasicIf]
     else_stmts: List[Stmt]
     def accept(self, visitor):
-        visitor.visit_if_stmt(self)
+        return visitor.visit_if_stmt(self)
 
@@ -11,16 +11,42 @@ from mypl_lexer import *
 from mypl_ast import *
 
 
+# binary operator precedence levels for --precedence parsing (higher
+# levels bind tighter; operators of one level group to the left)
+PRECEDENCE = {
+    TokenType.OR: 1,
+    TokenType.AND: 2,
+    TokenType.EQUAL: 4, TokenType.NOT_EQUAL: 4,
+    TokenType.LESS: 4, TokenType.LESS_EQ: 4,
+    TokenType.GREATER: 4, TokenType.GREATER_EQ: 4,
+    TokenType.PLUS: 5, TokenType.MINUS: 5,
+    TokenType.TIMES: 6, TokenType.DIVIDE: 6,
+}
+
+# level of the operand of not (not a == b is not (a == b), and not a and
+# b is (not a) and b)
+NOT_LEVEL = 4
+
+# operators whose chains are grouped as balanced trees (the result, and
+# the short circuiting, are the same for any grouping)
+ASSOCIATIVE = [TokenType.AND, TokenType.OR]
+
+
 class ASTParser:
 
-    def __init__(self, lexer):
+    def __init__(self, lexer, precedence=False):
         """Create a MyPL syntax checker (parser). 
         
         Args:
             lexer -- The lexer to use in the parser.
+            precedence -- If true, parse expressions with operator
+                          precedence (see PRECEDENCE) instead of grouping
+                          them to the right.
 
         """
         self.lexer = lexer
+        self.precedence = precedence
+        self.tokens = lexer.token_buffer()
         self.curr_token = None
 
         
@@ -32,7 +58,7 @@ class ASTParser:
             if self.match(TokenType.STRUCT):
                 self.struct_def(program_node)
             else:
-                self.fun_def(program_node)
+                self.run(self.fun_def(program_node))
         self.eat(TokenType.EOS, 'expecting EOF')
         return program_node
 
@@ -56,11 +82,11 @@ class ASTParser:
 
 
     def advance(self):
-        """Moves to the next token of the lexer."""
-        self.curr_token = self.lexer.next_token()
+        """Moves to the next token of the lexer (staying on EOS)."""
+        self.curr_token = self.tokens.next_token()
         # skip comments
         while self.match(TokenType.COMMENT):
-            self.curr_token = self.lexer.next_token()
+            self.curr_token = self.tokens.next_token()
 
             
     def match(self, token_type):
@@ -109,6 +135,39 @@ class ASTParser:
         return self.match_any(ts)
 
 
+    def run(self, parse_fun):
+        """Runs a grammar function, returning its return value.
+
+        The grammar functions that can nest (statements and expressions)
+        are generators: each one yields the generator of a grammar
+        function it calls, and gets back that function's return value.
+        They are run here with an explicit stack, so how deeply a program
+        nests is limited by memory instead of Python's recursion limit.
+
+        Args:
+            parse_fun -- The generator of the grammar function.
+
+        """
+        stack = [parse_fun]
+        push = stack.append
+        pop = stack.pop
+        send = parse_fun.send
+        value = None
+        while True:
+            try:
+                called = send(value)
+            except StopIteration as ex:
+                pop()
+                if not stack:
+                    return ex.value
+                send = stack[-1].send
+                value = ex.value
+            else:
+                push(called)
+                send = called.send
+                value = None
+
+
     #----------------------------------------------------------------------
     # Recursive descent functions
     #----------------------------------------------------------------------
@@ -179,7 +238,7 @@ class ASTParser:
        
        
         while not self.match(TokenType.RBRACE):
-            self.stmt(fun_def_node.stmts)
+            yield self.stmt(fun_def_node.stmts)
            
            
         self.eat(TokenType.RBRACE, 'expected right brace')
@@ -238,40 +297,40 @@ class ASTParser:
         stmt_node = None
         if(self.match(TokenType.WHILE)):
             stmt_node = WhileStmt(None, [])
-            self.while_stmt(stmt_node)
+            yield self.while_stmt(stmt_node)
             
         elif(self.match(TokenType.IF)):
             stmt_node = IfStmt(None, [], [])
-            self.if_stmt(stmt_node)
+            yield self.if_stmt(stmt_node)
         elif(self.match(TokenType.FOR)):
             stmt_node = ForStmt(None, None, None, [])
-            self.for_stmt(stmt_node)
+            yield self.for_stmt(stmt_node)
         elif(self.match(TokenType.RETURN)):
             stmt_node = ReturnStmt(None)
-            self.return_stmt(stmt_node)
+            yield self.return_stmt(stmt_node)
             self.eat(TokenType.SEMICOLON, 'expecting semicolon')
         elif(self.match(TokenType.ID)):
             token_save = self.curr_token
             self.advance()
             if(self.match(TokenType.LPAREN)):
                 stmt_node = CallExpr(token_save, [])
-                self.call_expr(stmt_node)
+                yield self.call_expr(stmt_node)
                 self.eat(TokenType.SEMICOLON, 'expected semicolon')
             elif(self.match(TokenType.LBRACKET) or self.match(TokenType.DOT) or self.match(TokenType.ASSIGN)):
                 stmt_node = AssignStmt([], None)
-                self.assign_stmt(stmt_node)
+                yield self.assign_stmt(stmt_node)
                 stmt_node.lvalue[0].var_name = token_save
                 self.eat(TokenType.SEMICOLON, 'expected semicolon')
             else:
                 stmt_node = VarDecl(None, None)
                
-                self.vdecl_stmt(True, stmt_node)
+                yield self.vdecl_stmt(True, stmt_node)
                 stmt_node.var_def.data_type.type_name = token_save
                 self.eat(TokenType.SEMICOLON, 'expected semicolon')
         else:
             stmt_node = VarDecl(None, None)
         
-            self.vdecl_stmt(False, stmt_node)
+            yield self.vdecl_stmt(False, stmt_node)
             self.eat(TokenType.SEMICOLON, 'expected semicolon')
         
         stmt_list_node.append(stmt_node)
@@ -288,12 +347,12 @@ class ASTParser:
     
         self.eat(TokenType.WHILE, "expected while")
         self.eat(TokenType.LPAREN, 'expected l paren')
-        self.expr(while_stmt_node.condition)
+        yield self.expr(while_stmt_node.condition)
         self.eat(TokenType.RPAREN, 'expected r paren')
         self.eat(TokenType.LBRACE, 'expected l brace')
         while(not self.match(TokenType.RBRACE)):
             
-            self.stmt(while_stmt_node.stmts)
+            yield self.stmt(while_stmt_node.stmts)
             #while_stmt_node.stmts.append(stmt_node)
         self.eat(TokenType.RBRACE, 'expecting RBRACE')
         
@@ -306,35 +365,35 @@ class ASTParser:
         self.eat(TokenType.IF, 'expecting IF')# eats if
         self.eat(TokenType.LPAREN, 'expecting LPAREN')
         if_stmt_node.if_part.condition = Expr(None, None, None, None)
-        self.expr(if_stmt_node.if_part.condition)
+        yield self.expr(if_stmt_node.if_part.condition)
         self.eat(TokenType.RPAREN, 'expecting RPAREN')
         self.eat(TokenType.LBRACE, 'expecting LBRACE')
         while not self.match(TokenType.RBRACE):
-            self.stmt(if_stmt_node.if_part.stmts)
+            yield self.stmt(if_stmt_node.if_part.stmts)
         self.eat(TokenType.RBRACE, 'expecting RBRACE')
-        self.if_stmt_t(if_stmt_node)
+        yield self.if_stmt_t(if_stmt_node)
 
 
     def if_stmt_t(self, if_stmt_node):
         
         """ELSEIF LPAREN <expr> RPAREN LBRACE ( <stmt> )∗ RBRACE <if_stmt_t> | ELSE LBRACE ( <stmt> )∗ RBRACE | ϵ"""
-        if self.match(TokenType.ELSEIF):
+        # (a loop rather than a recursive call per elseif)
+        while self.match(TokenType.ELSEIF):
             else_if_node = BasicIf(Expr(None, None, None, None), [])
             self.advance()
             self.eat(TokenType.LPAREN, 'expecting LPAREN')
-            self.expr(else_if_node.condition)
+            yield self.expr(else_if_node.condition)
             self.eat(TokenType.RPAREN, 'expecting RPAREN')
             self.eat(TokenType.LBRACE, 'expecting LBRACE')
             while not self.match(TokenType.RBRACE):
-                self.stmt(else_if_node.stmts)
+                yield self.stmt(else_if_node.stmts)
             self.eat(TokenType.RBRACE, 'expecting RBRACE')
             if_stmt_node.else_ifs.append(else_if_node)
-            self.if_stmt_t(if_stmt_node)
-        elif self.match(TokenType.ELSE):
+        if self.match(TokenType.ELSE):
             self.advance()
             self.eat(TokenType.LBRACE, 'expecting LBRACE')
             while not self.match(TokenType.RBRACE):
-                self.stmt(if_stmt_node.else_stmts)
+                yield self.stmt(if_stmt_node.else_stmts)
             self.eat(TokenType.RBRACE, 'expecting RBRACE')
         
 
@@ -344,21 +403,21 @@ class ASTParser:
         self.eat(TokenType.FOR, 'expecting for') # eats for
         self.eat(TokenType.LPAREN, 'expected LPAREN')
         for_stmt_node.var_decl = VarDecl(None, None)
-        self.vdecl_stmt(False, for_stmt_node.var_decl)
+        yield self.vdecl_stmt(False, for_stmt_node.var_decl)
         self.eat(TokenType.SEMICOLON, 'expected SEMICOLON')
         for_stmt_node.condition = Expr(None, None, None, None)
-        self.expr(for_stmt_node.condition)
+        yield self.expr(for_stmt_node.condition)
         self.eat(TokenType.SEMICOLON, 'expected SEMICOLON')
         
         token_save = self.curr_token
         self.eat(TokenType.ID, 'expecting ID') # as a part of the assign_stmt grammar
         for_stmt_node.assign_stmt = AssignStmt([], None)
-        self.assign_stmt(for_stmt_node.assign_stmt)
+        yield self.assign_stmt(for_stmt_node.assign_stmt)
         for_stmt_node.assign_stmt.lvalue[0].var_name = token_save
         self.eat(TokenType.RPAREN, 'expected RPAREN')
         self.eat(TokenType.LBRACE, 'expected LBRACE')
         while not self.match(TokenType.RBRACE):
-                self.stmt(for_stmt_node.stmts)
+                yield self.stmt(for_stmt_node.stmts)
         self.eat(TokenType.RBRACE, 'expected RBRACE')
 
     
@@ -367,7 +426,7 @@ class ASTParser:
         """RETURN <expr> SEMICOLON"""
         self.eat(TokenType.RETURN, 'expecting return')
         return_stmt_node.expr = Expr(None, None, None, None)
-        self.expr(return_stmt_node.expr)
+        yield self.expr(return_stmt_node.expr)
         # self.eat(TokenType.SEMICOLON, 'expecting semicolon')
 
     def lvalue(self, l_val_list):
@@ -381,7 +440,7 @@ class ASTParser:
         if(self.match(TokenType.LBRACKET)):
             self.advance()
             var_ref_node.array_expr = Expr(None, None, None, None)
-            self.expr(var_ref_node.array_expr)
+            yield self.expr(var_ref_node.array_expr)
             self.eat(TokenType.RBRACKET, 'expecting RBRACKET')
 
         while(self.match(TokenType.DOT)):
@@ -391,7 +450,7 @@ class ASTParser:
             if(self.match(TokenType.LBRACKET)):
                 self.advance()
                 var_ref_node.array_expr = Expr(None, None, None, None)
-                self.expr(var_ref_node.array_expr)
+                yield self.expr(var_ref_node.array_expr)
                 self.eat(TokenType.RBRACKET, 'expecting RBRACKET')
             l_val_list.append(var_ref_node)
                
@@ -411,7 +470,7 @@ class ASTParser:
         if not self.match(TokenType.SEMICOLON):
             var_decl_node.expr = Expr(None, None, None, None)
             self.eat(TokenType.ASSIGN, 'expected =')
-            self.expr(var_decl_node.expr)
+            yield self.expr(var_decl_node.expr)
         
     
     def assign_stmt (self, assign_stmt_node):
@@ -419,10 +478,10 @@ class ASTParser:
         """<lvalue> ASSIGN <expr>"""
         """ID already read when called"""
         
-        self.lvalue(assign_stmt_node.lvalue)
+        yield self.lvalue(assign_stmt_node.lvalue)
         self.eat(TokenType.ASSIGN, 'expecting assign')
         assign_stmt_node.expr = Expr(None, None, None, None)
-        self.expr(assign_stmt_node.expr)
+        yield self.expr(assign_stmt_node.expr)
 
         
     
@@ -433,7 +492,7 @@ class ASTParser:
         self.eat(TokenType.LPAREN, 'expecting LPAREN') 
         while not self.match(TokenType.RPAREN):
             expr_node = Expr(None, None, None, None)
-            self.expr(expr_node)
+            yield self.expr(expr_node)
             call_expr_node.args.append(expr_node)
             if not self.match(TokenType.RPAREN):
                 self.eat(TokenType.COMMA, 'expecting comma')
@@ -446,32 +505,126 @@ class ASTParser:
     def expr(self, expr_node):
        
         """( <rvalue> | NOT <expr> | LPAREN <expr> RPAREN ) ( <bin_op> <expr> | ϵ )"""
+        if self.precedence:
+            expr = yield self.climb_expr(1)
+            expr_node.not_op = expr.not_op
+            expr_node.first = expr.first
+            expr_node.op = expr.op
+            expr_node.rest = expr.rest
+            return
         expr_node.not_op = False
         if self.match(TokenType.NOT):
             
             self.advance()
-            self.expr(expr_node)
+            yield self.expr(expr_node)
             expr_node.not_op = True
 
         elif self.match(TokenType.LPAREN):
             first_node = ComplexTerm(Expr(None, None, None, None))
             self.advance()
-            self.expr(first_node.expr)
+            yield self.expr(first_node.expr)
             self.eat(TokenType.RPAREN, 'expected RPAREN')
             expr_node.first = first_node
         else:
             first_node = SimpleTerm(None)
-            self.rvalue(first_node)
+            yield self.rvalue(first_node)
             expr_node.first = first_node
        
         if(self.is_bin_op()):
             expr_node.op = self.curr_token
             self.advance()
             expr_node.rest = Expr(None, None, None, None)
-            self.expr(expr_node.rest)
+            yield self.expr(expr_node.rest)
 
         
     
+    #----------------------------------------------------------------------
+    # Precedence climbing (--precedence)
+    #----------------------------------------------------------------------
+
+    def climb_expr(self, level):
+        """Parses an expression of binary operators of the given precedence
+        level or higher, returning its Expr. Operators of the same level
+        are combined in a loop, and the parser only recurses for the
+        operands of tighter binding operators.
+
+        Args:
+            level -- The lowest precedence level to parse.
+
+        """
+        lhs = yield self.unary_expr()
+        while self.curr_token.token_type in PRECEDENCE:
+            op = self.curr_token
+            op_level = PRECEDENCE[op.token_type]
+            if op_level < level:
+                break
+            self.advance()
+            if op.token_type in ASSOCIATIVE:
+                operands = [lhs, (yield self.climb_expr(op_level + 1))]
+                ops = [op]
+                while self.match(op.token_type):
+                    ops.append(self.curr_token)
+                    self.advance()
+                    operands.append((yield self.climb_expr(op_level + 1)))
+                lhs = self.balanced_expr(operands, ops)
+            else:
+                rhs = yield self.climb_expr(op_level + 1)
+                lhs = self.binary_expr(lhs, op, rhs)
+        return lhs
+
+
+    def unary_expr(self):
+        """NOT <expr> | LPAREN <expr> RPAREN | <rvalue>, where the NOT
+        applies to the comparison (or tighter binding) expression after
+        it. Returns the Expr.
+
+        """
+        if self.match(TokenType.NOT):
+            self.advance()
+            expr = yield self.climb_expr(NOT_LEVEL)
+            if expr.not_op:
+                expr = Expr(False, ComplexTerm(expr), None, None)
+            expr.not_op = True
+            return expr
+        if self.match(TokenType.LPAREN):
+            self.advance()
+            first_node = ComplexTerm((yield self.climb_expr(1)))
+            self.eat(TokenType.RPAREN, 'expected RPAREN')
+        else:
+            first_node = SimpleTerm(None)
+            yield self.rvalue(first_node)
+        return Expr(False, first_node, None, None)
+
+
+    def binary_expr(self, lhs, op, rhs):
+        """Returns the Expr of lhs op rhs (with the left operand as its
+        first term, and the right operand as its rest).
+
+        """
+        if lhs.op is None and not lhs.not_op:
+            first_node = lhs.first
+        else:
+            first_node = ComplexTerm(lhs)
+        return Expr(False, first_node, op, rhs)
+
+
+    def balanced_expr(self, operands, ops):
+        """Returns a balanced Expr tree of a chain of operands of an
+        associative operator (so the tree is log n deep instead of n).
+
+        Args:
+            operands -- The operand Exprs.
+            ops -- The operator tokens between them.
+
+        """
+        if len(operands) == 1:
+            return operands[0]
+        mid = len(operands) // 2
+        lhs = self.balanced_expr(operands[:mid], ops[:mid - 1])
+        rhs = self.balanced_expr(operands[mid:], ops[mid:])
+        return self.binary_expr(lhs, ops[mid - 1], rhs)
+
+
     #r val is term
     def rvalue(self, term_node):
 
@@ -483,16 +636,16 @@ class ASTParser:
             self.advance()
         elif(self.match(TokenType.NEW)):
             term_node.rvalue = NewRValue(None, None, None)
-            self.new_rvalue(term_node.rvalue)
+            yield self.new_rvalue(term_node.rvalue)
         elif(self.match(TokenType.ID)):
             token_save = self.curr_token
             self.advance()
             if(self.match(TokenType.LPAREN)):
                 term_node.rvalue = CallExpr(token_save, [])
-                self.call_expr(term_node.rvalue)
+                yield self.call_expr(term_node.rvalue)
             else:
                 term_node.rvalue = VarRValue([])
-                self.var_rvalue(term_node.rvalue)
+                yield self.var_rvalue(term_node.rvalue)
                 term_node.rvalue.path[0].var_name = token_save
         else:
             term_node.rvalue = SimpleRValue(None)
@@ -533,7 +686,7 @@ class ASTParser:
                 while not self.match(TokenType.RPAREN):
                     # r_val_node.struct_params = []
                     expr_node = Expr(None, None, None, None)
-                    self.expr(expr_node)
+                    yield self.expr(expr_node)
                     r_val_node.struct_params.append(expr_node)
                     if not self.match(TokenType.RPAREN):
                         self.eat(TokenType.COMMA, "expecting COMMA")
@@ -543,13 +696,13 @@ class ASTParser:
             else:
                 self.eat(TokenType.LBRACKET, 'expecting LBRACKET')
                 r_val_node.array_expr = Expr(None, None, None, None)
-                self.expr(r_val_node.array_expr)
+                yield self.expr(r_val_node.array_expr)
                 self.eat(TokenType.RBRACKET, 'expecting RBRACKET')
        else:
            self.base_type()
            self.eat(TokenType.LBRACKET, 'expecting LBRACKET')
            r_val_node.array_expr = Expr(None, None, None, None)
-           self.expr(r_val_node.array_expr)
+           yield self.expr(r_val_node.array_expr)
            self.eat(TokenType.RBRACKET, 'expecting RBRACKET')
 
            
@@ -572,7 +725,7 @@ class ASTParser:
         if(self.match(TokenType.LBRACKET)):
             self.advance()
             var_rval_node.path[0].array_expr = Expr(None, None, None, None)
-            self.expr(var_rval_node.path[0].array_expr)
+            yield self.expr(var_rval_node.path[0].array_expr)
             self.eat(TokenType.RBRACKET, 'expecting RBRACKET')
         while self.match(TokenType.DOT):
             self.advance() # eat dot
@@ -581,7 +734,7 @@ class ASTParser:
             if(self.match(TokenType.LBRACKET)):
                 var_ref_node.array_expr = Expr(None, None, None, None)
                 self.advance()
-                self.expr(var_ref_node.array_expr)
+                yield self.expr(var_ref_node.array_expr)
                 self.eat(TokenType.RBRACKET, 'expecting RBRACKET')
             var_rval_node.path.append(var_ref_node)
             
@@ -0,0 +1,323 @@
+"""Compiled bytecode (.myplc) files for the MyPL VM.
+
+A .myplc file holds the frame templates of a program in their linked
+form, so a program can be run without lexing, parsing, checking, and
+generating code again. All values are little-endian:
+
+    header      magic 'MYPL', u16 version, u16 flags, u32 hash of the
+                opcode table, u32 CRC-32 of everything after the header
+    constants   u32 count, then each constant as a tag byte and its data
+    functions   u32 count, then for each function: u32 name (constant
+                index), u32 argument count, u32 instruction count n, u32
+                comment count c, c pairs of u32 (pc, constant index), n
+                u32 operands (constant indexes), and n u8 opcodes
+
+Operand and opcode arrays start (and end) on a 4-byte boundary. Loading
+memory-maps the file and uses the arrays in place (copy-on-write, so
+quickening can still rewrite opcodes), and only decodes the constant
+pool, which all functions of the file share.
+
+NAME: <Ryan St. Mary>
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from mypl_error import BytecodeError
+from mypl_opcode import OpCode
+from mypl_frame import VMFrameTemplate, LinkedInstructions, const_key
+
+
+MAGIC = b'MYPL'
+VERSION = 1
+
+# header: magic, version, flags, opcode table hash, body checksum
+HEADER = struct.Struct('<4sHHII')
+U32 = struct.Struct('<I')
+INT64 = struct.Struct('<q')
+DOUBLE = struct.Struct('<d')
+
+# header flags
+FLAG_OPTIMIZED = 1      # constants folded and peephole optimized
+FLAG_FUSED = 2          # may contain superinstructions (stack VM only)
+
+# every valid opcode byte (to find invalid ones with bytes.translate)
+OPCODE_BYTES = bytes(op.value for op in OpCode)
+
+# constant tags
+TAG_NULL = ord('N')
+TAG_TRUE = ord('T')
+TAG_FALSE = ord('F')
+TAG_INT = ord('I')      # 64-bit int
+TAG_BIGINT = ord('L')   # larger int (length and decimal digits)
+TAG_DOUBLE = ord('D')
+TAG_STRING = ord('S')   # length and UTF-8 bytes
+TAG_TUPLE = ord('U')    # count and the elements
+
+
+def opcode_hash():
+    """Returns a hash of the opcode names in order (their values), so
+    files written for a different opcode table are rejected.
+
+    """
+    names = ' '.join(op.name for op in OpCode)
+    return zlib.crc32(names.encode('utf-8'))
+
+
+#----------------------------------------------------------------------
+# Writing
+#----------------------------------------------------------------------
+
+class BytecodeWriter:
+
+    def __init__(self):
+        self.out = bytearray()
+        self.consts = []        # the constant pool
+        self.pool = {}          # const_key -> constant index
+
+
+    def const(self, value):
+        """Returns the constant pool index of a value (adding it if
+        needed).
+
+        """
+        key = const_key(value)
+        if key not in self.pool:
+            if type(value) not in [type(None), bool, int, float, str, tuple]:
+                raise BytecodeError(f'cannot save constant {value!r}')
+            self.pool[key] = len(self.consts)
+            self.consts.append(value)
+        return self.pool[key]
+
+
+    def write_u32(self, value):
+        self.out += U32.pack(value)
+
+
+    def align(self):
+        """Pad the output to a 4-byte boundary."""
+        self.out += bytes(-len(self.out) % 4)
+
+
+    def write_const(self, value):
+        if value is None:
+            self.out.append(TAG_NULL)
+        elif value is True:
+            self.out.append(TAG_TRUE)
+        elif value is False:
+            self.out.append(TAG_FALSE)
+        elif type(value) is int and -2**63 <= value < 2**63:
+            self.out.append(TAG_INT)
+            self.out += INT64.pack(value)
+        elif type(value) is int:
+            digits = str(value).encode('ascii')
+            self.out.append(TAG_BIGINT)
+            self.write_u32(len(digits))
+            self.out += digits
+        elif type(value) is float:
+            self.out.append(TAG_DOUBLE)
+            self.out += DOUBLE.pack(value)
+        elif type(value) is str:
+            data = value.encode('utf-8', 'surrogatepass')
+            self.out.append(TAG_STRING)
+            self.write_u32(len(data))
+            self.out += data
+        else:
+            self.out.append(TAG_TUPLE)
+            self.write_u32(len(value))
+            for v in value:
+                self.write_const(v)
+
+
+    def write(self, templates, flags=0):
+        """Returns the .myplc file contents for the given templates.
+
+        Args:
+            templates -- Dictionary of function name to VMFrameTemplate.
+            flags -- The header flags.
+
+        """
+        functions = []
+        for template in templates.values():
+            instrs = list(template.instructions)
+            name = self.const(template.function_name)
+            operands = array('I', [self.const(i.operand) for i in instrs])
+            opcodes = bytes(i.opcode.value for i in instrs)
+            comments = [(pc, self.const(i.comment)) for pc, i in enumerate(instrs)
+                        if i.comment]
+            functions.append((name, template.arg_count, operands, opcodes, comments))
+        for value in self.consts:
+            self.write_const(value)
+        body = self.out
+        self.out = bytearray()
+        self.write_u32(len(self.consts))
+        self.out += body
+        self.align()
+        self.write_u32(len(functions))
+        for name, arg_count, operands, opcodes, comments in functions:
+            for value in [name, arg_count, len(opcodes), len(comments)]:
+                self.write_u32(value)
+            for pc, comment in comments:
+                self.write_u32(pc)
+                self.write_u32(comment)
+            if sys.byteorder != 'little':
+                operands.byteswap()
+            self.out += operands.tobytes()
+            self.out += opcodes
+            self.align()
+        body = bytes(self.out)
+        header = HEADER.pack(MAGIC, VERSION, flags, opcode_hash(), zlib.crc32(body))
+        return header + body
+
+
+def save_bytecode(vm, filename, flags=0):
+    """Write the frame templates of a VM to a .myplc file.
+
+    Args:
+        vm -- The VM holding the generated (and optimized) code.
+        filename -- The file to write.
+        flags -- The header flags (FLAG_OPTIMIZED, FLAG_FUSED).
+
+    """
+    data = BytecodeWriter().write(vm.frame_templates, flags)
+    with open(filename, 'wb') as out_file:
+        out_file.write(data)
+
+
+#----------------------------------------------------------------------
+# Loading
+#----------------------------------------------------------------------
+
+class BytecodeReader:
+
+    def __init__(self, view):
+        """Creates a reader over the body of a .myplc file.
+
+        Args:
+            view -- A memoryview of the whole file.
+
+        """
+        self.view = view
+        self.pos = HEADER.size
+
+
+    def read_u32(self):
+        value = U32.unpack_from(self.view, self.pos)[0]
+        self.pos += 4
+        return value
+
+
+    def read_bytes(self, length):
+        if self.pos + length > len(self.view):
+            raise IndexError('truncated file')
+        data = self.view[self.pos:self.pos + length]
+        self.pos += length
+        return data
+
+
+    def align(self):
+        self.pos += -self.pos % 4
+
+
+    def read_const(self):
+        tag = self.view[self.pos]
+        self.pos += 1
+        if tag == TAG_NULL:
+            return None
+        elif tag == TAG_TRUE:
+            return True
+        elif tag == TAG_FALSE:
+            return False
+        elif tag == TAG_INT:
+            value = INT64.unpack_from(self.view, self.pos)[0]
+            self.pos += 8
+            return value
+        elif tag == TAG_BIGINT:
+            return int(str(self.read_bytes(self.read_u32()), 'ascii'))
+        elif tag == TAG_DOUBLE:
+            value = DOUBLE.unpack_from(self.view, self.pos)[0]
+            self.pos += 8
+            return value
+        elif tag == TAG_STRING:
+            return str(self.read_bytes(self.read_u32()), 'utf-8', 'surrogatepass')
+        elif tag == TAG_TUPLE:
+            return tuple(self.read_const() for _ in range(self.read_u32()))
+        raise BytecodeError(f'bad constant tag {tag}')
+
+
+    def read_function(self, consts):
+        """Returns the VMFrameTemplate of the next function (in linked
+        form, its arrays viewing the file).
+
+        """
+        name, arg_count, length, comment_count = [self.read_u32() for _ in range(4)]
+        template = VMFrameTemplate(consts[name], arg_count)
+        template.consts = consts
+        template.comments = {}
+        for _ in range(comment_count):
+            pc = self.read_u32()
+            template.comments[pc] = consts[self.read_u32()]
+        operands = self.read_bytes(4 * length).cast('I')
+        if sys.byteorder != 'little':
+            operands = array('I', operands)
+            operands.byteswap()
+        template.operands = operands
+        template.opcodes = self.read_bytes(length)
+        self.align()
+        # (checked in bulk: any byte left after deleting the valid
+        # opcodes is invalid, and no operand can index past the pool)
+        if bytes(template.opcodes).translate(None, OPCODE_BYTES):
+            raise BytecodeError(f'bad opcode in function {template.function_name}')
+        if length and max(template.operands) >= len(consts):
+            raise BytecodeError(f'bad operand in function {template.function_name}')
+        template.instructions = LinkedInstructions(template)
+        return template
+
+
+    def read(self):
+        """Returns the dictionary of function name to template."""
+        consts = [self.read_const() for _ in range(self.read_u32())]
+        self.align()
+        templates = {}
+        for _ in range(self.read_u32()):
+            template = self.read_function(consts)
+            templates[template.function_name] = template
+        return templates
+
+
+def load_bytecode(filename, vm):
+    """Load the frame templates of a .myplc file into a VM. Returns the
+    file's header flags.
+
+    Args:
+        filename -- The file to load.
+        vm -- The VM to add the templates to.
+
+    """
+    try:
+        with open(filename, 'rb') as in_file:
+            mapped = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_COPY)
+    except (OSError, ValueError):
+        raise BytecodeError(f'could not read "{filename}"')
+    view = memoryview(mapped)
+    if len(view) < HEADER.size:
+        raise BytecodeError(f'"{filename}" is not a compiled MyPL file')
+    magic, version, flags, op_hash, checksum = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise BytecodeError(f'"{filename}" is not a compiled MyPL file')
+    if version != VERSION or op_hash != opcode_hash():
+        raise BytecodeError(f'"{filename}" was compiled by a different '
+                            'version of MyPL (compile it again)')
+    if zlib.crc32(view[HEADER.size:]) != checksum:
+        raise BytecodeError(f'"{filename}" is corrupt (bad checksum)')
+    try:
+        templates = BytecodeReader(view).read()
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError):
+        raise BytecodeError(f'"{filename}" is corrupt (truncated)')
+    vm.frame_templates.update(templates)
+    return flags
@@ -0,0 +1,267 @@
+"""Cache of compiled MyPL programs (like Python's __pycache__).
+
+The generated code of a program is saved as a .myplc file (see
+mypl_bytecode.py) named by a hash of the program's source, the compiler
+version, and the options that change the generated code. Running the
+same unchanged program again loads that file instead of lexing,
+parsing, checking, and generating code. The cache is bounded in size;
+when it grows past its limit, the least recently used files are removed.
+
+NAME: <Ryan St. Mary>
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import glob
+import hashlib
+import os
+import tempfile
+try:
+    import fcntl
+except ImportError:
+    # (no file locks on Windows: concurrent runs may lose stats updates)
+    fcntl = None
+from mypl_error import MyPLError
+from mypl_bytecode import save_bytecode, load_bytecode
+
+
+# default cache directory (MYPL_CACHE_DIR overrides it)
+CACHE_DIR = os.path.join('~', '.cache', 'mypl')
+
+# default total size of the cached files, in bytes
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# cached program file extension, and the file with the running totals
+CACHE_EXT = '.myplc'
+STATS_FILE = 'stats'
+
+
+def compiler_version():
+    """Returns a hash of the compiler's modules, so that any change to
+    the compiler invalidates the programs it compiled.
+
+    """
+    digest = hashlib.sha256()
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    for path in sorted(glob.glob(os.path.join(module_dir, 'mypl_*.py'))):
+        with open(path, 'rb') as module_file:
+            digest.update(module_file.read())
+    return digest.hexdigest()
+
+
+def read_totals(stats_file):
+    """Returns the [hits, misses, evictions] in an open stats file
+    (zeros if it is empty or damaged).
+
+    """
+    try:
+        totals = [int(n) for n in stats_file.read().split()]
+    except ValueError:
+        totals = []
+    return totals if len(totals) == 3 else [0, 0, 0]
+
+
+class CompileCache:
+
+    def __init__(self, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+        """Creates a cache over the given directory (created when the
+        first program is stored).
+
+        Args:
+            cache_dir -- The cache directory (default: MYPL_CACHE_DIR, or
+                         ~/.cache/mypl).
+            max_bytes -- Total size of cached files to keep.
+
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get('MYPL_CACHE_DIR', CACHE_DIR)
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        # counters for this run
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0              # unreadable or unwritable entries
+
+
+    def key(self, source, optimize=True, register=False, precedence=False,
+            typed=True):
+        """Returns the cache key of a program.
+
+        Args:
+            source -- The program source (bytes).
+            optimize -- True if the code is constant folded and optimized.
+            register -- True if the code is generated for the register VM.
+            precedence -- True if expressions are parsed with precedence.
+            typed -- True if the code uses typed and fused instructions.
+
+        """
+        digest = hashlib.sha256()
+        digest.update(compiler_version().encode('ascii'))
+        options = (f'optimize={optimize} register={register} '
+                   f'precedence={precedence} typed={typed}')
+        digest.update((options + '\n').encode('ascii'))
+        digest.update(source)
+        return digest.hexdigest()
+
+
+    def path(self, key):
+        """Returns the file name of a cache entry."""
+        return os.path.join(self.cache_dir, key + CACHE_EXT)
+
+
+    def load(self, key, vm):
+        """Load a cached program into a VM. Returns the file's header flags,
+        or None if the program is not cached.
+
+        Args:
+            key -- The program's cache key.
+            vm -- The VM to add the frame templates to.
+
+        """
+        path = self.path(key)
+        flags = None
+        if os.path.exists(path):
+            try:
+                flags = load_bytecode(path, vm)
+                # the modification time orders entries for eviction
+                os.utime(path)
+            except MyPLError:
+                # a damaged or outdated entry is compiled again
+                self.errors += 1
+                vm.frame_templates.clear()
+                flags = None
+            except OSError:
+                self.errors += 1
+        if flags is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        self.update_totals(flags is not None)
+        return flags
+
+
+    def store(self, key, vm, flags):
+        """Add a compiled program to the cache, then evict the least
+        recently used entries if the cache is over its size limit.
+
+        Args:
+            key -- The program's cache key.
+            vm -- The VM holding the generated code.
+            flags -- The bytecode header flags.
+
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # written under a temporary name so that other runs never see
+            # a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            os.close(fd)
+            try:
+                save_bytecode(vm, tmp_path, flags)
+                os.replace(tmp_path, self.path(key))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self.evict()
+        except (OSError, MyPLError):
+            self.errors += 1
+
+
+    def entries(self):
+        """Returns (modification time, size, path) of each cache entry."""
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*' + CACHE_EXT)):
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+        return entries
+
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in
+        max_bytes.
+
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                evicted += 1
+            except OSError:
+                pass
+            total -= size
+        self.evictions += evicted
+        if evicted:
+            self.update_totals(evicted=evicted)
+
+
+    #----------------------------------------------------------------------
+    # Statistics
+    #----------------------------------------------------------------------
+
+    def totals(self):
+        """Returns the [hits, misses, evictions] of all runs so far."""
+        try:
+            with open(os.path.join(self.cache_dir, STATS_FILE)) as stats_file:
+                if fcntl is not None:
+                    fcntl.flock(stats_file, fcntl.LOCK_SH)
+                return read_totals(stats_file)
+        except OSError:
+            return [0, 0, 0]
+
+
+    def update_totals(self, hit=None, evicted=0):
+        """Add a lookup (hit is True or False) and evictions to the totals
+        kept in the cache directory. The stats file is updated in place
+        while holding a lock on it, so concurrent runs do not lose each
+        other's updates.
+
+        """
+        if hit is None and not evicted:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = os.path.join(self.cache_dir, STATS_FILE)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            with os.fdopen(fd, 'r+') as stats_file:
+                if fcntl is not None:
+                    fcntl.flock(stats_file, fcntl.LOCK_EX)
+                totals = read_totals(stats_file)
+                if hit is not None:
+                    totals[0 if hit else 1] += 1
+                totals[2] += evicted
+                stats_file.seek(0)
+                stats_file.truncate()
+                stats_file.write(' '.join(str(n) for n in totals) + '\n')
+        except OSError:
+            self.errors += 1
+
+
+    def stats(self):
+        """Returns a dictionary of cache statistics (this run and the
+        totals of all runs).
+
+        """
+        hits, misses, evictions = self.totals()
+        entries = self.entries()
+        lookups = hits + misses
+        return {
+            'cache hits': self.hits,
+            'cache misses': self.misses,
+            'cache evictions': self.evictions,
+            'cache errors': self.errors,
+            'cache total hits': hits,
+            'cache total misses': misses,
+            'cache total evictions': evictions,
+            'cache hit rate': round(hits / lookups, 3) if lookups else 0.0,
+            'cache entries': len(entries),
+            'cache size (bytes)': sum(size for _, size, _ in entries),
+        }
@@ -9,44 +9,190 @@ CLASS: CPSC 326
 from mypl_token import *
 from mypl_ast import *
 from mypl_var_table import *
+from mypl_symbol_table import SymbolTable
 from mypl_frame import *
 from mypl_opcode import *
 from mypl_vm import *
 
 
+# (generic opcode, checked operand type) -> typed opcode
+TYPED_OPCODES = {
+    (OpCode.ADD, 'int'): OpCode.ADDI,
+    (OpCode.ADD, 'double'): OpCode.ADDD,
+    (OpCode.ADD, 'string'): OpCode.ADDS,
+    (OpCode.SUB, 'int'): OpCode.SUBI,
+    (OpCode.SUB, 'double'): OpCode.SUBD,
+    (OpCode.MUL, 'int'): OpCode.MULI,
+    (OpCode.MUL, 'double'): OpCode.MULD,
+    (OpCode.DIV, 'int'): OpCode.DIVI,
+    (OpCode.DIV, 'double'): OpCode.DIVD,
+    (OpCode.CMPLT, 'int'): OpCode.CMPLTI,
+    (OpCode.CMPLE, 'int'): OpCode.CMPLEI,
+}
+
+
 class CodeGenerator (Visitor):
 
-    def __init__(self, vm):
+    def __init__(self, vm, typed=True):
         """Creates a new Code Generator given a VM. 
         
         Args:
             vm -- The target vm.
+            typed -- If false, only use the generic operator opcodes.
         """
         # the vm to add frames to
         self.vm = vm
+        # true if typed operator opcodes are used
+        self.typed = typed
         # the current frame template being generated
         self.curr_template = None
         # for var -> index mappings wrt to environments
         self.var_table = VarTable()
         # struct name -> StructDef for struct field info
         self.struct_defs = {}
+        # struct name -> {field name -> (offset, DataType)}
+        self.struct_layouts = {}
+        # var -> DataType mappings (for resolving field offsets)
+        self.var_types = SymbolTable()
+        # function name -> FunDef for tail call detection
+        self.fun_defs = {}
+        # ids of the CallExpr nodes in tail position of the current function
+        self.tail_calls = set()
 
     
     def add_instr(self, instr):
         """Helper function to add an instruction to the current template."""
         self.curr_template.instructions.append(instr)
 
+
+    def add_typed_instr(self, instr, expr):
+        """Helper function to add an operator instruction, using the typed
+        version of it if the semantic checker recorded the operand type.
+
+        """
+        if self.typed and expr.op_type is not None:
+            key = (instr.opcode, expr.op_type.type_name.lexeme)
+            if key in TYPED_OPCODES:
+                instr = VMInstr(TYPED_OPCODES[key])
+        self.add_instr(instr)
+
+
+    def gen_stmt(self, stmt):
+        """Helper function to generate code for a statement. The value a
+        call statement leaves on the operand stack is popped, so it does
+        not pile up (and keep heap objects alive) in loops. (A generator,
+        used with yield from by the visit functions.)
+
+        """
+        yield stmt
+        if (type(stmt) is CallExpr and stmt.fun_name.lexeme != 'print' and
+                id(stmt) not in self.tail_calls):
+            self.add_instr(POP())
+
+
+    def may_be_null(self, expr):
+        """True if an expression can evaluate to null, i.e., it is a
+        (possibly parenthesized) variable, call, or null value rather
+        than an operator's result or a non-null literal.
+
+        """
+        while not expr.not_op and expr.op is None:
+            if type(expr.first) is SimpleTerm:
+                rvalue = expr.first.rvalue
+                return (type(rvalue) is not SimpleRValue or
+                        rvalue.value.token_type == TokenType.NULL_VAL)
+            expr = expr.first.expr
+        return False
+
+
+    def is_void(self, fun_name):
+        """Helper function that returns true if fun_name is a user-defined
+        function with a void return type.
+
+        """
+        fun_def = self.fun_defs.get(fun_name)
+        return fun_def is not None and fun_def.return_type.type_name.lexeme == 'void'
+
+
+    def find_tail_calls(self, stmts):
+        """Helper function to record the void call statements in tail
+        position of a void function body (the last statement, looking into
+        each branch of a final if statement).
+
+        """
+        pending = [stmts]
+        while pending:
+            stmts = pending.pop()
+            if not stmts:
+                continue
+            last = stmts[-1]
+            if type(last) is CallExpr and self.is_void(last.fun_name.lexeme):
+                self.tail_calls.add(id(last))
+            elif type(last) is IfStmt:
+                for basic_if in [last.if_part] + last.else_ifs:
+                    pending.append(basic_if.stmts)
+                pending.append(last.else_stmts)
+
+
+    def add_var(self, var_def):
+        """Helper function to add a variable (and its type) to the current
+        environment.
+
+        """
+        self.var_table.add(var_def.var_name.lexeme)
+        self.var_types.add(var_def.var_name.lexeme, var_def.data_type)
+
+
+    def push_environment(self):
+        """Helper function to start a new variable environment."""
+        self.var_table.push_environment()
+        self.var_types.push_environment()
+
+
+    def pop_environment(self):
+        """Helper function to end the current variable environment."""
+        self.var_table.pop_environment()
+        self.var_types.pop_environment()
+
+
+    def field_info(self, data_type, field_name):
+        """Returns the slot offset and DataType of a struct field.
+
+        Args:
+            data_type -- The (struct) type of the object being accessed.
+            field_name -- The name of the field.
+
+        """
+        return self.struct_layouts[data_type.type_name.lexeme][field_name]
+
+
+    def element_type(self, data_type, var_ref):
+        """Returns the type of a path element after its optional array
+        index is applied.
+
+        """
+        if var_ref.array_expr != None:
+            return DataType(False, data_type.type_name)
+        return data_type
+
         
     def visit_program(self, program):
+        for fun_def in program.fun_defs:
+            self.fun_defs[fun_def.fun_name.lexeme] = fun_def
         for struct_def in program.struct_defs:
-            struct_def.accept(self)
+            walk(self, struct_def)
         for fun_def in program.fun_defs:
-            fun_def.accept(self)
+            walk(self, fun_def)
 
     
     def visit_struct_def(self, struct_def):
         # remember the struct def for later
         self.struct_defs[struct_def.struct_name.lexeme] = struct_def
+        # fields are stored in declaration order, one slot each
+        layout = {}
+        for offset, field in enumerate(struct_def.fields):
+            layout[field.var_name.lexeme] = (offset, field.data_type)
+        self.struct_layouts[struct_def.struct_name.lexeme] = layout
 
         
     def visit_fun_def(self, fun_def):
@@ -55,15 +201,18 @@ class CodeGenerator (Visitor):
         frame = VMFrameTemplate(fun_def.fun_name.lexeme, len(fun_def.params), [])
         self.curr_template = frame
 
-        self.var_table.push_environment()
+        self.push_environment()
+        self.tail_calls = set()
+        if fun_def.return_type.type_name.lexeme == 'void':
+            self.find_tail_calls(fun_def.stmts)
         
         for param in fun_def.params:
-            self.var_table.add(param.var_name.lexeme)
+            self.add_var(param)
             index = self.var_table.get(param.var_name.lexeme)
             self.add_instr(STORE(index))
         
         for stmt in fun_def.stmts:
-            stmt.accept(self)
+            yield from self.gen_stmt(stmt)
         
         if fun_def.stmts == []  or type(fun_def.stmts[-1]) != ReturnStmt:
             self.add_instr(PUSH(None))
@@ -71,7 +220,7 @@ class CodeGenerator (Visitor):
         
 
 
-        self.var_table.pop_environment()
+        self.pop_environment()
 
         self.vm.add_frame_template(frame)
 
@@ -84,8 +233,18 @@ class CodeGenerator (Visitor):
     def visit_return_stmt(self, return_stmt):
         # TODO
 
+        # returning a call's value: the callee can take over the frame
+        expr = return_stmt.expr
+        if (expr.op is None and not expr.not_op and
+                type(expr.first) is SimpleTerm and
+                type(expr.first.rvalue) is CallExpr and
+                expr.first.rvalue.fun_name.lexeme in self.fun_defs):
+            self.tail_calls.add(id(expr.first.rvalue))
+            yield expr
+            return
+
         # expr puts val on stack
-        return_stmt.expr.accept(self)
+        yield return_stmt.expr
         self.add_instr(RET())
 
         
@@ -94,9 +253,9 @@ class CodeGenerator (Visitor):
 
         # add var name, evaluate
         var_name = var_decl.var_def.var_name.lexeme
-        self.var_table.add(var_name)
+        self.add_var(var_decl.var_def)
         if var_decl.expr != None:
-            var_decl.expr.accept(self)
+            yield var_decl.expr
         else:
             self.add_instr(PUSH(None))
 
@@ -109,52 +268,65 @@ class CodeGenerator (Visitor):
     def visit_assign_stmt(self, assign_stmt):
         # TODO
         index = self.var_table.get(assign_stmt.lvalue[0].var_name.lexeme)
-        self.add_instr(LOAD(index))
+        # the variable itself is only needed on the stack for paths and
+        # array element assignments
+        if len(assign_stmt.lvalue) > 1 or assign_stmt.lvalue[0].array_expr != None:
+            self.add_instr(LOAD(index))
        
 
         if len(assign_stmt.lvalue) > 1 :
             
             # if array index on first var
             if assign_stmt.lvalue[0].array_expr != None:
-                assign_stmt.lvalue[0].array_expr.accept(self)
+                yield assign_stmt.lvalue[0].array_expr
                 
                 self.add_instr(GETI())
             
+            # type of the object the next field is read from
+            var_type = self.var_types.get(assign_stmt.lvalue[0].var_name.lexeme)
+            curr_type = self.element_type(var_type, assign_stmt.lvalue[0])
+
             # iterate over path
             i = 1
             while i < len(assign_stmt.lvalue) - 1:
-                self.add_instr(GETF(assign_stmt.lvalue[i].var_name.lexeme))
+                field_name = assign_stmt.lvalue[i].var_name.lexeme
+                offset, field_type = self.field_info(curr_type, field_name)
+                self.add_instr(GETF(offset, field_name))
+                curr_type = self.element_type(field_type, assign_stmt.lvalue[i])
                 
 
                 # if array index in middle
                 if assign_stmt.lvalue[i].array_expr != None:
-                    assign_stmt.lvalue[i].array_expr.accept(self)
+                    yield assign_stmt.lvalue[i].array_expr
                     self.add_instr(GETI())
                     
                 i = i + 1
             
+            field_name = assign_stmt.lvalue[i].var_name.lexeme
+            offset, field_type = self.field_info(curr_type, field_name)
+
             # path ends in array
             if assign_stmt.lvalue[i].array_expr != None:
-                self.add_instr(GETF(assign_stmt.lvalue[i].var_name.lexeme))
-                assign_stmt.lvalue[i].array_expr.accept(self)
-                assign_stmt.expr.accept(self)
+                self.add_instr(GETF(offset, field_name))
+                yield assign_stmt.lvalue[i].array_expr
+                yield assign_stmt.expr
                 self.add_instr(SETI())
         
             # path doesnt end with array
             else:
-                assign_stmt.expr.accept(self)
-                self.add_instr(SETF(assign_stmt.lvalue[i].var_name.lexeme))
+                yield assign_stmt.expr
+                self.add_instr(SETF(offset, field_name))
        
         # single var case
         if len(assign_stmt.lvalue) == 1:
            
             if assign_stmt.lvalue[0].array_expr == None:
-                assign_stmt.expr.accept(self)
+                yield assign_stmt.expr
                 self.add_instr(STORE(index))
             else:
                 
-                assign_stmt.lvalue[0].array_expr.accept(self)
-                assign_stmt.expr.accept(self)
+                yield assign_stmt.lvalue[0].array_expr
+                yield assign_stmt.expr
                 self.add_instr(SETI())
                 
 
@@ -168,43 +340,43 @@ class CodeGenerator (Visitor):
         
         # place to jump to before condition
         start = len(self.curr_template.instructions)
-        while_stmt.condition.accept(self)
-        self.var_table.push_environment()
+        yield while_stmt.condition
+        self.push_environment()
 
         instr_idx = len(self.curr_template.instructions)
         jump_instr = JMPF(-1)
         self.add_instr(jump_instr) 
 
         for stmt in while_stmt.stmts:
-            stmt.accept(self)
+            yield from self.gen_stmt(stmt)
         
         
         self.add_instr(JMP(start))
         self.curr_template.instructions[instr_idx] = JMPF(len(self.curr_template.instructions))
         self.add_instr(NOP())
 
-        self.var_table.pop_environment()
+        self.pop_environment()
 
         
     def visit_for_stmt(self, for_stmt):
         # TODO
-        self.var_table.push_environment()
+        self.push_environment()
 
-        for_stmt.var_decl.accept(self)
+        yield for_stmt.var_decl
 
         start = len(self.curr_template.instructions)
-        for_stmt.condition.accept(self)
+        yield for_stmt.condition
         
 
         instr_idx = len(self.curr_template.instructions)
         self.add_instr(JMPF(-1))
 
         for stmt in for_stmt.stmts:
-            stmt.accept(self)
+            yield from self.gen_stmt(stmt)
 
-        for_stmt.assign_stmt.accept(self)
+        yield for_stmt.assign_stmt
         
-        self.var_table.pop_environment()
+        self.pop_environment()
         
         self.add_instr(JMP(start))
         
@@ -222,11 +394,13 @@ class CodeGenerator (Visitor):
         
 
         # first if
-        if_stmt.if_part.condition.accept(self)
+        yield if_stmt.if_part.condition
         jmpf_idxs.append(len(self.curr_template.instructions))
         self.add_instr(JMPF(-1))
+        self.push_environment()
         for stmt in if_stmt.if_part.stmts:
-            stmt.accept(self)
+            yield from self.gen_stmt(stmt)
+        self.pop_environment()
         jmp_idxs.append(len(self.curr_template.instructions))
         self.add_instr(JMP(-1))
         jmpf_to.append(len(self.curr_template.instructions))
@@ -235,12 +409,14 @@ class CodeGenerator (Visitor):
         # else if s
         for else_if in if_stmt.else_ifs:
             
-            else_if.condition.accept(self)
+            yield else_if.condition
             
             jmpf_idxs.append(len(self.curr_template.instructions))
             self.add_instr(JMPF(-1))
+            self.push_environment()
             for stmt in else_if.stmts:
-                stmt.accept(self)
+                yield from self.gen_stmt(stmt)
+            self.pop_environment()
             jmp_idxs.append(len(self.curr_template.instructions))
             self.add_instr(JMP(-1))
             jmpf_to.append(len(self.curr_template.instructions))
@@ -248,8 +424,10 @@ class CodeGenerator (Visitor):
         
         
         # elses
+        self.push_environment()
         for stmt in if_stmt.else_stmts:
-            stmt.accept(self)
+            yield from self.gen_stmt(stmt)
+        self.pop_environment()
         
         
 
@@ -268,7 +446,7 @@ class CodeGenerator (Visitor):
     def visit_call_expr(self, call_expr):
         # TODO
         for arg in call_expr.args:
-            arg.accept(self)
+            yield arg
         if call_expr.fun_name.lexeme == "print":
             self.add_instr(WRITE())
         elif call_expr.fun_name.lexeme == "itos":
@@ -289,6 +467,8 @@ class CodeGenerator (Visitor):
             self.add_instr(GETC())
         elif call_expr.fun_name.lexeme == "input":
             self.add_instr(READ())
+        elif id(call_expr) in self.tail_calls:
+            self.add_instr(TCALL(call_expr.fun_name.lexeme))
         else:
             self.add_instr(CALL(call_expr.fun_name.lexeme))
 
@@ -300,59 +480,73 @@ class CodeGenerator (Visitor):
         
         # accept things(resolve to one value on operand stack) then add operand
         if expr.op != None:
+            # short circuit: the rest is only evaluated if the first
+            # value does not already decide the result
             if expr.op.token_type == TokenType.AND:
-                expr.first.accept(self)
-                expr.rest.accept(self)
-                self.add_instr(AND())
+                yield expr.first
+                jmp_idx = len(self.curr_template.instructions)
+                self.add_instr(JMPFP(-1))
+                yield expr.rest
+                if self.may_be_null(expr.rest):
+                    # (true and x is x, checked for null like the first)
+                    self.add_instr(PUSH(True))
+                    self.add_instr(AND())
+                self.curr_template.instructions[jmp_idx] = JMPFP(len(self.curr_template.instructions))
+                self.add_instr(NOP())
             elif expr.op.token_type == TokenType.OR:
-                expr.first.accept(self)
-                expr.rest.accept(self)
-                self.add_instr(OR())
+                yield expr.first
+                jmp_idx = len(self.curr_template.instructions)
+                self.add_instr(JMPTP(-1))
+                yield expr.rest
+                if self.may_be_null(expr.rest):
+                    self.add_instr(PUSH(False))
+                    self.add_instr(OR())
+                self.curr_template.instructions[jmp_idx] = JMPTP(len(self.curr_template.instructions))
+                self.add_instr(NOP())
             elif expr.op.token_type == TokenType.LESS:
-                expr.first.accept(self)
-                expr.rest.accept(self)
-                self.add_instr(CMPLT())
+                yield expr.first
+                yield expr.rest
+                self.add_typed_instr(CMPLT(), expr)
             elif expr.op.token_type == TokenType.LESS_EQ:
-                expr.first.accept(self)
-                expr.rest.accept(self)
-                self.add_instr(CMPLE())
+                yield expr.first
+                yield expr.rest
+                self.add_typed_instr(CMPLE(), expr)
             elif expr.op.token_type == TokenType.GREATER:
-                expr.rest.accept(self)
-                expr.first.accept(self)
-                self.add_instr(CMPLT())
+                yield expr.rest
+                yield expr.first
+                self.add_typed_instr(CMPLT(), expr)
             elif expr.op.token_type == TokenType.GREATER_EQ:
-                expr.rest.accept(self)
-                expr.first.accept(self)
-                self.add_instr(CMPLE())
+                yield expr.rest
+                yield expr.first
+                self.add_typed_instr(CMPLE(), expr)
             elif expr.op.token_type == TokenType.EQUAL:
-                expr.first.accept(self)
-                expr.rest.accept(self)
+                yield expr.first
+                yield expr.rest
                 self.add_instr(CMPEQ())
             elif expr.op.token_type == TokenType.NOT_EQUAL:
-                expr.first.accept(self)
-                expr.rest.accept(self)
-                self.add_instr(CMPEQ())
-                self.add_instr(NOT())
+                yield expr.first
+                yield expr.rest
+                self.add_instr(CMPNE())
             elif expr.op.token_type == TokenType.PLUS:
-                expr.first.accept(self)
-                expr.rest.accept(self)
-                self.add_instr(ADD())
+                yield expr.first
+                yield expr.rest
+                self.add_typed_instr(ADD(), expr)
             elif expr.op.token_type == TokenType.MINUS:
-                expr.first.accept(self)
-                expr.rest.accept(self)
-                self.add_instr(SUB())
+                yield expr.first
+                yield expr.rest
+                self.add_typed_instr(SUB(), expr)
             elif expr.op.token_type == TokenType.DIVIDE:
-                expr.first.accept(self)
-                expr.rest.accept(self)
-                self.add_instr(DIV())
+                yield expr.first
+                yield expr.rest
+                self.add_typed_instr(DIV(), expr)
             elif expr.op.token_type == TokenType.TIMES:
-                expr.first.accept(self)
-                expr.rest.accept(self)
-                self.add_instr(MUL())
+                yield expr.first
+                yield expr.rest
+                self.add_typed_instr(MUL(), expr)
             
         # simple expr case
         else:
-            expr.first.accept(self)
+            yield expr.first
 
             
         # not case+
@@ -370,11 +564,11 @@ class CodeGenerator (Visitor):
 
     
     def visit_simple_term(self, simple_term):
-        simple_term.rvalue.accept(self)
+        yield simple_term.rvalue
 
         
     def visit_complex_term(self, complex_term):
-        complex_term.expr.accept(self)
+        yield complex_term.expr
 
         
     def visit_simple_rvalue(self, simple_rvalue):
@@ -400,16 +594,23 @@ class CodeGenerator (Visitor):
         # struct case
         i = 0
         if new_rvalue.array_expr == None:
-            self.add_instr(ALLOCS())
+            struct_def = self.struct_defs[new_rvalue.type_name.lexeme]
+            # all fields given: build the struct in one instruction
+            if len(new_rvalue.struct_params) == len(struct_def.fields):
+                for param in new_rvalue.struct_params:
+                    yield param
+                self.add_instr(INITS(len(struct_def.fields), new_rvalue.type_name.lexeme))
+                return
+            self.add_instr(ALLOCS(len(struct_def.fields), new_rvalue.type_name.lexeme))
             for param in new_rvalue.struct_params:
                 self.add_instr(DUP())
-                param.accept(self)
-                self.add_instr(SETF(self.struct_defs[new_rvalue.type_name.lexeme].fields[i].var_name.lexeme))
+                yield param
+                self.add_instr(SETF(i, struct_def.fields[i].var_name.lexeme))
                 i = i+1
 
         # array case
         else:
-            new_rvalue.array_expr.accept(self)
+            yield new_rvalue.array_expr
             self.add_instr(ALLOCA())
 
 
@@ -420,16 +621,20 @@ class CodeGenerator (Visitor):
         index = self.var_table.get(var_rvalue.path[0].var_name.lexeme)
         self.add_instr(LOAD(index))
         if var_rvalue.path[0].array_expr != None:
-            var_rvalue.path[0].array_expr.accept(self)
+            yield var_rvalue.path[0].array_expr
             self.add_instr(GETI())
         i = 1
-        # struct = self.struct_defs[var_rvalue.path[0].var_name.lexeme]
+        if len(var_rvalue.path) > 1:
+            var_type = self.var_types.get(var_rvalue.path[0].var_name.lexeme)
+            curr_type = self.element_type(var_type, var_rvalue.path[0])
         while (i < len(var_rvalue.path)):
-            # self.add_instr(LOAD(index))
-            self.add_instr(GETF(var_rvalue.path[i].var_name.lexeme))
+            field_name = var_rvalue.path[i].var_name.lexeme
+            offset, field_type = self.field_info(curr_type, field_name)
+            self.add_instr(GETF(offset, field_name))
+            curr_type = self.element_type(field_type, var_rvalue.path[i])
            
             if var_rvalue.path[i].array_expr != None:
-                var_rvalue.path[i].array_expr.accept(self)
+                yield var_rvalue.path[i].array_expr
                 self.add_instr(GETI())
 
             i = i+1
@@ -0,0 +1,327 @@
+"""Constant folding visitor for MyPL. Runs between the semantic checker
+and the code generator, rewriting Expr nodes in place.
+
+NAME: <Ryan St. Mary>
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+from mypl_token import Token, TokenType
+from mypl_ast import *
+
+
+# binary operators that can be evaluated at compile time
+FOLD_OPS = [TokenType.PLUS, TokenType.MINUS, TokenType.TIMES,
+            TokenType.DIVIDE, TokenType.AND, TokenType.OR, TokenType.LESS,
+            TokenType.LESS_EQ, TokenType.GREATER, TokenType.GREATER_EQ,
+            TokenType.EQUAL, TokenType.NOT_EQUAL]
+
+# operators where a op (b op c) == (a op b) op c for ints and strings
+# (not for doubles, whose rounding depends on the grouping)
+ASSOC_OPS = [TokenType.PLUS, TokenType.TIMES]
+
+
+class ConstantFolder(Visitor):
+    """Visitor implementation that folds constant (literal-only)
+    subexpressions. Expressions that would raise a runtime error (e.g.,
+    divide by zero or null arithmetic) are left as they are so that the
+    error is still reported when the program runs.
+
+    """
+
+    def __init__(self):
+        # number of operators evaluated at compile time
+        self.folded = 0
+
+
+    def stats(self):
+        """Returns a dictionary of folding statistics."""
+        return {'constants folded': self.folded}
+
+
+    #----------------------------------------------------------------------
+    # Helper functions
+    #----------------------------------------------------------------------
+
+    def term_literal(self, term):
+        """Returns the literal token of a SimpleTerm, or None if the term
+        is not a literal.
+
+        Args:
+            term -- The ExprTerm node to check.
+
+        """
+        if isinstance(term, SimpleTerm) and isinstance(term.rvalue, SimpleRValue):
+            return term.rvalue.value
+        return None
+
+
+    def literal(self, expr):
+        """Returns the literal token an expression consists of, or None if
+        the expression is not a single literal.
+
+        Args:
+            expr -- The Expr node to check.
+
+        """
+        if expr is None or expr.op is not None or expr.not_op:
+            return None
+        return self.term_literal(expr.first)
+
+
+    def value(self, token):
+        """Returns the value the VM uses for a literal token (matches
+        CodeGenerator.visit_simple_rvalue).
+
+        Args:
+            token -- A literal token.
+
+        """
+        if token.token_type == TokenType.INT_VAL:
+            return int(token.lexeme)
+        elif token.token_type == TokenType.DOUBLE_VAL:
+            return float(token.lexeme)
+        elif token.token_type == TokenType.STRING_VAL:
+            return token.lexeme.replace('\\n', '\n').replace('\\t', '\t')
+        elif token.token_type == TokenType.BOOL_VAL:
+            return token.lexeme == 'true'
+        return None
+
+
+    def make_literal(self, value, token):
+        """Returns a literal token for the given int, double, or bool
+        value, positioned at the given token.
+
+        Args:
+            value -- The computed value.
+            token -- The token whose position the new literal takes.
+
+        """
+        if type(value) is bool:
+            token_type = TokenType.BOOL_VAL
+            lexeme = 'true' if value else 'false'
+        elif type(value) is int:
+            token_type = TokenType.INT_VAL
+            lexeme = str(value)
+        else:
+            token_type = TokenType.DOUBLE_VAL
+            lexeme = repr(value)
+        return Token(token_type, lexeme, token.line, token.column)
+
+
+    def evaluate(self, op, left, right):
+        """Evaluates left op right as the VM would. Returns the resulting
+        literal token, or None if the operation cannot be (or should not
+        be) folded.
+
+        Args:
+            op -- The operator token.
+            left -- The left literal token.
+            right -- The right literal token.
+
+        """
+        op_type = op.token_type
+        # strings are joined by lexeme so escapes stay intact; a trailing
+        # backslash could form a new escape with the right-hand side
+        if (op_type == TokenType.PLUS and
+                left.token_type == TokenType.STRING_VAL and
+                right.token_type == TokenType.STRING_VAL):
+            if left.lexeme.endswith('\\'):
+                return None
+            return Token(TokenType.STRING_VAL, left.lexeme + right.lexeme,
+                         left.line, left.column)
+        x = self.value(right)
+        y = self.value(left)
+        if op_type == TokenType.EQUAL:
+            return self.make_literal(y == x, left)
+        elif op_type == TokenType.NOT_EQUAL:
+            return self.make_literal(y != x, left)
+        # every other operator is a runtime error on null
+        if x is None or y is None:
+            return None
+        types = (type(y), type(x))
+        if op_type in [TokenType.AND, TokenType.OR]:
+            if types != (bool, bool):
+                return None
+            if op_type == TokenType.AND:
+                return self.make_literal(y and x, left)
+            return self.make_literal(y or x, left)
+        if types not in [(int, int), (float, float), (str, str)]:
+            return None
+        if op_type == TokenType.LESS:
+            result = y < x
+        elif op_type == TokenType.LESS_EQ:
+            result = y <= x
+        elif op_type == TokenType.GREATER:
+            result = x < y
+        elif op_type == TokenType.GREATER_EQ:
+            result = x <= y
+        elif types == (str, str):
+            return None
+        elif op_type == TokenType.PLUS:
+            result = y + x
+        elif op_type == TokenType.MINUS:
+            result = y - x
+        elif op_type == TokenType.TIMES:
+            result = y * x
+        else:
+            if x == 0:
+                return None
+            result = y / x
+            if type(x) is int:
+                result = int(result)
+        return self.make_literal(result, left)
+
+
+    def fold(self, expr):
+        """Fold the top-level operator of an Expr whose operands have
+        already been folded.
+
+        Args:
+            expr -- The Expr node to rewrite in place.
+
+        """
+        while expr.op is not None and expr.op.token_type in FOLD_OPS:
+            left = self.term_literal(expr.first)
+            if left is None:
+                return
+            right = self.literal(expr.rest)
+            if right is not None:
+                result = self.evaluate(expr.op, left, right)
+                if result is not None:
+                    expr.first = SimpleTerm(SimpleRValue(result))
+                    expr.op = None
+                    expr.rest = None
+                    self.folded += 1
+                return
+            # a op (b op rest) -> (a op b) op rest
+            rest = expr.rest
+            right = self.term_literal(rest.first)
+            if (expr.op.token_type not in ASSOC_OPS or rest.not_op or
+                    right is None or rest.op is None or
+                    rest.op.token_type != expr.op.token_type or
+                    left.token_type != right.token_type or
+                    left.token_type not in [TokenType.INT_VAL, TokenType.STRING_VAL]):
+                return
+            result = self.evaluate(expr.op, left, right)
+            if result is None:
+                return
+            expr.first = SimpleTerm(SimpleRValue(result))
+            expr.rest = rest.rest
+            self.folded += 1
+
+
+    #----------------------------------------------------------------------
+    # Visitor functions
+    #----------------------------------------------------------------------
+
+    def visit_program(self, program):
+        for fun_def in program.fun_defs:
+            walk(self, fun_def)
+
+
+    def visit_struct_def(self, struct_def):
+        pass
+
+
+    def visit_fun_def(self, fun_def):
+        for stmt in fun_def.stmts:
+            yield stmt
+
+
+    def visit_return_stmt(self, return_stmt):
+        yield return_stmt.expr
+
+
+    def visit_var_decl(self, var_decl):
+        if var_decl.expr is not None:
+            yield var_decl.expr
+
+
+    def visit_assign_stmt(self, assign_stmt):
+        for var_ref in assign_stmt.lvalue:
+            if var_ref.array_expr is not None:
+                yield var_ref.array_expr
+        yield assign_stmt.expr
+
+
+    def visit_while_stmt(self, while_stmt):
+        yield while_stmt.condition
+        for stmt in while_stmt.stmts:
+            yield stmt
+
+
+    def visit_for_stmt(self, for_stmt):
+        yield for_stmt.var_decl
+        yield for_stmt.condition
+        yield for_stmt.assign_stmt
+        for stmt in for_stmt.stmts:
+            yield stmt
+
+
+    def visit_if_stmt(self, if_stmt):
+        for basic_if in [if_stmt.if_part] + if_stmt.else_ifs:
+            yield basic_if.condition
+            for stmt in basic_if.stmts:
+                yield stmt
+        for stmt in if_stmt.else_stmts:
+            yield stmt
+
+
+    def visit_call_expr(self, call_expr):
+        for arg in call_expr.args:
+            yield arg
+
+
+    def visit_expr(self, expr):
+        yield expr.first
+        # (literal) -> literal
+        if isinstance(expr.first, ComplexTerm):
+            token = self.literal(expr.first.expr)
+            if token is not None:
+                expr.first = SimpleTerm(SimpleRValue(token))
+        if expr.rest is not None:
+            yield expr.rest
+        self.fold(expr)
+        # not literal -> literal
+        token = self.term_literal(expr.first)
+        if (expr.not_op and expr.op is None and token is not None and
+                token.token_type == TokenType.BOOL_VAL):
+            expr.not_op = False
+            expr.first = SimpleTerm(SimpleRValue(
+                self.make_literal(token.lexeme != 'true', token)))
+            self.folded += 1
+
+
+    def visit_data_type(self, data_type):
+        pass
+
+
+    def visit_var_def(self, var_def):
+        pass
+
+
+    def visit_simple_term(self, simple_term):
+        yield simple_term.rvalue
+
+
+    def visit_complex_term(self, complex_term):
+        yield complex_term.expr
+
+
+    def visit_simple_rvalue(self, simple_rvalue):
+        pass
+
+
+    def visit_new_rvalue(self, new_rvalue):
+        if new_rvalue.array_expr is not None:
+            yield new_rvalue.array_expr
+        for param in new_rvalue.struct_params or []:
+            yield param
+
+
+    def visit_var_rvalue(self, var_rvalue):
+        for var_ref in var_rvalue.path:
+            if var_ref.array_expr is not None:
+                yield var_ref.array_expr
@@ -65,5 +65,28 @@ def VMError(message):
 
 
 
+def BytecodeError(message):
+    """Create a MyPLError for a compiled (.myplc) file exception.
+    
+    Args:
+        message -- The error message.
+
+    """
+    return MyPLError('Bytecode Error: ' + message)
+
+
+
 
 
+
+
+
+def TranslationError(message):
+    """Create a MyPLError for a program the Python backend cannot
+    translate.
+
+    Args:
+        message -- The error message.
+
+    """
+    return MyPLError('Translation Error: ' + message)
@@ -8,6 +8,7 @@ CLASS: CPSC 326
 """
 
 
+from array import array
 from dataclasses import dataclass, field
 from typing import Any
 from mypl_opcode import OpCode
@@ -20,8 +21,50 @@ class VMFrameTemplate:
     function_name: str
     arg_count: int
     instructions: list['VMInstr'] = field(default_factory=list) 
+    # linked (compact) form, filled in by link()
+    opcodes: array = None        # opcode value of each instruction
+    operands: array = None       # index into consts of each operand
+    consts: list[Any] = None     # constant pool for the operands
+    comments: dict = None        # instruction index -> comment
+    # tiered execution (see mypl_jit.py)
+    calls: int = 0               # calls made through the VM
+    native: Any = None           # compiled Python function, once hot
+    loops: int = 0               # backward jumps taken by the interpreter
+    osr: dict = field(default_factory=dict)  # loop header -> OSR version
+
+    def is_linked(self):
+        """True if the template has been converted by link()."""
+        return self.opcodes is not None
+
+    def link(self):
+        """Convert the instruction list into the compact linked form.
+
+        Builds parallel arrays of opcode values and constant pool
+        indexes (one entry per instruction) and replaces the list of
+        VMInstr objects with a read-only view that decodes instructions
+        on demand, so printing and error reporting keep working.
+
+        """
+        if self.is_linked():
+            return
+        self.opcodes = array('B')
+        self.operands = array('I')
+        self.consts = []
+        self.comments = {}
+        pool = {}
+        for i, instr in enumerate(self.instructions):
+            key = const_key(instr.operand)
+            if key not in pool:
+                pool[key] = len(self.consts)
+                self.consts.append(instr.operand)
+            self.opcodes.append(instr.opcode.value)
+            self.operands.append(pool[key])
+            if instr.comment:
+                self.comments[i] = instr.comment
+        self.instructions = LinkedInstructions(self)
 
     
+
 @dataclass
 class VMFrame:
     """A VM function-call frame."""
@@ -45,6 +88,42 @@ class VMInstr:
         s += f'  // {self.comment}' if self.comment else ''
         return s
 
+
+class LinkedInstructions:
+    """Read-only sequence of the instructions of a linked template."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __len__(self):
+        return len(self.template.opcodes)
+
+    def __getitem__(self, index):
+        t = self.template
+        if index < 0:
+            index += len(t.opcodes)
+        return VMInstr(OpCode(t.opcodes[index]), t.consts[t.operands[index]],
+                       t.comments.get(index, ''))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def const_key(value):
+    """Returns a constant pool key for an operand value. The type is part
+    of the key so that equal values of different types (e.g., 1, 1.0,
+    and True) get separate pool entries, and doubles are keyed by repr
+    so that 0.0 and -0.0 (which are ==) do too.
+
+    """
+    if type(value) is tuple:
+        return (tuple, tuple(const_key(v) for v in value))
+    if type(value) is float:
+        return (float, repr(value))
+    return (type(value), value)
+
+
 # Helper functions for creating specific instruction types
 
 def PUSH(value):
@@ -92,15 +171,84 @@ def OR():
 def NOT():
     return VMInstr(OpCode.NOT)
 
+def ADDI():
+    return VMInstr(OpCode.ADDI)
+
+def ADDD():
+    return VMInstr(OpCode.ADDD)
+
+def ADDS():
+    return VMInstr(OpCode.ADDS)
+
+def SUBI():
+    return VMInstr(OpCode.SUBI)
+
+def SUBD():
+    return VMInstr(OpCode.SUBD)
+
+def MULI():
+    return VMInstr(OpCode.MULI)
+
+def MULD():
+    return VMInstr(OpCode.MULD)
+
+def DIVI():
+    return VMInstr(OpCode.DIVI)
+
+def DIVD():
+    return VMInstr(OpCode.DIVD)
+
+def CMPLTI():
+    return VMInstr(OpCode.CMPLTI)
+
+def CMPLEI():
+    return VMInstr(OpCode.CMPLEI)
+
+def QADDI():
+    return VMInstr(OpCode.QADDI)
+
+def QADDD():
+    return VMInstr(OpCode.QADDD)
+
+def QADDS():
+    return VMInstr(OpCode.QADDS)
+
+def QSUBI():
+    return VMInstr(OpCode.QSUBI)
+
+def QSUBD():
+    return VMInstr(OpCode.QSUBD)
+
+def QMULI():
+    return VMInstr(OpCode.QMULI)
+
+def QMULD():
+    return VMInstr(OpCode.QMULD)
+
+def QCMPLTI():
+    return VMInstr(OpCode.QCMPLTI)
+
+def QCMPLEI():
+    return VMInstr(OpCode.QCMPLEI)
+
 def JMP(offset):
     return VMInstr(OpCode.JMP, offset)
 
 def JMPF(offset):
     return VMInstr(OpCode.JMPF, offset)
 
+def JMPFP(offset):
+    return VMInstr(OpCode.JMPFP, offset)
+
+def JMPTP(offset):
+    return VMInstr(OpCode.JMPTP, offset)
+
 def CALL(fun_name):
     return VMInstr(OpCode.CALL, fun_name)
 
+def TCALL(fun_name):
+    return VMInstr(OpCode.TCALL, fun_name)
+
 def RET():
     return VMInstr(OpCode.RET)    
 
@@ -125,14 +273,17 @@ def TODBL():
 def TOSTR():
     return VMInstr(OpCode.TOSTR)
 
-def ALLOCS():
-    return VMInstr(OpCode.ALLOCS)
+def ALLOCS(field_count, struct_name=''):
+    return VMInstr(OpCode.ALLOCS, field_count, struct_name)
+
+def SETF(offset, field_name=''):
+    return VMInstr(OpCode.SETF, offset, field_name)
 
-def SETF(field_name):
-    return VMInstr(OpCode.SETF, field_name)
+def GETF(offset, field_name=''):
+    return VMInstr(OpCode.GETF, offset, field_name)
 
-def GETF(field_name):
-    return VMInstr(OpCode.GETF, field_name)
+def INITS(field_count, struct_name=''):
+    return VMInstr(OpCode.INITS, field_count, struct_name)
 
 def ALLOCA():
     return VMInstr(OpCode.ALLOCA)
@@ -143,6 +294,27 @@ def SETI():
 def GETI():
     return VMInstr(OpCode.GETI)
 
+def JNLTVV(i, j, offset):
+    return VMInstr(OpCode.JNLTVV, (i, j, offset))
+
+def JNLEVV(i, j, offset):
+    return VMInstr(OpCode.JNLEVV, (i, j, offset))
+
+def JNLTVK(i, k, offset):
+    return VMInstr(OpCode.JNLTVK, (i, k, offset))
+
+def JNLEVK(i, k, offset):
+    return VMInstr(OpCode.JNLEVK, (i, k, offset))
+
+def INCL(i, k):
+    return VMInstr(OpCode.INCL, (i, k))
+
+def DECL(i, k):
+    return VMInstr(OpCode.DECL, (i, k))
+
+def LOADGETF(i, offset, field_name=''):
+    return VMInstr(OpCode.LOADGETF, (i, offset), field_name)
+
 def DUP():
     return VMInstr(OpCode.DUP)
 
@@ -0,0 +1,53 @@
+"""Runtime heap objects for the MyPL VM: object ids for the 'oid' heap
+mode and the objects themselves for the 'ref' heap mode.
+
+NAME: <Ryan St. Mary>
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+
+class Oid(int):
+    """An object id ('oid' heap mode). Ids are ints (they print and
+    compare like ints) of their own type, so the garbage collector can
+    tell references from program ints with the same value.
+
+    """
+    __slots__ = ()
+
+
+class VMArray(list):
+    """An array object. Unlike lists, arrays are == only if they are the
+    same object (MyPL compares references, and comparing contents is
+    slow and recurses through cycles).
+
+    """
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+    def __repr__(self):
+        return f'array@{id(self):x}'
+
+
+class VMStruct(list):
+    """A struct object, one slot per field in declaration order. Like
+    arrays, structs are == only if they are the same object.
+
+    """
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+    def __repr__(self):
+        return f'struct@{id(self):x}'
+
@@ -6,48 +6,156 @@ CLASS: CPSC 326
 
 """
 
+import codecs
+import mmap
+
+
+# bytes of standard input read (and decoded) at a time
+CHUNK_SIZE = 64 * 1024
+
 
 class StdInWrapper:
-    """Standard input wrapper for reading and peeking."""
+    """Standard input wrapper for reading and peeking.
 
-    def __init__(self, stream):
+    Reads standard input a chunk at a time, decodes each chunk with an
+    incremental UTF-8 decoder (so characters split across chunks decode
+    correctly), and serves characters from the decoded chunk.
+
+    """
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
         self.stream = stream.buffer
-        
+        # read1 returns what is available instead of waiting for a full
+        # chunk (for interactive input)
+        self.read_bytes = getattr(self.stream, 'read1', self.stream.read)
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''               # the decoded chunk being served
+        self.pos = 0                 # index of the next character in text
+        self.at_eof = False
+
+    def fill(self):
+        """Decode chunks until there is a character to serve. Returns
+        false at the end of the input.
+
+        """
+        while self.pos >= len(self.text):
+            if self.at_eof:
+                return False
+            data = self.read_bytes(self.chunk_size)
+            self.at_eof = not data
+            self.text = self.decoder.decode(data, final=self.at_eof)
+            self.pos = 0
+        return True
+
     def read_char(self):
         """Returns and removes a single character in stream."""
-        return self.stream.read(1).decode('utf-8')
+        if self.pos >= len(self.text) and not self.fill():
+            return ''
+        ch = self.text[self.pos]
+        self.pos += 1
+        return ch
 
     def peek_char(self):
         """Returns next character in stream to be read."""
-        if not self.stream.peek(1):
+        if self.pos >= len(self.text) and not self.fill():
             return ''
-        return self.stream.peek(1).decode('utf-8')[0]
+        return self.text[self.pos]
+
+    def read_rest(self):
+        """Returns and removes the rest of the stream."""
+        rest = [self.text[self.pos:]]
+        if not self.at_eof:
+            rest.append(self.decoder.decode(self.stream.read(), final=True))
+            self.at_eof = True
+        self.text = ''
+        self.pos = 0
+        return ''.join(rest)
 
     def close(self):
         """Closes the stream."""
         pass # nothing to do
 
 
-    
+
 class FileWrapper:
-    """File input wrapper for reading and peeking."""
+    """File input wrapper for reading and peeking.
+
+    The whole file is read once (memory-mapped and decoded when it is a
+    file on disk) and characters are then served from memory by index.
+
+    """
 
     def __init__(self, stream):
         self.stream = stream
+        self.text = read_text(stream)
+        self.pos = 0                 # index of the next character in text
 
     def read_char(self):
         """Returns and removes a single character in stream."""
-        return self.stream.read(1)
+        pos = self.pos
+        if pos >= len(self.text):
+            return ''
+        self.pos = pos + 1
+        return self.text[pos]
 
     def peek_char(self):
         """Returns next character in stream to be read."""
-        loc = self.stream.tell()
-        ch = self.read_char()
-        self.stream.seek(loc)
-        return ch
+        if self.pos >= len(self.text):
+            return ''
+        return self.text[self.pos]
+
+    def read_rest(self):
+        """Returns and removes the rest of the stream."""
+        rest = self.text[self.pos:]
+        # (the wrapper no longer keeps the text)
+        self.text = ''
+        self.pos = 0
+        return rest
 
     def close(self):
         """Closes the stream."""
         self.stream.close()
-        
+
+
+class TextWrapper(FileWrapper):
+    """Wrapper for reading and peeking over text already in memory."""
+
+    def __init__(self, text, pos=0):
+        self.stream = None
+        self.text = text
+        self.pos = pos               # index of the next character in text
+
+    def close(self):
+        """Closes the stream."""
+        pass # nothing to do
+
+
+def read_text(stream):
+    """Returns the rest of the text of a (text) stream. Files on disk are
+    memory-mapped and decoded in one step; other streams are read.
+
+    Args:
+        stream -- The text stream.
+
+    """
+    try:
+        encoding = stream.encoding
+        fd = stream.fileno()
+        start = stream.tell()
+    except (AttributeError, OSError, ValueError):
+        return stream.read()
+    if start != 0 or encoding.replace('-', '').lower() != 'utf8':
+        return stream.read()
+    try:
+        mapped = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # empty files and files that cannot be mapped (pipes, ...)
+        return stream.read()
+    with mapped:
+        text = str(mapped, 'utf-8')
+    # the newline translation reading the file as text would do
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
 
@@ -0,0 +1,631 @@
+"""Tiered JIT for the MyPL VM.
+
+Frame templates that are called often enough are translated to the
+source of a Python function, compiled, and from then on called natively
+instead of being interpreted. Operand stack slots and variables become
+Python locals (s0, s1, ... and v0, v1, ...; the stack depth before each
+instruction is known statically) and each basic block becomes an
+"if pc == ..." case of a loop, so jumps are assignments to pc.
+
+Functions that are not called often but loop for a long time (like
+main) are compiled on-stack: once a loop's backward jump has been taken
+often enough, a version of the function that starts at the loop header
+is compiled and the running frame's variables and operand stack are
+moved into it (on-stack replacement, OSR).
+
+Compiled code does not check for runtime errors itself: an operation on
+bad values (null, a bad index, ...) raises a Python exception, and the
+function deoptimizes by handing its pc, variables, and operand stack to
+the interpreter. The interpreter then re-runs the failing instruction
+and reports the error exactly as it would have without the JIT.
+
+NAME: <Ryan St. Mary>
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import math
+import sys
+import time
+from dataclasses import dataclass, field
+from mypl_error import *
+from mypl_opcode import *
+from mypl_frame import *
+from mypl_heap import VMArray, VMStruct
+
+
+# calls of a function before it is compiled
+JIT_THRESHOLD = 100
+
+# backward jumps taken in a function before its loop is compiled on-stack
+JIT_OSR_THRESHOLD = 1000
+
+# one in this many calls through the VM is timed (for the speedup stats)
+JIT_SAMPLE_RATE = 16
+
+# compiled calls nested deeper than this run in the interpreter instead
+# (compiled calls are Python calls, and deep Python recursion overflows
+# the C stack)
+JIT_NATIVE_DEPTH = 1000
+
+# Python call depth allowed while compiled code runs (room for a few
+# Python frames per compiled call up to JIT_NATIVE_DEPTH)
+JIT_RECURSION_LIMIT = 10000
+
+# file name prefix of compiled code (to find its frames)
+JIT_FILENAME = '<jit '
+
+# opcode -> Python operator (generic, typed, and quickened versions)
+PYTHON_OPS = {
+    OpCode.ADD: '+', OpCode.ADDI: '+', OpCode.ADDD: '+', OpCode.ADDS: '+',
+    OpCode.QADDI: '+', OpCode.QADDD: '+', OpCode.QADDS: '+',
+    OpCode.SUB: '-', OpCode.SUBI: '-', OpCode.SUBD: '-',
+    OpCode.QSUBI: '-', OpCode.QSUBD: '-',
+    OpCode.MUL: '*', OpCode.MULI: '*', OpCode.MULD: '*',
+    OpCode.QMULI: '*', OpCode.QMULD: '*',
+    OpCode.CMPLT: '<', OpCode.CMPLTI: '<', OpCode.QCMPLTI: '<',
+    OpCode.CMPLE: '<=', OpCode.CMPLEI: '<=', OpCode.QCMPLEI: '<=',
+}
+
+# opcode -> (values popped, values pushed) for the fixed-size opcodes
+STACK_EFFECTS = {op: (2, 1) for op in PYTHON_OPS}
+STACK_EFFECTS.update({
+    OpCode.PUSH: (0, 1), OpCode.POP: (1, 0), OpCode.STORE: (1, 0),
+    OpCode.LOAD: (0, 1), OpCode.DIV: (2, 1), OpCode.DIVI: (2, 1),
+    OpCode.DIVD: (2, 1), OpCode.CMPEQ: (2, 1), OpCode.CMPNE: (2, 1),
+    OpCode.AND: (2, 1), OpCode.OR: (2, 1), OpCode.NOT: (1, 1),
+    OpCode.JMP: (0, 0), OpCode.JMPF: (1, 0), OpCode.JMPFP: (0, 0),
+    OpCode.JMPTP: (0, 0), OpCode.RET: (1, 0), OpCode.WRITE: (1, 0),
+    OpCode.READ: (0, 1), OpCode.LEN: (1, 1), OpCode.GETC: (2, 1),
+    OpCode.TOINT: (1, 1), OpCode.TODBL: (1, 1), OpCode.TOSTR: (1, 1),
+    OpCode.ALLOCS: (0, 1), OpCode.ALLOCA: (1, 1), OpCode.GETF: (1, 1),
+    OpCode.SETF: (2, 0), OpCode.GETI: (2, 1), OpCode.SETI: (3, 0),
+    OpCode.JNLTVV: (0, 0), OpCode.JNLEVV: (0, 0), OpCode.JNLTVK: (0, 0),
+    OpCode.JNLEVK: (0, 0), OpCode.INCL: (0, 0), OpCode.DECL: (0, 0),
+    OpCode.LOADGETF: (0, 1), OpCode.DUP: (1, 2), OpCode.NOP: (0, 0),
+})
+
+# fused compare-and-jump opcodes -> Python operator of the comparison
+JUMP_COMPARES = {OpCode.JNLTVV: '<', OpCode.JNLEVV: '<=',
+                 OpCode.JNLTVK: '<', OpCode.JNLEVK: '<='}
+
+
+class JITError(Exception):
+    """Raised when a template cannot be compiled."""
+
+
+class Deopt(Exception):
+    """Raised by compiled code for a value the VM reports as an error
+    (where Python itself would not raise).
+
+    """
+
+
+def jit_write(x):
+    """The VM's WRITE for compiled code."""
+    if x is None:
+        x = 'null'
+    if type(x) is bool:
+        x = str(x).lower()
+    print(x, end='')
+
+
+@dataclass
+class JITProfile:
+    """Tier-up information and sampled call timings of a function."""
+    tier_up_call: int = 0           # call count when compiled
+    tier_up_time: float = 0.0       # seconds after the VM started
+    compile_time: float = 0.0       # seconds spent compiling
+    deopts: int = 0                 # times the compiled code deoptimized
+    sampling: bool = False          # true while a timed call runs
+    interp_time: float = 0.0        # timed interpreted calls ...
+    interp_calls: int = 0           # ... and the activations they made
+    native_time: float = 0.0        # timed compiled calls ...
+    native_calls: int = 0           # ... and the activations they made
+    osr_loops: list = field(default_factory=list)   # loop headers entered
+    osr_iteration: int = 0          # backward jumps before the first OSR
+
+    def speedup(self):
+        """Returns the ratio of the mean interpreted to the mean compiled
+        time per activation, or None if either has not been sampled.
+
+        """
+        if not self.interp_calls or not self.native_calls:
+            return None
+        interp = self.interp_time / self.interp_calls
+        native = self.native_time / self.native_calls
+        return interp / native if native else None
+
+
+class JITCompiler:
+
+    def __init__(self, vm):
+        """Creates a JIT compiler for the given VM.
+
+        Args:
+            vm -- The VM whose templates are compiled.
+
+        """
+        self.vm = vm
+        # function name -> JITProfile
+        self.profiles = {}
+        # functions that could not be compiled
+        self.rejected = []
+
+
+    def profile(self, template):
+        """Returns the JITProfile of a template (creating it if needed)."""
+        name = template.function_name
+        if name not in self.profiles:
+            self.profiles[name] = JITProfile()
+        return self.profiles[name]
+
+
+    def stats(self):
+        """Returns a dictionary of per-function JIT statistics."""
+        stats = {}
+        for name, profile in self.profiles.items():
+            parts = []
+            if profile.tier_up_call:
+                speedup = profile.speedup()
+                speedup = 'n/a' if speedup is None else f'{speedup:.1f}x'
+                parts.append(f'tier-up at call {profile.tier_up_call} '
+                             f'({profile.tier_up_time:.3f}s)')
+            if profile.osr_loops:
+                loops = ', '.join(str(pc) for pc in profile.osr_loops)
+                parts.append(f'OSR into loop at {loops} after '
+                             f'{profile.osr_iteration} iterations')
+            if not parts:
+                continue
+            parts.append(f'compiled in {profile.compile_time * 1000:.2f}ms')
+            if profile.tier_up_call:
+                parts.append(f'speedup {speedup}')
+            parts.append(f'{profile.deopts} deopts')
+            stats[f'jit {name}'] = ', '.join(parts)
+        for name in self.rejected:
+            stats[f'jit {name}'] = 'not compiled'
+        return stats
+
+
+    #----------------------------------------------------------------------
+    # Analysis
+    #----------------------------------------------------------------------
+
+    def stack_effect(self, instr):
+        """Returns (values popped, values pushed) of an instruction."""
+        op = instr.opcode
+        if op == OpCode.CALL or op == OpCode.TCALL:
+            argc = self.vm.frame_templates[instr.operand].arg_count
+            return (argc, 1) if op == OpCode.CALL else (argc, 0)
+        if op == OpCode.INITS:
+            return (instr.operand, 1)
+        if op not in STACK_EFFECTS:
+            raise JITError(f'unsupported instruction {instr}')
+        return STACK_EFFECTS[op]
+
+
+    def jump_target(self, instr):
+        """Returns the jump target of an instruction (or None)."""
+        if instr.opcode in [OpCode.JMP, OpCode.JMPF, OpCode.JMPFP, OpCode.JMPTP]:
+            return instr.operand
+        if instr.opcode in JUMP_COMPARES:
+            return instr.operand[2]
+        return None
+
+
+    def stack_depths(self, instrs, start_depth):
+        """Returns the operand stack depth before each reachable
+        instruction (None for unreachable ones).
+
+        """
+        depths = [None] * len(instrs)
+        pending = [(0, start_depth)]
+        while pending:
+            pc, depth = pending.pop()
+            while pc < len(instrs):
+                if depths[pc] is not None:
+                    if depths[pc] != depth:
+                        raise JITError(f'inconsistent stack depth at {pc}')
+                    break
+                depths[pc] = depth
+                instr = instrs[pc]
+                pops, pushes = self.stack_effect(instr)
+                depth = depth - pops + pushes
+                target = self.jump_target(instr)
+                if target is not None:
+                    pending.append((target, depth))
+                if instr.opcode in [OpCode.JMPFP, OpCode.JMPTP]:
+                    depth -= 1
+                if instr.opcode in [OpCode.JMP, OpCode.RET, OpCode.TCALL]:
+                    break
+                pc += 1
+        return depths
+
+
+    #----------------------------------------------------------------------
+    # Code generation
+    #----------------------------------------------------------------------
+
+    def const(self, value):
+        """Returns Python source for a constant operand."""
+        if value is None or type(value) in [bool, int, str]:
+            return repr(value)
+        if type(value) is float and math.isfinite(value):
+            return repr(value)
+        name = f'K{len(self.namespace)}'
+        self.namespace[name] = value
+        return name
+
+
+    def emit(self, line, pc=None):
+        """Add a line of source (at the current indentation); lines of an
+        instruction record its pc for deoptimization.
+
+        """
+        self.lines.append('    ' * self.indent + line)
+        if pc is not None:
+            self.line_pcs[len(self.lines)] = pc
+
+
+    def callee(self, name):
+        """Returns the global name of a called function's template."""
+        self.namespace[f'T_{name}'] = self.vm.frame_templates[name]
+        return f'T_{name}'
+
+
+    def jump(self, target, block_start, cond=None, next_pc=None):
+        """Emit a jump, conditional if cond is given (backward jumps restart
+        the block loop).
+
+        """
+        if next_pc is not None and next_pc >= len(self.depths):
+            raise JITError('conditional jump at the end of the function')
+        if cond is None:
+            self.emit(f'pc = {target}')
+        else:
+            self.emit(f'pc = {target} if {cond} else {next_pc}')
+        if target <= block_start:
+            self.emit('continue')
+
+
+    def gen_instr(self, pc, instr, depth, block_start):
+        """Emit the Python statements of one instruction.
+
+        Args:
+            pc -- The instruction index.
+            instr -- The (decoded) instruction.
+            depth -- The operand stack depth before the instruction.
+            block_start -- The pc of the first instruction of the block.
+
+        """
+        op = instr.opcode
+        arg = instr.operand
+        oid = self.vm.heap == 'oid'
+        s = lambda i: f's{depth + i}'
+        emit = lambda line: self.emit(line, pc)
+        x, y, z = s(-1), s(-2), s(-3)
+        if op == OpCode.PUSH:
+            emit(f'{s(0)} = {self.const(arg)}')
+        elif op == OpCode.STORE:
+            emit(f'v{arg} = {x}')
+        elif op == OpCode.LOAD:
+            emit(f'{s(0)} = v{arg}')
+        elif op == OpCode.DUP:
+            emit(f'{s(0)} = {x}')
+        elif op in PYTHON_OPS:
+            emit(f'{y} = {y} {PYTHON_OPS[op]} {x}')
+        elif op == OpCode.DIV:
+            emit(f'{y} = int({y} / {x}) if {x}.__class__ is int else {y} / {x}')
+        elif op == OpCode.DIVI:
+            emit(f'{y} = int({y} / {x})')
+        elif op == OpCode.DIVD:
+            emit(f'{y} = {y} / {x}')
+        elif op == OpCode.CMPEQ:
+            emit(f'{y} = {y} == {x}')
+        elif op == OpCode.CMPNE:
+            emit(f'{y} = {y} != {x}')
+        elif op in [OpCode.AND, OpCode.OR]:
+            emit(f'if {x} is None or {y} is None: raise Deopt')
+            emit(f'{y} = {y} {op.name.lower()} {x}')
+        elif op == OpCode.NOT:
+            emit(f'if {x} is None: raise Deopt')
+            emit(f'{x} = not {x}')
+        elif op == OpCode.JMP:
+            self.jump(arg, block_start)
+        elif op == OpCode.JMPF:
+            self.jump(arg, block_start, f'{x} == False', pc + 1)
+        elif op in [OpCode.JMPFP, OpCode.JMPTP]:
+            emit(f'if {x} is None: raise Deopt')
+            self.jump(arg, block_start, f'{x} is {op == OpCode.JMPTP}', pc + 1)
+        elif op in JUMP_COMPARES:
+            i, k, target = arg
+            rhs = f'v{k}' if op in [OpCode.JNLTVV, OpCode.JNLEVV] else self.const(k)
+            # (evaluated on its own line, so a null operand deoptimizes here)
+            emit(f'cond = v{i} {JUMP_COMPARES[op]} {rhs}')
+            self.jump(target, block_start, 'not cond', pc + 1)
+        elif op in [OpCode.INCL, OpCode.DECL]:
+            i, k = arg
+            emit(f'v{i} = v{i} {"+" if op == OpCode.INCL else "-"} {self.const(k)}')
+        elif op in [OpCode.CALL, OpCode.TCALL]:
+            argc = self.vm.frame_templates[arg].arg_count
+            args = ', '.join(s(i) for i in range(-argc, 0))
+            call_args = ', '.join([self.callee(arg)] + [s(i) for i in range(-argc, 0)])
+            # (an OSR version calls itself through the tiers instead)
+            self_call = arg == self.template.function_name and self.entry is None
+            if self_call and op == OpCode.TCALL:
+                # a self tail call starts over with the new arguments
+                emit('T.calls += 1')
+                if argc:
+                    params = ', '.join(f's{i}' for i in reversed(range(argc)))
+                    emit(f'{params} = {args}')
+                self.jump(0, block_start)
+            elif self_call:
+                # (counted like calls through the tiers, see call_template)
+                emit(f'if vm.native_depth < {JIT_NATIVE_DEPTH}:')
+                emit('    T.calls += 1')
+                emit('    vm.native_depth += 1')
+                emit(f'    {s(-argc)} = {self.name}({args})')
+                emit('    vm.native_depth -= 1')
+                emit('else:')
+                emit(f'    {s(-argc)} = call({call_args})')
+            elif op == OpCode.CALL:
+                emit(f'{s(-argc)} = call({call_args})')
+            else:
+                emit(f'return call({call_args})')
+        elif op == OpCode.RET:
+            emit(f'return {x}')
+        elif op == OpCode.WRITE:
+            emit(f'write({x})')
+        elif op == OpCode.READ:
+            emit(f'{s(0)} = input()')
+        elif op == OpCode.LEN:
+            if oid:
+                emit(f'{x} = len({x}) if {x}.__class__ is str else len(array_heap[{x}])')
+            else:
+                emit(f'{x} = len({x})')
+        elif op == OpCode.GETC:
+            # x is the string, y the index
+            emit(f'if {y} < 0: raise Deopt')
+            emit(f'{y} = {x}[{y}]')
+        elif op == OpCode.TOINT:
+            emit(f'{x} = int({x})')
+        elif op == OpCode.TODBL:
+            emit(f'{x} = float({x})')
+        elif op == OpCode.TOSTR:
+            emit(f'if {x} is None: raise Deopt')
+            emit(f'{x} = str({x})')
+        elif op == OpCode.ALLOCA:
+            emit(f'if {x}.__class__ is not int or {x} < 0: raise Deopt')
+            if oid:
+                emit(f'{x} = alloc(array_heap, [None] * {x})')
+            else:
+                emit(f'{x} = VMArray([None] * {x})')
+        elif op == OpCode.ALLOCS:
+            if oid:
+                emit(f'{s(0)} = alloc(struct_heap, [None] * {arg})')
+            else:
+                emit(f'{s(0)} = VMStruct([None] * {arg})')
+        elif op == OpCode.INITS:
+            fields = ', '.join(s(i) for i in range(-arg, 0))
+            if oid:
+                emit(f'{s(-arg)} = alloc(struct_heap, [{fields}])')
+            else:
+                emit(f'{s(-arg)} = VMStruct([{fields}])')
+        elif op == OpCode.GETF:
+            emit(f'{x} = struct_heap[{x}][{arg}]' if oid else f'{x} = {x}[{arg}]')
+        elif op == OpCode.LOADGETF:
+            i, offset = arg
+            emit(f'{s(0)} = struct_heap[v{i}][{offset}]' if oid else f'{s(0)} = v{i}[{offset}]')
+        elif op == OpCode.SETF:
+            emit(f'struct_heap[{y}][{arg}] = {x}' if oid else f'{y}[{arg}] = {x}')
+        elif op == OpCode.GETI:
+            # x is the index, y the array
+            emit(f'if {x} < 0: raise Deopt')
+            emit(f'{y} = array_heap[{y}][{x}]' if oid else f'{y} = {y}[{x}]')
+        elif op == OpCode.SETI:
+            # x is the value, y the index, z the array
+            emit(f'if {y} < 0: raise Deopt')
+            emit(f'array_heap[{z}][{y}] = {x}' if oid else f'{z}[{y}] = {x}')
+        elif op not in [OpCode.POP, OpCode.NOP]:
+            raise JITError(f'unsupported instruction {instr}')
+
+
+    def source(self, template, entry=None):
+        """Returns the Python source of the compiled version of a template
+        and records the line -> pc mapping and stack depths.
+
+        Args:
+            template -- The (linked) VMFrameTemplate to translate.
+            entry -- If given, the loop header pc an OSR version starts
+                     at (its arguments are then the frame's variables
+                     and operand stack).
+
+        """
+        instrs = list(template.instructions)
+        argc = template.arg_count
+        self.template = template
+        self.entry = entry
+        if entry is None:
+            self.name = f'jit_{template.function_name}'
+        else:
+            self.name = f'osr_{template.function_name}_{entry}'
+        # globals of the compiled code (constants and called templates)
+        self.namespace = {'T': template}
+        self.depths = self.stack_depths(instrs, argc)
+        self.lines = []
+        self.line_pcs = {}
+        self.indent = 0
+        # blocks start at jump targets and after jumps
+        leaders = {0} if entry is None else {0, entry}
+        for pc, instr in enumerate(instrs):
+            target = self.jump_target(instr)
+            if target is not None:
+                leaders.add(target)
+            if target is not None or instr.opcode in [OpCode.RET, OpCode.TCALL]:
+                leaders.add(pc + 1)
+        leaders = sorted(l for l in leaders if l < len(instrs) and self.depths[l] is not None)
+        if entry is None:
+            # the arguments are the initial operand stack (the last on top)
+            params = ', '.join(f's{i}' for i in reversed(range(argc)))
+            self.emit(f'def {self.name}({params}):')
+            self.indent += 1
+            self.emit('pc = 0')
+        else:
+            if self.depths[entry] is None:
+                raise JITError(f'unreachable loop header {entry}')
+            self.emit(f'def {self.name}(variables, stack):')
+            self.indent += 1
+            # only the variables stored so far exist
+            stores = [i.operand for i in instrs if i.opcode == OpCode.STORE]
+            self.emit('n = len(variables)')
+            for i in range(max(stores, default=-1) + 1):
+                self.emit(f'if n > {i}: v{i} = variables[{i}]')
+            depth = self.depths[entry]
+            if depth:
+                self.emit(', '.join(f's{i}' for i in range(depth)) + ', = stack')
+            self.emit(f'pc = {entry}')
+        self.emit('try:')
+        self.indent += 1
+        self.emit('while True:')
+        self.indent += 1
+        for n, start in enumerate(leaders):
+            end = leaders[n + 1] if n + 1 < len(leaders) else len(instrs)
+            self.emit(f'if pc == {start}:')
+            self.indent += 1
+            last = None
+            for pc in range(start, end):
+                if self.depths[pc] is None:
+                    break
+                last = instrs[pc]
+                self.gen_instr(pc, last, self.depths[pc], start)
+            if self.jump_target(last) is None and last.opcode not in [OpCode.RET, OpCode.TCALL]:
+                if end < len(instrs):
+                    self.emit(f'pc = {end}')
+                else:
+                    self.emit('return None')
+            self.indent -= 1
+        self.indent -= 2
+        self.emit('except Exception as ex:')
+        self.indent += 1
+        # errors raised in callees (or helpers) are not ours to handle
+        self.emit('if ex.__traceback__.tb_next is not None:')
+        self.emit('    raise')
+        self.emit('return deopt(ex.__traceback__.tb_lineno, locals())')
+        return '\n'.join(self.lines) + '\n'
+
+
+    def compile(self, template, entry=None):
+        """Compile a template, setting its native function (or, for an OSR
+        version, adding it to the template's osr entries). Returns the
+        compiled function, or None if the template cannot be compiled.
+
+        Args:
+            template -- The (linked) VMFrameTemplate to compile.
+            entry -- If given, the loop header an OSR version starts at.
+
+        """
+        vm = self.vm
+        name = template.function_name
+        start = time.perf_counter()
+        try:
+            source = self.source(template, entry)
+        except JITError:
+            if name not in self.rejected:
+                self.rejected.append(name)
+            return None
+        self.namespace.update({
+            'Deopt': Deopt, 'VMArray': VMArray, 'VMStruct': VMStruct,
+            'write': jit_write,
+            'struct_heap': vm.struct_heap, 'array_heap': vm.array_heap,
+            'alloc': vm.alloc_object, 'call': vm.call_template, 'vm': vm,
+        })
+        line_pcs = self.line_pcs
+        depths = self.depths
+        def deopt(line, local_vars):
+            return self.deopt(template, line_pcs[line], depths, local_vars)
+        self.namespace['deopt'] = deopt
+        code = compile(source, f'{JIT_FILENAME}{self.name}>', 'exec')
+        exec(code, self.namespace)
+        function = self.namespace[self.name]
+        profile = self.profile(template)
+        if entry is None:
+            template.native = function
+            profile.tier_up_call = template.calls
+            profile.tier_up_time = start - vm.start_time
+        else:
+            template.osr[entry] = function
+            if not profile.osr_loops:
+                profile.osr_iteration = template.loops
+            profile.osr_loops.append(entry)
+        profile.compile_time += time.perf_counter() - start
+        return function
+
+
+    #----------------------------------------------------------------------
+    # Running compiled code
+    #----------------------------------------------------------------------
+
+    def deopt(self, template, pc, depths, local_vars):
+        """Continue a compiled call in the interpreter from the
+        instruction that failed, returning the call's value.
+
+        Args:
+            template -- The compiled template.
+            pc -- The failing instruction.
+            depths -- The operand stack depth before each instruction.
+            local_vars -- The compiled function's locals.
+
+        """
+        self.profile(template).deopts += 1
+        variables = []
+        while f'v{len(variables)}' in local_vars:
+            variables.append(local_vars[f'v{len(variables)}'])
+        stack = [local_vars[f's{i}'] for i in range(depths[pc])]
+        return self.vm.interpret(VMFrame(template, pc, variables, stack))
+
+
+    def sample(self, template, args):
+        """Run a timed call of a template (compiled or interpreted) and
+        record the time per activation it made (calls it makes to the
+        same template, directly or not, are activations too).
+
+        """
+        profile = self.profile(template)
+        profile.sampling = True
+        native = template.native
+        calls = template.calls
+        start = time.perf_counter()
+        try:
+            if native is not None:
+                value = self.vm.run_native(native, args)
+            else:
+                frame = VMFrame(template, 0, [], list(args[::-1]))
+                value = self.vm.interpret(frame)
+        finally:
+            profile.sampling = False
+        elapsed = time.perf_counter() - start
+        # a call that tiered up part way through measures neither tier
+        if template.native is not native:
+            return value
+        if native is not None:
+            profile.native_time += elapsed
+            profile.native_calls += template.calls - calls + 1
+        else:
+            profile.interp_time += elapsed
+            profile.interp_calls += template.calls - calls + 1
+        return value
+
+
+    def native_roots(self):
+        """Returns the values held by running compiled code (garbage
+        collection roots, like the interpreter's frames).
+
+        """
+        roots = []
+        frame = sys._getframe()
+        while frame is not None:
+            if frame.f_code.co_filename.startswith(JIT_FILENAME):
+                roots.extend(frame.f_locals.values())
+            frame = frame.f_back
+        return roots
@@ -8,9 +8,61 @@ CLASS: CPSC 326
 
 from mypl_token import *
 from mypl_error import *
+from mypl_iowrapper import TextWrapper
+import re
 import time
 
 
+# reserved word -> token type
+RESERVED_WORDS = {
+    'int': TokenType.INT_TYPE, 'double': TokenType.DOUBLE_TYPE,
+    'string': TokenType.STRING_TYPE, 'bool': TokenType.BOOL_TYPE,
+    'void': TokenType.VOID_TYPE, 'struct': TokenType.STRUCT,
+    'array': TokenType.ARRAY, 'if': TokenType.IF,
+    'elseif': TokenType.ELSEIF, 'else': TokenType.ELSE,
+    'new': TokenType.NEW, 'return': TokenType.RETURN,
+    'and': TokenType.AND, 'or': TokenType.OR, 'not': TokenType.NOT,
+    'null': TokenType.NULL_VAL, 'true': TokenType.BOOL_VAL,
+    'false': TokenType.BOOL_VAL, 'while': TokenType.WHILE,
+    'for': TokenType.FOR,
+}
+
+# operator and punctuation lexeme -> token type
+OPERATORS = {
+    '.': TokenType.DOT, ',': TokenType.COMMA, '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN, '[': TokenType.LBRACKET,
+    ']': TokenType.RBRACKET, ';': TokenType.SEMICOLON,
+    '{': TokenType.LBRACE, '}': TokenType.RBRACE, '+': TokenType.PLUS,
+    '-': TokenType.MINUS, '*': TokenType.TIMES, '/': TokenType.DIVIDE,
+    '=': TokenType.ASSIGN, '==': TokenType.EQUAL, '>': TokenType.GREATER,
+    '>=': TokenType.GREATER_EQ, '<': TokenType.LESS,
+    '<=': TokenType.LESS_EQ, '!=': TokenType.NOT_EQUAL,
+}
+
+# type values of the tokens scan() reads
+RESERVED_VALUES = {word: t.value for word, t in RESERVED_WORDS.items()}
+OPERATOR_VALUES = {op: t.value for op, t in OPERATORS.items()}
+ID_VALUE = TokenType.ID.value
+INT_VALUE = TokenType.INT_VAL.value
+DOUBLE_VALUE = TokenType.DOUBLE_VAL.value
+STRING_VALUE = TokenType.STRING_VAL.value
+COMMENT_VALUE = TokenType.COMMENT.value
+
+# a token (after any whitespace) as scan() reads it; anything else
+# ("other": errors, and non-ASCII text outside of strings and comments) is
+# left to next_token
+TOKEN_PATTERN = re.compile(r'''
+    \s*
+    (?: //(?P<comment>[^\n]*)
+      | "(?P<string>[^"\n]*)"
+      | (?P<word>[A-Za-z][A-Za-z0-9_]*)
+      | (?P<number>[0-9]+(?:\.[0-9]+)?)
+      | (?P<op>[=<>!]=|[.,()\[\];{}+\-*/=<>])
+      | (?P<other>.)
+    )
+''', re.VERBOSE)
+
+
 class Lexer:
     """For obtaining a token stream from a program."""
 
@@ -45,19 +97,179 @@ class Lexer:
     def error(self, message, line, column):
         raise LexerError(f'{message} at line {line}, column {column}')
 
-    
+
+    def read_rest(self):
+        """Returns and removes the rest of the input stream."""
+        if hasattr(self.in_stream, 'read_rest'):
+            return self.in_stream.read_rest()
+        chars = []
+        ch = self.in_stream.read_char()
+        while ch != '':
+            chars.append(ch)
+            ch = self.in_stream.read_char()
+        return ''.join(chars)
+
+
+    def tokenize(self):
+        """Returns the list of the remaining tokens (ending with EOS), the
+        same tokens as repeated calls to next_token would return.
+
+        """
+        return list(self.tokens())
+
+
+    def tokens(self):
+        """Generates the remaining tokens (ending with EOS). Errors are
+        raised when the token they are at is reached, as with
+        next_token.
+
+        """
+        yield from self.token_buffer()
+
+
+    def token_buffer(self):
+        """Returns a TokenBuffer of the remaining tokens (ending with EOS).
+        A lexer error ends the buffer early; it is raised when the buffer
+        is read past the tokens before it.
+
+        The input is scanned with TOKEN_PATTERN (see scan). Input the
+        pattern does not cover is lexed with next_token, and scanning
+        continues after it.
+
+        """
+        text = self.read_rest()
+        buffer = TokenBuffer(text)
+        pos = 0
+        line = self.line
+        line_start = -self.column    # index of the line's column 0
+        while True:
+            stop = self.scan(buffer, pos, line, line_start)
+            if stop is None:
+                return buffer
+            pos, other = stop
+            in_stream = TextWrapper(text, pos)
+            self.in_stream = in_stream
+            try:
+                # until past the input the pattern does not cover
+                while in_stream.pos <= other:
+                    token = self.next_token()
+                    self.append_token(buffer, token, in_stream.pos)
+                    if token.token_type == TokenType.EOS:
+                        return buffer
+            except MyPLError as ex:
+                buffer.error = ex
+                return buffer
+            pos = in_stream.pos
+            line = self.line
+            line_start = pos - self.column
+
+
+    def append_token(self, buffer, token, end):
+        """Add a token returned by next_token to a buffer.
+
+        Args:
+            buffer -- The TokenBuffer.
+            token -- The token.
+            end -- The offset in the text just after the token.
+
+        """
+        offset = LEXEME_OFFSETS.get(token.token_type.value, 0)
+        length = len(token.lexeme)
+        if token.token_type == TokenType.EOS:
+            span = 0
+        elif token.token_type == TokenType.ID and not length:
+            # (a character next_token ignores gives an empty ID token)
+            span = 1
+        else:
+            # (strings and comments are two characters longer)
+            span = length + 2 if offset else length
+        start = end - span + offset
+        buffer.append(token.token_type.value, start, start + length,
+                      token.line, token.column)
+
+
+    def scan(self, buffer, pos, line, line_start):
+        """Scans the text of a buffer with TOKEN_PATTERN from the given
+        offset, adding the tokens to the buffer. Returns None once the
+        end (and the EOS token) is reached, or else (the offset to
+        continue from with next_token, the offset of the input the
+        pattern does not cover).
+
+        The token scanned before the input the pattern does not cover is
+        taken back out (it could end differently, e.g. an identifier
+        followed by a non-ASCII letter), and next_token continues from
+        its start.
+
+        Args:
+            buffer -- The TokenBuffer.
+            pos -- The offset to start at.
+            line -- The line at pos.
+            line_start -- The offset of column 0 of that line.
+
+        """
+        text = buffer.text
+        count = text.count
+        types = buffer.types
+        starts = buffer.starts
+        ends = buffer.ends
+        lines = buffer.lines
+        columns = buffer.columns
+        for m in TOKEN_PATTERN.finditer(text, pos):
+            kind = m.lastgroup
+            start = m.start(kind)
+            if pos < start:
+                newlines = count('\n', pos, start)
+                if newlines:
+                    line += newlines
+                    line_start = text.rindex('\n', pos, start) + 1
+            pos = m.end()
+            if kind == 'word':
+                type_value = RESERVED_VALUES.get(m.group(kind), ID_VALUE)
+                column = start - line_start + 1
+            elif kind == 'op':
+                type_value = OPERATOR_VALUES[m.group(kind)]
+                column = start - line_start + 1
+            elif kind == 'number':
+                if ((text[start] == '0' and pos - start > 1 and text[start + 1] != '.') or
+                        text.startswith('.', pos)):
+                    break
+                type_value = DOUBLE_VALUE if '.' in m.group(kind) else INT_VALUE
+                column = start - line_start + 1
+            elif kind == 'string':
+                type_value = STRING_VALUE
+                column = start - line_start     # (at the quote)
+            elif kind == 'comment':
+                type_value = COMMENT_VALUE
+                column = start - line_start - 1
+            else:
+                break
+            types.append(type_value)
+            starts.append(start)
+            ends.append(m.end(kind))
+            lines.append(line)
+            columns.append(column)
+        else:
+            # (next_token reads the end of the input as one more character)
+            newlines = count('\n', pos)
+            if newlines:
+                line += newlines
+                line_start = text.rindex('\n', pos) + 1
+            self.line = line
+            self.column = len(text) - line_start + 1
+            buffer.append(TokenType.EOS.value, len(text), len(text),
+                          self.line, self.column)
+            return None
+        if len(buffer):
+            pos, self.line, column = buffer.pop()
+            self.column = column - 1
+        else:
+            pos = 0
+        return pos, start
+
+
     # ints, doubles, ids, reserved words.
     def next_token(self):
         """Return the next token in the lexer's input stream."""
-       
-        # list of reserved words to check against
-        words = ['int', 'double', 'string', 'bool', 'void', 'struct',
-                  'array', 'if', 'elseif', 'else', 'new', 'return', 'and'
-                  , 'or', 'not', 'null', 'true', 'false', 'while', 'for']
-        types = [TokenType.INT_TYPE, TokenType.DOUBLE_TYPE, TokenType.STRING_TYPE, TokenType.BOOL_TYPE,
-                 TokenType.VOID_TYPE, TokenType.STRUCT, TokenType.ARRAY, TokenType.IF, TokenType.ELSEIF,
-                 TokenType.ELSE, TokenType.NEW, TokenType.RETURN, TokenType.AND, TokenType.OR, TokenType.NOT,
-                 TokenType.NULL_VAL, TokenType.BOOL_VAL, TokenType.BOOL_VAL, TokenType.WHILE, TokenType.FOR]
         
         # read initial character
         ch = self.read()
@@ -199,8 +411,8 @@ class Lexer:
             token.lexeme += ch
             token.token_type = TokenType.ID
 
-            if(token.lexeme in words):
-                token.token_type = types[words.index(token.lexeme)]
+            if(token.lexeme in RESERVED_WORDS):
+                token.token_type = RESERVED_WORDS[token.lexeme]
         
         #ints and doubles
         elif(ch.isdecimal()):                
@@ -31,13 +31,41 @@ OpCode = Enum('OpCode', [
     'OR',      # pop x, pop y, push (y or x)
     'NOT',     # pop x, push (not x)
 
+    # typed operators (operand types proven by the semantic checker)
+    'ADDI',    # pop int x, pop int y, push (y + x)
+    'ADDD',    # pop double x, pop double y, push (y + x)
+    'ADDS',    # pop string x, pop string y, push (y + x)
+    'SUBI',    # pop int x, pop int y, push (y - x)
+    'SUBD',    # pop double x, pop double y, push (y - x)
+    'MULI',    # pop int x, pop int y, push (y * x)
+    'MULD',    # pop double x, pop double y, push (y * x)
+    'DIVI',    # pop int x, pop int y, push (y // x) rounded toward 0
+    'DIVD',    # pop double x, pop double y, push (y / x)
+    'CMPLTI',  # pop int x, pop int y, push (y < x)
+    'CMPLEI',  # pop int x, pop int y, push (y <= x)
+
+    # quickened operators (rewritten in place by the VM once the operand
+    # types are seen; guarded, they revert to the generic opcode)
+    'QADDI',   # ADD if x and y are ints
+    'QADDD',   # ADD if x and y are doubles
+    'QADDS',   # ADD if x and y are strings
+    'QSUBI',   # SUB if x and y are ints
+    'QSUBD',   # SUB if x and y are doubles
+    'QMULI',   # MUL if x and y are ints
+    'QMULD',   # MUL if x and y are doubles
+    'QCMPLTI', # CMPLT if x and y are ints
+    'QCMPLEI', # CMPLE if x and y are ints
+
     # jump and branch
     'JMP',     # jump to given instruction offset A
     'JMPF',    # pop x, if x is False jump to instruction offset A
+    'JMPFP',   # if top x is False jump to offset A keeping x, else pop x
+    'JMPTP',   # if top x is True jump to offset A keeping x, else pop x
 
     # functions
     'CALL',    # call function A (pop and push arguments)
     'RET',     # return from current function
+    'TCALL',   # tail call function A (pop arguments, reuse current frame)
 
     # built ins
     'WRITE',   # pop x, print x to standard output
@@ -49,14 +77,26 @@ OpCode = Enum('OpCode', [
     'TOSTR',   # pop x, push str(x)
 
     # heap
-    'ALLOCS',  # allocate struct object, push oid x
-    'SETF',    # pop value x, pop oid y, set obj(y)[A] = x
-    'GETF',    # pop oid x, push obj(x)[A] onto stack
+    'ALLOCS',  # allocate struct object with A field slots, push oid x
+    'SETF',    # pop value x, pop oid y, set field slot A of obj(y) to x
+    'GETF',    # pop oid x, push field slot A of obj(x) onto stack
+    'INITS',   # pop A values, allocate struct object with them as its
+               # field slots (first pushed is the first field), push oid
     'ALLOCA',  # pop int x, allocate array object with x None values, push oid
     'SETI',    # pop value x, pop index y, pop oid z, set array obj(z)[y] = x
     'GETI',    # pop index x, pop oid y, push obj(y)[x] onto stack
 
+    # superinstructions (selected by the optimizer, A is a tuple)
+    'JNLTVV',  # A = (i, j, t): jump to t unless variable i < variable j
+    'JNLEVV',  # A = (i, j, t): jump to t unless variable i <= variable j
+    'JNLTVK',  # A = (i, k, t): jump to t unless variable i < k
+    'JNLEVK',  # A = (i, k, t): jump to t unless variable i <= k
+    'INCL',    # A = (i, k): set variable i to (variable i + k)
+    'DECL',    # A = (i, k): set variable i to (variable i - k)
+    'LOADGETF', # A = (i, f): push field slot f of obj(variable i)
+
     # special
     'DUP',     # pop x, push x, push x
+    'MOV',     # register IR only: A = (r, s), copy register s to register r
     'NOP'      # do nothing
 ])
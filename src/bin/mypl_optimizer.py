@@ -0,0 +1,351 @@
+"""Peephole optimizer and superinstruction selection for MyPL VM frame
+templates.
+
+NAME: <Ryan St. Mary>
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+from mypl_opcode import *
+from mypl_frame import *
+
+
+# opcodes whose operand is an instruction offset
+JUMP_OPCODES = [OpCode.JMP, OpCode.JMPF, OpCode.JMPFP, OpCode.JMPTP]
+
+# superinstructions whose operand is a tuple ending in an instruction offset
+FUSED_JUMP_OPCODES = [OpCode.JNLTVV, OpCode.JNLEVV, OpCode.JNLTVK,
+                      OpCode.JNLEVK]
+
+# operator opcodes a superinstruction can stand in for
+LT_OPCODES = [OpCode.CMPLT, OpCode.CMPLTI, OpCode.QCMPLTI]
+LE_OPCODES = [OpCode.CMPLE, OpCode.CMPLEI, OpCode.QCMPLEI]
+ADD_OPCODES = [OpCode.ADD, OpCode.ADDI, OpCode.ADDD, OpCode.QADDI, OpCode.QADDD]
+SUB_OPCODES = [OpCode.SUB, OpCode.SUBI, OpCode.SUBD, OpCode.QSUBI, OpCode.QSUBD]
+
+# opcodes after which execution never falls through to the next one
+NO_FALL_THROUGH = [OpCode.JMP, OpCode.RET, OpCode.TCALL]
+
+
+def jump_target(instr):
+    """Returns the instruction offset an instruction may jump to, or None
+    if it is not a jump.
+
+    """
+    if instr.opcode in JUMP_OPCODES:
+        return instr.operand
+    if instr.opcode in FUSED_JUMP_OPCODES:
+        return instr.operand[-1]
+    return None
+
+
+def retarget(instr, target):
+    """Returns a copy of the jump instruction going to the given offset."""
+    if instr.opcode in FUSED_JUMP_OPCODES:
+        return VMInstr(instr.opcode, instr.operand[:-1] + (target,), instr.comment)
+    return VMInstr(instr.opcode, target, instr.comment)
+
+
+class PeepholeOptimizer:
+    """Removes redundant instructions from generated frame templates."""
+
+    def __init__(self, fuse=True):
+        """Create an optimizer.
+
+        Args:
+            fuse -- If true, replace common instruction sequences by
+                    superinstructions after the peephole rules.
+
+        """
+        self.fuse = fuse
+        # function name -> number of instructions removed
+        self.removed = {}
+        # function name -> number of superinstructions
+        self.fused = {}
+
+
+    def stats(self):
+        """Returns a dictionary of optimizer statistics."""
+        stats = {f'peephole removed ({name})': count
+                 for name, count in self.removed.items()}
+        for name, count in self.fused.items():
+            stats[f'superinstructions ({name})'] = count
+        return stats
+
+
+    def optimize(self, vm):
+        """Optimize every (not yet linked) frame template of the given VM.
+
+        Args:
+            vm -- The VM whose frame templates are rewritten in place.
+
+        """
+        for template in vm.frame_templates.values():
+            if not template.is_linked():
+                self.optimize_template(template)
+
+
+    def optimize_template(self, template):
+        """Apply the peephole rules to a template until none of them
+        changes anything.
+
+        Args:
+            template -- The VMFrameTemplate to rewrite in place.
+
+        """
+        instrs = template.instructions
+        start_len = len(instrs)
+        changed = True
+        while changed:
+            changed = self.thread_jumps(instrs)
+            changed = self.rewrite_patterns(instrs) or changed
+            changed = self.remove_unreachable(instrs) or changed
+            changed = self.remove_nops(instrs) or changed
+            changed = self.remove_jumps_to_next(instrs) or changed
+            instrs = self.compact(instrs)
+        self.removed[template.function_name] = start_len - len(instrs)
+        if self.fuse:
+            self.fused[template.function_name] = self.fuse_superinstructions(instrs)
+            instrs = self.compact(instrs)
+        template.instructions = instrs
+
+
+    #----------------------------------------------------------------------
+    # Helper functions
+    #----------------------------------------------------------------------
+
+    def jump_targets(self, instrs):
+        """Returns the set of offsets that some jump goes to."""
+        targets = set()
+        for instr in instrs:
+            if instr is not None and jump_target(instr) is not None:
+                targets.add(jump_target(instr))
+        return targets
+
+
+    def compact(self, instrs):
+        """Drop deleted (None) instructions and fix up jump offsets. A
+        jump to a deleted instruction goes to the next one kept.
+
+        Args:
+            instrs -- Instruction list with None for deleted entries.
+
+        """
+        new_index = []
+        count = 0
+        for instr in instrs:
+            new_index.append(count)
+            if instr is not None:
+                count += 1
+        new_index.append(count)
+        result = []
+        for instr in instrs:
+            if instr is None:
+                continue
+            target = jump_target(instr)
+            if target is not None:
+                instr = retarget(instr, new_index[target])
+            result.append(instr)
+        return result
+
+
+    #----------------------------------------------------------------------
+    # Rules (each marks deleted instructions with None, returns True if
+    # it changed anything)
+    #----------------------------------------------------------------------
+
+    def thread_jumps(self, instrs):
+        """Retarget jumps that land on a NOP or on an unconditional jump
+        to the final destination.
+
+        """
+        changed = False
+        for i, instr in enumerate(instrs):
+            if instr is None or jump_target(instr) is None:
+                continue
+            target = jump_target(instr)
+            seen = set()
+            while target < len(instrs) and target not in seen:
+                seen.add(target)
+                next_instr = instrs[target]
+                if next_instr is None or next_instr.opcode == OpCode.NOP:
+                    target += 1
+                elif next_instr.opcode == OpCode.JMP:
+                    target = next_instr.operand
+                else:
+                    break
+            if target != jump_target(instr):
+                instrs[i] = retarget(instr, target)
+                changed = True
+        return changed
+
+
+    def rewrite_patterns(self, instrs):
+        """Replace short instruction sequences by shorter equivalents:
+
+            CMPEQ; NOT       ->  CMPNE
+            LOAD i; STORE i  ->  (nothing)
+            PUSH x; POP      ->  (nothing)
+            LOAD i; POP      ->  (nothing)
+            DUP; POP         ->  (nothing)
+
+        A sequence is only rewritten if no jump goes into its middle.
+
+        """
+        changed = False
+        targets = self.jump_targets(instrs)
+        i = 0
+        while i < len(instrs) - 1:
+            first = instrs[i]
+            second = instrs[i + 1]
+            if first is None or second is None or i + 1 in targets:
+                i += 1
+                continue
+            pair = (first.opcode, second.opcode)
+            if pair == (OpCode.CMPEQ, OpCode.NOT):
+                instrs[i] = VMInstr(OpCode.CMPNE)
+                instrs[i + 1] = None
+            elif (pair == (OpCode.LOAD, OpCode.STORE) and
+                  first.operand == second.operand):
+                instrs[i] = instrs[i + 1] = None
+            elif pair in [(OpCode.PUSH, OpCode.POP), (OpCode.LOAD, OpCode.POP),
+                          (OpCode.DUP, OpCode.POP)]:
+                instrs[i] = instrs[i + 1] = None
+            else:
+                i += 1
+                continue
+            changed = True
+            i += 2
+        return changed
+
+
+    def remove_unreachable(self, instrs):
+        """Delete instructions that no path from the first one reaches
+        (e.g., the PUSH None; RET after a return that already ran).
+
+        """
+        reached = set()
+        pending = [0]
+        while pending:
+            i = pending.pop()
+            while i < len(instrs) and i not in reached:
+                reached.add(i)
+                instr = instrs[i]
+                if instr is None:
+                    i += 1
+                    continue
+                if jump_target(instr) is not None:
+                    pending.append(jump_target(instr))
+                if instr.opcode in NO_FALL_THROUGH:
+                    break
+                i += 1
+        changed = False
+        for i in range(len(instrs)):
+            if i not in reached and instrs[i] is not None:
+                instrs[i] = None
+                changed = True
+        return changed
+
+
+    def remove_nops(self, instrs):
+        """Delete NOPs (jumps to them are fixed up by compact)."""
+        changed = False
+        for i, instr in enumerate(instrs):
+            if instr is not None and instr.opcode == OpCode.NOP:
+                instrs[i] = None
+                changed = True
+        return changed
+
+
+    def remove_jumps_to_next(self, instrs):
+        """Delete unconditional jumps to the instruction that follows."""
+        changed = False
+        for i, instr in enumerate(instrs):
+            if instr is None or instr.opcode != OpCode.JMP:
+                continue
+            target = i + 1
+            while target < len(instrs) and instrs[target] is None:
+                target += 1
+            if instr.operand == target:
+                instrs[i] = None
+                changed = True
+        return changed
+
+
+    #----------------------------------------------------------------------
+    # Superinstructions
+    #----------------------------------------------------------------------
+
+    def fuse_superinstructions(self, instrs):
+        """Replace instruction sequences by superinstructions (marking the
+        rest of each sequence deleted); returns the number of
+        superinstructions. A sequence is only fused if no jump goes into
+        its middle:
+
+            LOAD i; LOAD j; CMPLT; JMPF t  ->  JNLTVV (i, j, t)
+            LOAD i; LOAD j; CMPLE; JMPF t  ->  JNLEVV (i, j, t)
+            LOAD i; PUSH k; CMPLT; JMPF t  ->  JNLTVK (i, k, t)
+            LOAD i; PUSH k; CMPLE; JMPF t  ->  JNLEVK (i, k, t)
+            LOAD i; PUSH k; ADD; STORE i   ->  INCL (i, k)
+            LOAD i; PUSH k; SUB; STORE i   ->  DECL (i, k)
+            LOAD i; GETF f                 ->  LOADGETF (i, f)
+
+        where CMPLT, ADD, etc. also stand for their typed and quickened
+        versions and k is an int or double.
+
+        """
+        targets = self.jump_targets(instrs)
+        count = 0
+        i = 0
+        while i < len(instrs):
+            fused = self.match_superinstruction(instrs, i)
+            if fused is None:
+                i += 1
+                continue
+            instr, length = fused
+            if any(j in targets for j in range(i + 1, i + length)):
+                i += 1
+                continue
+            instrs[i] = instr
+            for j in range(i + 1, i + length):
+                instrs[j] = None
+            count += 1
+            i += length
+        return count
+
+
+    def match_superinstruction(self, instrs, i):
+        """Returns the superinstruction for the sequence starting at i and
+        the number of instructions it replaces, or None.
+
+        Args:
+            instrs -- The instruction list.
+            i -- The offset of the first instruction.
+
+        """
+        window = instrs[i:i + 4]
+        if not window or window[0].opcode != OpCode.LOAD:
+            return None
+        ops = [instr.opcode for instr in window]
+        var = window[0].operand
+        if len(ops) >= 2 and ops[1] == OpCode.GETF:
+            return VMInstr(OpCode.LOADGETF, (var, window[1].operand),
+                           window[1].comment), 2
+        if len(ops) < 4 or ops[1] not in [OpCode.LOAD, OpCode.PUSH]:
+            return None
+        second = window[1].operand
+        if ops[3] == OpCode.JMPF and ops[2] in LT_OPCODES + LE_OPCODES:
+            target = window[3].operand
+            if ops[1] == OpCode.LOAD:
+                opcode = OpCode.JNLTVV if ops[2] in LT_OPCODES else OpCode.JNLEVV
+            else:
+                opcode = OpCode.JNLTVK if ops[2] in LT_OPCODES else OpCode.JNLEVK
+            return VMInstr(opcode, (var, second, target)), 4
+        if (ops[1] == OpCode.PUSH and type(second) in [int, float] and
+                ops[3] == OpCode.STORE and window[3].operand == var):
+            if ops[2] in ADD_OPCODES:
+                return VMInstr(OpCode.INCL, (var, second)), 4
+            if ops[2] in SUB_OPCODES:
+                return VMInstr(OpCode.DECL, (var, second)), 4
+        return None
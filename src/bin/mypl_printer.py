@@ -49,10 +49,10 @@ class PrintVisitor(Visitor):
     
     def visit_program(self, program):
         for struct in program.struct_defs:
-            struct.accept(self)
+            walk(self, struct)
             self.output('\n')
         for fun in program.fun_defs:
-            fun.accept(self)
+            walk(self, fun)
             self.output('\n')            
 
             
@@ -61,24 +61,24 @@ class PrintVisitor(Visitor):
         self.indent += 1
         for var_def in struct_def.fields:
             self.output_indent()
-            var_def.accept(self)
+            yield var_def
             self.output(';\n')
         self.indent -= 1
         self.output('}\n')
 
 
     def visit_fun_def(self, fun_def):
-        fun_def.return_type.accept(self)
+        yield fun_def.return_type
         self.output(' ' + fun_def.fun_name.lexeme + '(')
         for i in range(len(fun_def.params)):
-            fun_def.params[i].accept(self)
+            yield fun_def.params[i]
             if i < len(fun_def.params) - 1:
                 self.output(', ')
         self.output(') {\n')
         self.indent += 1
         for stmt in fun_def.stmts:
             self.output_indent()
-            stmt.accept(self)
+            yield stmt
             self.output_semicolon(stmt)
             self.output('\n')
         self.indent -= 1
@@ -90,22 +90,22 @@ class PrintVisitor(Visitor):
     def visit_expr(self, expr):
         if(expr.not_op):
             self.output('not (')
-        expr.first.accept(self)
+        yield expr.first
         if expr.op != None:
             self.output(' ' + expr.op.lexeme + ' ') 
         if(expr.rest != None):
-            expr.rest.accept(self)
+            yield expr.rest
         if expr.not_op:
             self.output(')')
     
     def visit_if_stmt(self, if_stmt):
         self.output('if (')
-        if_stmt.if_part.condition.accept(self)
+        yield if_stmt.if_part.condition
         self.output(') {\n')
         self.indent+=1
         for stmt in if_stmt.if_part.stmts:
             self.output_indent()
-            stmt.accept(self)
+            yield stmt
             self.output_semicolon(stmt)
             self.output('\n')
         self.indent-=1
@@ -118,12 +118,12 @@ class PrintVisitor(Visitor):
             self.output_indent()
             self.output('elseif (')
             
-            else_if.condition.accept(self)
+            yield else_if.condition
             self.output(') {\n')
             self.indent +=1
             for stmt in else_if.stmts:
                 self.output_indent()
-                stmt.accept(self)
+                yield stmt
                 self.output_semicolon(stmt)
                 self.output('\n')
             self.indent-=1
@@ -135,7 +135,7 @@ class PrintVisitor(Visitor):
             self.indent+=1
             for stmt in if_stmt.else_stmts:
                 self.output_indent()
-                stmt.accept(self)
+                yield stmt
                 self.output_semicolon(stmt)
                 self.output('\n')
             self.indent-=1
@@ -145,12 +145,12 @@ class PrintVisitor(Visitor):
     def visit_return_stmt(self, return_stmt):
         
         self.output('return ')
-        return_stmt.expr.accept(self)
+        yield return_stmt.expr
 
     def visit_var_decl(self, var_decl):
-        var_decl.var_def.accept(self)
+        yield var_decl.var_def
         self.output(' = ')
-        var_decl.expr.accept(self)
+        yield var_decl.expr
 
     def visit_assign_stmt(self, assign_stmt):
         path_len = len(assign_stmt.lvalue)
@@ -159,23 +159,23 @@ class PrintVisitor(Visitor):
             self.output(var_ref.var_name.lexeme)
             if(var_ref.array_expr != None):
                 self.output('[') 
-                var_ref.array_expr.accept(self)
+                yield var_ref.array_expr
                 self.output(']')
             if i < path_len-1 and path_len!=1:
                 self.output('.')
             i = i+1
         self.output(' = ')
-        assign_stmt.expr.accept(self)
+        yield assign_stmt.expr
         
 
     def visit_while_stmt(self, while_stmt):
         self.output('while (')
-        while_stmt.condition.accept(self)
+        yield while_stmt.condition
         self.output(') {\n')
         self.indent+=1
         for stmt in while_stmt.stmts:
             self.output_indent()
-            stmt.accept(self)
+            yield stmt
             self.output_semicolon(stmt)
             self.output('\n')
         self.indent-=1
@@ -184,16 +184,16 @@ class PrintVisitor(Visitor):
 
     def visit_for_stmt(self, for_stmt):
         self.output('for (')
-        for_stmt.var_decl.accept(self)
+        yield for_stmt.var_decl
         self.output('; ')
-        for_stmt.condition.accept(self)
+        yield for_stmt.condition
         self.output('; ')
-        for_stmt.assign_stmt.accept(self)
+        yield for_stmt.assign_stmt
         self.output(') {\n')
         self.indent+=1
         for stmt in for_stmt.stmts:
             self.output_indent()
-            stmt.accept(self)
+            yield stmt
             self.output_semicolon(stmt)
             self.output('\n')
         self.indent -= 1
@@ -204,7 +204,7 @@ class PrintVisitor(Visitor):
     def visit_call_expr(self, call_expr):
         self.output(call_expr.fun_name.lexeme + '(')
         for i in range(len(call_expr.args)):
-            call_expr.args[i].accept(self)
+            yield call_expr.args[i]
             if i < len(call_expr.args) - 1:
                 self.output(', ')
         self.output(')')
@@ -216,15 +216,15 @@ class PrintVisitor(Visitor):
         self.output(data_type.type_name.lexeme)
 
     def visit_var_def(self, var_def):
-        var_def.data_type.accept(self)
+        yield var_def.data_type
         self.output(' ' + var_def.var_name.lexeme)
 
     def visit_simple_term(self, simple_term):
-        simple_term.rvalue.accept(self)
+        yield simple_term.rvalue
 
     def visit_complex_term(self, complex_term):
         self.output('(')
-        complex_term.expr.accept(self)
+        yield complex_term.expr
         self.output(')')
 
     def visit_simple_rvalue(self, simple_rvalue):
@@ -237,11 +237,11 @@ class PrintVisitor(Visitor):
         self.output('new ' + new_rvalue.type_name.lexeme)
         if new_rvalue.array_expr != None:
             self.output('[')
-            new_rvalue.array_expr.accept(self)
+            yield new_rvalue.array_expr
             self.output(']')
         self.output('(')
         for i in range( len(new_rvalue.struct_params)):
-            new_rvalue.struct_params[i].accept(self)
+            yield new_rvalue.struct_params[i]
             if i < len(new_rvalue.struct_params) - 1:
                 self.output(', ')
         self.output(')')
@@ -253,7 +253,7 @@ class PrintVisitor(Visitor):
             self.output(var_ref.var_name.lexeme)
             if var_ref.array_expr != None:
                 self.output('[')
-                var_ref.array_expr.accept(self)
+                yield var_ref.array_expr
                 self.output(']')
             if i < path_len-1 and path_len!=1:
                 self.output('.')
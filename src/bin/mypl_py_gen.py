@@ -0,0 +1,493 @@
+"""Python code generator (transpiler) for MyPL. Translates a checked AST
+into the source of a Python module that runs with the same output as the
+VM: functions become Python functions, variables Python locals, structs
+__slots__ classes, and arrays lists.
+
+NAME: <Ryan St. Mary>
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import keyword
+import math
+import re
+from mypl_error import *
+from mypl_token import *
+from mypl_ast import *
+from mypl_symbol_table import SymbolTable
+
+
+# names a struct field cannot use as a Python attribute (or parameter)
+RESERVED_NAMES = keyword.kwlist + ['self']
+
+# built-in function -> runtime helper (or Python function)
+BUILT_IN_FUNS = {
+    'print': 'mypl_write',
+    'input': 'input',
+    'itos': 'mypl_tostr',
+    'dtos': 'mypl_tostr',
+    'stoi': 'mypl_toint',
+    'dtoi': 'mypl_toint',
+    'stod': 'mypl_todbl',
+    'itod': 'mypl_todbl',
+    'length': 'len',
+    'get': 'mypl_getc',
+}
+
+# how deeply Python can nest indented blocks, loops, elifs (each one
+# nests in the one before it), and parentheses (deeper programs are run
+# on the VM instead)
+PYTHON_MAX_INDENT = 99
+PYTHON_MAX_LOOPS = 20
+PYTHON_MAX_ELIFS = 1000
+PYTHON_MAX_PARENS = 199
+
+# a Python string literal (as written by repr)
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+
+# operators whose result is always a bool
+COMPARISON_OPS = [TokenType.EQUAL, TokenType.NOT_EQUAL, TokenType.LESS,
+                  TokenType.LESS_EQ, TokenType.GREATER, TokenType.GREATER_EQ]
+
+# operator -> Python operator (the VM checks nulls in these, Python
+# raises a TypeError that the runtime reports as the same error)
+PYTHON_OPS = {
+    TokenType.PLUS: '+',
+    TokenType.MINUS: '-',
+    TokenType.TIMES: '*',
+    TokenType.LESS: '<',
+    TokenType.LESS_EQ: '<=',
+    TokenType.EQUAL: '==',
+    TokenType.NOT_EQUAL: '!=',
+}
+
+
+def field_name(name):
+    """Returns the Python attribute name of a struct field. Reserved
+    names (and, so that no two fields collide, names ending in an
+    underscore) get an extra underscore.
+
+    Args:
+        name -- The MyPL field name.
+
+    """
+    if name in RESERVED_NAMES or name.endswith('_'):
+        return name + '_'
+    return name
+
+
+def paren_depth(line):
+    """Returns how deeply parentheses (and brackets) nest in a line of
+    generated Python, not counting those in string literals.
+
+    Args:
+        line -- The line of Python source.
+
+    """
+    depth = max_depth = 0
+    for char in STRING_LITERAL.sub("''", line):
+        if char in '([{':
+            depth += 1
+            max_depth = max(depth, max_depth)
+        elif char in ')]}':
+            depth -= 1
+    return max_depth
+
+
+class PythonGenerator (Visitor):
+
+    def __init__(self):
+        """Creates a new Python code generator. Run it over a checked
+        program and call source() for the generated module.
+
+        """
+        # generated lines of the module
+        self.lines = []
+        # current indentation level
+        self.indent = 0
+        # MyPL variable -> Python local name
+        self.var_names = SymbolTable()
+        # variable name -> number of declarations in the current function
+        self.var_counts = {}
+        # struct name -> StructDef for field info
+        self.struct_defs = {}
+        # number of temporaries used in the current function
+        self.temp_count = 0
+        # Python source of the most recently visited expression
+        self.curr_expr = None
+        # number of loops around the current statement
+        self.loop_depth = 0
+        # number of elifs the current statement is nested in
+        self.elif_depth = 0
+        # true if the program nests too deeply to translate
+        self.too_deep = False
+
+
+    def source(self):
+        """Returns the generated Python module source."""
+        if self.too_deep:
+            raise TranslationError('program nests too deeply for Python')
+        return '\n'.join(self.lines) + '\n'
+
+
+    #----------------------------------------------------------------------
+    # Helper functions
+    #----------------------------------------------------------------------
+
+    def emit(self, line):
+        """Helper function to add a line at the current indentation,
+        noting if Python could not compile it.
+
+        """
+        if (self.indent > PYTHON_MAX_INDENT or self.loop_depth > PYTHON_MAX_LOOPS
+                or self.elif_depth > PYTHON_MAX_ELIFS):
+            self.too_deep = True
+        if line.count('(') > PYTHON_MAX_PARENS:
+            self.too_deep = self.too_deep or paren_depth(line) > PYTHON_MAX_PARENS
+        if line:
+            line = '    ' * self.indent + line
+        self.lines.append(line)
+
+
+    def expr_code(self, node):
+        """Helper function that returns the Python source of an expression
+        (or expression term, rvalue, or call). (A generator, used with
+        yield from by the visit functions.)
+
+        """
+        yield node
+        return self.curr_expr
+
+
+    def add_var(self, var_def):
+        """Helper function to give a declared variable a Python local name.
+        Each declaration of a name gets its own local, so a variable
+        shadowing another in a nested block does not overwrite it.
+
+        """
+        name = var_def.var_name.lexeme
+        count = self.var_counts.get(name, 0)
+        self.var_counts[name] = count + 1
+        self.var_names.add(name, f'v_{name}_{count}')
+        return self.var_names.get(name)
+
+
+    def gen_block(self, stmts):
+        """Helper function to generate an indented block of statements in
+        a new variable environment (a generator, like expr_code).
+
+        """
+        self.indent += 1
+        self.var_names.push_environment()
+        for stmt in stmts:
+            if type(stmt) is CallExpr:
+                self.emit((yield from self.expr_code(stmt)))
+            else:
+                yield stmt
+        if not stmts:
+            self.emit('pass')
+        self.var_names.pop_environment()
+        self.indent -= 1
+
+
+    def is_bool(self, expr):
+        """True if the expression always evaluates to a bool (never null).
+
+        Args:
+            expr -- The Expr node to check.
+
+        """
+        # expressions that all have to be bools (checked with a work list,
+        # since and/or chains and parentheses can nest deeply)
+        pending = [expr]
+        while pending:
+            expr = pending.pop()
+            op = expr.op and expr.op.token_type
+            if expr.not_op or op in COMPARISON_OPS:
+                continue
+            if op in [TokenType.AND, TokenType.OR]:
+                pending.append(expr.rest)
+            elif op is not None:
+                return False
+            term = expr.first
+            if type(term) is ComplexTerm:
+                pending.append(term.expr)
+            elif not self.is_bool_term(term):
+                return False
+        return True
+
+
+    def is_bool_term(self, term):
+        """True if the expression term always evaluates to a bool."""
+        if type(term) is ComplexTerm:
+            return self.is_bool(term.expr)
+        rvalue = term.rvalue
+        return (type(rvalue) is SimpleRValue and
+                rvalue.value.token_type == TokenType.BOOL_VAL)
+
+
+    def condition_code(self, expr):
+        """Helper function that returns the Python source of a loop or if
+        condition. Like the VM's JMPF, only false skips the body. (A
+        generator, like expr_code.)
+
+        """
+        code = yield from self.expr_code(expr)
+        if self.is_bool(expr):
+            return code
+        return f'{code} is not False'
+
+
+    def path_code(self, path):
+        """Helper function that returns the Python source of a variable
+        path (x, x[i], x.f, x[i].f[j], ...). (A generator, like
+        expr_code.)
+
+        """
+        code = self.var_names.get(path[0].var_name.lexeme)
+        for i, var_ref in enumerate(path):
+            if i > 0:
+                code += '.' + field_name(var_ref.var_name.lexeme)
+            if var_ref.array_expr is not None:
+                index = yield from self.expr_code(var_ref.array_expr)
+                code = f'mypl_geti({code}, {index})'
+        return code
+
+
+    #----------------------------------------------------------------------
+    # Visitor functions
+    #----------------------------------------------------------------------
+
+    def visit_program(self, program):
+        self.emit('"""MyPL program translated to Python."""')
+        self.emit('')
+        self.emit('from mypl_py_runtime import *')
+        for struct_def in program.struct_defs:
+            walk(self, struct_def)
+        for fun_def in program.fun_defs:
+            walk(self, fun_def)
+        self.emit('')
+        self.emit('')
+        self.emit("if __name__ == '__main__':")
+        self.emit('    mypl_run(f_main)')
+
+
+    def visit_struct_def(self, struct_def):
+        self.struct_defs[struct_def.struct_name.lexeme] = struct_def
+        fields = [field_name(f.var_name.lexeme) for f in struct_def.fields]
+        self.emit('')
+        self.emit('')
+        self.emit(f'class S_{struct_def.struct_name.lexeme}:')
+        self.indent += 1
+        self.emit(f'__slots__ = {tuple(fields)!r}')
+        self.emit('')
+        params = ''.join(f', {name}=None' for name in fields)
+        self.emit(f'def __init__(self{params}):')
+        for name in fields:
+            self.emit(f'    self.{name} = {name}')
+        if not fields:
+            self.emit('    pass')
+        self.indent -= 1
+
+
+    def visit_fun_def(self, fun_def):
+        self.var_counts = {}
+        self.temp_count = 0
+        self.var_names.push_environment()
+        params = ', '.join(self.add_var(param) for param in fun_def.params)
+        self.emit('')
+        self.emit('')
+        self.emit(f'def f_{fun_def.fun_name.lexeme}({params}):')
+        yield from self.gen_block(fun_def.stmts)
+        self.var_names.pop_environment()
+
+
+    def visit_return_stmt(self, return_stmt):
+        code = yield from self.expr_code(return_stmt.expr)
+        self.emit(f'return {code}')
+
+
+    def visit_var_decl(self, var_decl):
+        code = 'None'
+        if var_decl.expr is not None:
+            code = yield from self.expr_code(var_decl.expr)
+        name = self.add_var(var_decl.var_def)
+        self.emit(f'{name} = {code}')
+
+
+    def visit_assign_stmt(self, assign_stmt):
+        lvalue = assign_stmt.lvalue
+        last = lvalue[-1]
+        # the object holding the assigned variable, field, or element
+        if len(lvalue) == 1:
+            target = self.var_names.get(last.var_name.lexeme)
+        else:
+            path = yield from self.path_code(lvalue[:-1])
+            target = path + '.' + field_name(last.var_name.lexeme)
+        if last.array_expr is not None:
+            index = yield from self.expr_code(last.array_expr)
+            code = yield from self.expr_code(assign_stmt.expr)
+            self.emit(f'mypl_seti({target}, {index}, {code})')
+            return
+        # Python evaluates the right-hand side first, so a path with
+        # index expressions is evaluated into a temporary beforehand
+        if any(var_ref.array_expr is not None for var_ref in lvalue[:-1]):
+            temp = f't_{self.temp_count}'
+            self.temp_count += 1
+            path = yield from self.path_code(lvalue[:-1])
+            self.emit(f'{temp} = {path}')
+            target = f'{temp}.{field_name(last.var_name.lexeme)}'
+        code = yield from self.expr_code(assign_stmt.expr)
+        self.emit(f'{target} = {code}')
+
+
+    def visit_while_stmt(self, while_stmt):
+        condition = yield from self.condition_code(while_stmt.condition)
+        self.emit(f'while {condition}:')
+        self.loop_depth += 1
+        yield from self.gen_block(while_stmt.stmts)
+        self.loop_depth -= 1
+
+
+    def visit_for_stmt(self, for_stmt):
+        self.var_names.push_environment()
+        yield for_stmt.var_decl
+        condition = yield from self.condition_code(for_stmt.condition)
+        self.emit(f'while {condition}:')
+        self.loop_depth += 1
+        yield from self.gen_block(for_stmt.stmts + [for_stmt.assign_stmt])
+        self.loop_depth -= 1
+        self.var_names.pop_environment()
+
+
+    def visit_if_stmt(self, if_stmt):
+        condition = yield from self.condition_code(if_stmt.if_part.condition)
+        self.emit(f'if {condition}:')
+        yield from self.gen_block(if_stmt.if_part.stmts)
+        elif_depth = self.elif_depth
+        for else_if in if_stmt.else_ifs:
+            self.elif_depth += 1
+            condition = yield from self.condition_code(else_if.condition)
+            self.emit(f'elif {condition}:')
+            yield from self.gen_block(else_if.stmts)
+        if if_stmt.else_stmts:
+            self.emit('else:')
+            yield from self.gen_block(if_stmt.else_stmts)
+        self.elif_depth = elif_depth
+
+
+    def visit_call_expr(self, call_expr):
+        fun_name = call_expr.fun_name.lexeme
+        args = []
+        for arg in call_expr.args:
+            args.append((yield from self.expr_code(arg)))
+        args = ', '.join(args)
+        if fun_name in BUILT_IN_FUNS:
+            self.curr_expr = f'{BUILT_IN_FUNS[fun_name]}({args})'
+        else:
+            self.curr_expr = f'f_{fun_name}({args})'
+
+
+    def visit_expr(self, expr):
+        first = yield from self.expr_code(expr.first)
+        if expr.op is None:
+            code = first
+        else:
+            op = expr.op.token_type
+            rest = yield from self.expr_code(expr.rest)
+            # (mypl_and and mypl_or also check a right operand for null)
+            if op == TokenType.AND:
+                if not self.is_bool(expr.rest):
+                    rest = f'mypl_and({rest})'
+                if self.is_bool_term(expr.first):
+                    code = f'({first} and {rest})'
+                else:
+                    code = f'({rest} if mypl_and({first}) else False)'
+            elif op == TokenType.OR:
+                if not self.is_bool(expr.rest):
+                    rest = f'mypl_or({rest})'
+                if self.is_bool_term(expr.first):
+                    code = f'({first} or {rest})'
+                else:
+                    code = f'(True if mypl_or({first}) else {rest})'
+            # the VM evaluates the right operand of > and >= first
+            elif op == TokenType.GREATER:
+                code = f'({rest} < {first})'
+            elif op == TokenType.GREATER_EQ:
+                code = f'({rest} <= {first})'
+            elif op == TokenType.DIVIDE:
+                op_type = expr.op_type and expr.op_type.type_name.lexeme
+                if op_type == 'int':
+                    code = f'mypl_divi({first}, {rest})'
+                elif op_type == 'double':
+                    code = f'mypl_divd({first}, {rest})'
+                else:
+                    code = f'mypl_div({first}, {rest})'
+            else:
+                code = f'({first} {PYTHON_OPS[op]} {rest})'
+        if expr.not_op:
+            negated = Expr(False, expr.first, expr.op, expr.rest)
+            if self.is_bool(negated):
+                code = f'(not {code})'
+            else:
+                code = f'mypl_not({code})'
+        self.curr_expr = code
+
+
+    def visit_data_type(self, data_type):
+        # nothing to do here
+        pass
+
+
+    def visit_var_def(self, var_def):
+        # nothing to do here
+        pass
+
+
+    def visit_simple_term(self, simple_term):
+        yield simple_term.rvalue
+
+
+    def visit_complex_term(self, complex_term):
+        yield complex_term.expr
+
+
+    def visit_simple_rvalue(self, simple_rvalue):
+        val = simple_rvalue.value.lexeme
+        token_type = simple_rvalue.value.token_type
+        if token_type == TokenType.INT_VAL:
+            self.curr_expr = repr(int(val))
+        elif token_type == TokenType.DOUBLE_VAL:
+            # (folded constants can overflow to inf or nan)
+            val = float(val)
+            if math.isfinite(val):
+                self.curr_expr = repr(val)
+            else:
+                self.curr_expr = f"float('{val!r}')"
+        elif token_type == TokenType.STRING_VAL:
+            val = val.replace('\\n', '\n')
+            val = val.replace('\\t', '\t')
+            self.curr_expr = repr(val)
+        elif val == 'true':
+            self.curr_expr = 'True'
+        elif val == 'false':
+            self.curr_expr = 'False'
+        else:
+            self.curr_expr = 'None'
+
+
+    def visit_new_rvalue(self, new_rvalue):
+        if new_rvalue.array_expr is not None:
+            size = yield from self.expr_code(new_rvalue.array_expr)
+            self.curr_expr = f'mypl_alloca({size})'
+        else:
+            args = []
+            for param in new_rvalue.struct_params:
+                args.append((yield from self.expr_code(param)))
+            args = ', '.join(args)
+            self.curr_expr = f'S_{new_rvalue.type_name.lexeme}({args})'
+
+
+    def visit_var_rvalue(self, var_rvalue):
+        self.curr_expr = yield from self.path_code(var_rvalue.path)
@@ -0,0 +1,249 @@
+"""Runtime support for MyPL programs translated to Python (see
+mypl_py_gen.py). Generated modules import everything from here.
+
+NAME: <Ryan St. Mary>
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import dis
+import sys
+from mypl_error import MyPLError, VMError, TranslationError
+
+
+__all__ = ['MyPLArray', 'mypl_write', 'mypl_not', 'mypl_and', 'mypl_or',
+           'mypl_div', 'mypl_divi', 'mypl_divd', 'mypl_getc', 'mypl_toint', 'mypl_todbl',
+           'mypl_tostr', 'mypl_alloca', 'mypl_geti', 'mypl_seti',
+           'mypl_run', 'mypl_compile', 'mypl_exec']
+
+# Python call depth allowed for MyPL recursion. Since Python 3.11,
+# calls between Python functions do not use the C stack, so as on the
+# VM, recursion is only bounded by memory (before that, deep recursion
+# overflows the C stack)
+if sys.version_info >= (3, 11):
+    RECURSION_LIMIT = 2 ** 31 - 1
+else:
+    RECURSION_LIMIT = 10000
+
+# Python TypeError message fragment -> VM error (a null operand reaches
+# a Python operator that the VM guards with a null check)
+NULL_ERRORS = [
+    ('for +', 'null in add'),
+    ('concatenate', 'null in add'),
+    ('for -', 'null in sub'),
+    ('for *', 'null in mul'),
+    ('for /', 'null in div'),
+    ("'<='", 'null in cmple'),
+    ("'<'", 'null in cmplt'),
+    ('has no len()', 'null has no length'),
+]
+
+
+class MyPLArray(list):
+    """An array object. Unlike lists, two arrays are only equal if they
+    are the same object (the VM compares array ids).
+
+    """
+    __slots__ = ()
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+
+
+#----------------------------------------------------------------------
+# Built-ins and checked operations (same checks as the VM handlers)
+#----------------------------------------------------------------------
+
+def mypl_write(x):
+    if x is None:
+        x = 'null'
+    elif x.__class__ is bool:
+        x = 'true' if x else 'false'
+    print(x, end='')
+
+def mypl_not(x):
+    if x is None:
+        raise VMError('null in not')
+    return not x
+
+def mypl_and(x):
+    # true if the right operand of an and has to be evaluated
+    if x is None:
+        raise VMError('null in and')
+    return x is not False
+
+def mypl_or(x):
+    # true if an or is decided by its left operand
+    if x is None:
+        raise VMError('null in or')
+    return x is True
+
+def mypl_div(y, x):
+    if x in [0, 0.0]:
+        raise VMError('Divide by 0 error')
+    if x is None or y is None:
+        raise VMError('null in div')
+    result = y / x
+    if type(x) is int:
+        result = int(result)
+    return result
+
+def mypl_divi(y, x):
+    # (checked like the VM's DIVI: a zero divisor is reported before a
+    # null dividend)
+    try:
+        return int(y / x)
+    except TypeError:
+        if x == 0:
+            raise VMError('Divide by 0 error')
+        raise VMError('null in div')
+
+def mypl_divd(y, x):
+    try:
+        return y / x
+    except TypeError:
+        if x == 0:
+            raise VMError('Divide by 0 error')
+        raise VMError('null in div')
+
+def mypl_getc(y, x):
+    # x = string, y = index
+    if x is None or y is None:
+        raise VMError('null in array access')
+    if y > len(x) - 1 or y < 0:
+        raise VMError('bad index')
+    return x[y]
+
+def mypl_toint(x):
+    try:
+        return int(x)
+    except (ValueError, TypeError):
+        raise VMError('bad int in cast')
+
+def mypl_todbl(x):
+    try:
+        return float(x)
+    except (ValueError, TypeError):
+        raise VMError('bad double in cast')
+
+def mypl_tostr(x):
+    if x is None:
+        raise VMError('null in tostring')
+    return str(x)
+
+def mypl_alloca(size):
+    if type(size) is not int:
+        raise VMError('array size must be int')
+    if size < 0:
+        raise VMError('size can\'t be negative')
+    return MyPLArray([None] * size)
+
+def mypl_geti(array, index):
+    if index is None or array is None:
+        raise VMError('indicies can\'t be null')
+    if index >= len(array) or index < 0:
+        raise VMError('bad array index')
+    return array[index]
+
+def mypl_seti(array, index, value):
+    if index is None or array is None:
+        raise VMError('indicies can\'t be null')
+    if index < 0 or index >= len(array):
+        raise VMError('bad index')
+    array[index] = value
+
+
+#----------------------------------------------------------------------
+# Running a translated program
+#----------------------------------------------------------------------
+
+def failed_opcode(ex):
+    """Returns the name of the Python instruction that raised an
+    exception.
+
+    Args:
+        ex -- The exception.
+
+    """
+    tb = ex.__traceback__
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    return dis.opname[tb.tb_frame.f_code.co_code[tb.tb_lasti]]
+
+
+def runtime_error(ex):
+    """Returns the MyPLError for a Python exception raised by translated
+    code, or None if the exception is not a MyPL runtime error.
+
+    Args:
+        ex -- The exception.
+
+    """
+    if isinstance(ex, MyPLError):
+        return ex
+    if isinstance(ex, ZeroDivisionError):
+        return VMError('Divide by 0 error')
+    if isinstance(ex, RecursionError):
+        return VMError('call stack overflow')
+    if isinstance(ex, AttributeError) and "'NoneType'" in str(ex):
+        # (the VM's GETF and SETF report null differently)
+        if failed_opcode(ex) == 'STORE_ATTR':
+            return VMError('bad heap index')
+        return VMError('bad head index')
+    if isinstance(ex, TypeError):
+        for fragment, message in NULL_ERRORS:
+            if fragment in str(ex):
+                return VMError(message)
+    return None
+
+
+def mypl_run(main):
+    """Run the main function of a translated program, reporting Python
+    errors as the corresponding MyPL VM errors.
+
+    Args:
+        main -- The translated main function.
+
+    """
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+    try:
+        main()
+    except Exception as ex:
+        error = runtime_error(ex)
+        if error is None:
+            raise
+        raise error from None
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def mypl_compile(source):
+    """Compile a translated program, raising a TranslationError if it
+    nests too deeply for the Python compiler (its parser reports that as
+    a MemoryError, the later passes as a RecursionError).
+
+    Args:
+        source -- The generated Python module source.
+
+    """
+    try:
+        return compile(source, '<mypl>', 'exec')
+    except (RecursionError, MemoryError):
+        raise TranslationError('program nests too deeply for Python') from None
+
+
+def mypl_exec(program):
+    """Compile (if not already compiled) and run a translated program.
+
+    Args:
+        program -- The generated Python module source, or the code object
+            mypl_compile returned for it.
+
+    """
+    if isinstance(program, str):
+        program = mypl_compile(program)
+    namespace = {'__name__': 'mypl_program'}
+    exec(program, namespace)
+    mypl_run(namespace['f_main'])
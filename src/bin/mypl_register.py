@@ -0,0 +1,675 @@
+"""Register-based IR and execution mode for the MyPL VM.
+
+The stack code produced by the CodeGenerator (after the peephole pass) is
+lowered to three-address instructions over numbered frame slots
+(registers): the function's variables, then one temporary per operand
+stack depth, then the constants the function uses. LOADs and PUSHes
+become register references instead of instructions, and values are only
+copied into their stack-depth temporaries at basic block boundaries.
+
+NAME: <Ryan St. Mary>
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+from dataclasses import dataclass, field
+from typing import Any
+
+from mypl_error import *
+from mypl_opcode import *
+from mypl_frame import *
+from mypl_vm import *
+
+
+# typed and quickened opcodes are lowered to the generic operator (the
+# register handlers report null operands through the TypeError they raise)
+GENERIC_OPCODES = {
+    OpCode.ADDI: OpCode.ADD, OpCode.ADDD: OpCode.ADD, OpCode.ADDS: OpCode.ADD,
+    OpCode.SUBI: OpCode.SUB, OpCode.SUBD: OpCode.SUB,
+    OpCode.MULI: OpCode.MUL, OpCode.MULD: OpCode.MUL,
+    OpCode.DIVI: OpCode.DIV, OpCode.DIVD: OpCode.DIV,
+    OpCode.CMPLTI: OpCode.CMPLT, OpCode.CMPLEI: OpCode.CMPLE,
+    OpCode.QADDI: OpCode.ADD, OpCode.QADDD: OpCode.ADD, OpCode.QADDS: OpCode.ADD,
+    OpCode.QSUBI: OpCode.SUB, OpCode.QSUBD: OpCode.SUB,
+    OpCode.QMULI: OpCode.MUL, OpCode.QMULD: OpCode.MUL,
+    OpCode.QCMPLTI: OpCode.CMPLT, OpCode.QCMPLEI: OpCode.CMPLE,
+}
+
+# dst = a op b
+BINARY_OPCODES = [OpCode.ADD, OpCode.SUB, OpCode.MUL, OpCode.DIV,
+                  OpCode.CMPLT, OpCode.CMPLE, OpCode.CMPEQ, OpCode.CMPNE]
+
+# rarely executed opcodes that run the stack VM handler on the operand
+# stack: A = (dst or None, source registers in push order, stack operand)
+ADAPTED_OPCODES = [OpCode.AND, OpCode.OR, OpCode.READ, OpCode.LEN,
+                   OpCode.GETC, OpCode.TOINT, OpCode.TODBL, OpCode.TOSTR,
+                   OpCode.ALLOCS, OpCode.INITS, OpCode.ALLOCA]
+
+# adapted opcode -> (values popped, values pushed); INITS pops A values
+ADAPTED_EFFECTS = {
+    OpCode.AND: (2, 1), OpCode.OR: (2, 1), OpCode.READ: (0, 1),
+    OpCode.LEN: (1, 1), OpCode.GETC: (2, 1), OpCode.TOINT: (1, 1),
+    OpCode.TODBL: (1, 1), OpCode.TOSTR: (1, 1), OpCode.ALLOCS: (0, 1),
+    OpCode.INITS: (None, 1), OpCode.ALLOCA: (1, 1),
+}
+
+# register opcodes with a jump target (as the last operand)
+REGISTER_JUMPS = [OpCode.JMP, OpCode.JMPF, OpCode.JMPFP, OpCode.JMPTP]
+
+
+@dataclass
+class RegisterTemplate:
+    """A function lowered to register instructions. Frames running it
+    keep their registers in VMFrame.variables.
+
+    """
+    function_name: str
+    arg_count: int
+    var_count: int = 0                  # registers 0 .. var_count-1
+    temp_count: int = 0                 # then one per stack depth
+    instructions: list[VMInstr] = field(default_factory=list)
+    reg_init: list[Any] = field(default_factory=list)  # constants filled in
+    opcodes: list[int] = field(default_factory=list)
+    operands: list[Any] = field(default_factory=list)
+
+    def reg_name(self, reg):
+        """Returns a printable name for a register."""
+        if reg < self.var_count:
+            return f'v{reg}'
+        if reg < self.var_count + self.temp_count:
+            return f't{reg - self.var_count}'
+        return repr(self.reg_init[reg])
+
+    def instr_str(self, instr):
+        """Returns a printable form of a register instruction."""
+        op = instr.opcode
+        args = instr.operand
+        r = self.reg_name
+        name = op.name
+        if op == OpCode.MOV:
+            return f'{r(args[0])} = {r(args[1])}'
+        if op in BINARY_OPCODES:
+            return f'{r(args[0])} = {name} {r(args[1])}, {r(args[2])}'
+        if op == OpCode.NOT:
+            return f'{r(args[0])} = NOT {r(args[1])}'
+        if op == OpCode.JMP:
+            return f'JMP {args}'
+        if op in [OpCode.JMPF, OpCode.JMPFP, OpCode.JMPTP]:
+            return f'{name} {r(args[0])}, {args[1]}'
+        if op == OpCode.CALL:
+            regs = ', '.join(r(a) for a in args[2])
+            return f'{r(args[0])} = CALL {args[1]}({regs})'
+        if op == OpCode.TCALL:
+            regs = ', '.join(r(a) for a in args[1])
+            return f'TCALL {args[0]}({regs})'
+        if op in [OpCode.RET, OpCode.WRITE]:
+            return f'{name} {r(args)}'
+        if op in [OpCode.GETF, OpCode.GETI]:
+            return f'{r(args[0])} = {name} {r(args[1])}, {args[2] if op == OpCode.GETF else r(args[2])}'
+        if op == OpCode.SETF:
+            return f'SETF {r(args[0])}, {args[1]}, {r(args[2])}'
+        if op == OpCode.SETI:
+            return f'SETI {r(args[0])}, {r(args[1])}, {r(args[2])}'
+        dst, srcs, arg = args
+        s = f'{r(dst)} = ' if dst is not None else ''
+        s += name + (f'({arg})' if arg is not None else '')
+        return s + ' ' + ', '.join(r(a) for a in srcs)
+
+
+class RegisterLowering:
+    """Lowers stack-code frame templates to register templates."""
+
+    def __init__(self, templates):
+        """Create a lowering pass.
+
+        Args:
+            templates -- Function name -> VMFrameTemplate (for the
+                         argument counts of called functions).
+
+        """
+        self.templates = templates
+
+
+    #----------------------------------------------------------------------
+    # Stack depth analysis
+    #----------------------------------------------------------------------
+
+    def stack_effect(self, instr):
+        """Returns (values popped, values pushed) of a stack instruction."""
+        op = GENERIC_OPCODES.get(instr.opcode, instr.opcode)
+        if op in [OpCode.PUSH, OpCode.LOAD, OpCode.DUP]:
+            return (1, 2) if op == OpCode.DUP else (0, 1)
+        if op in [OpCode.POP, OpCode.STORE, OpCode.JMPF, OpCode.RET,
+                  OpCode.WRITE]:
+            return (1, 0)
+        if op in BINARY_OPCODES or op == OpCode.GETI:
+            return (2, 1)
+        if op in [OpCode.NOT, OpCode.GETF]:
+            return (1, 1)
+        if op == OpCode.SETF:
+            return (2, 0)
+        if op == OpCode.SETI:
+            return (3, 0)
+        if op in [OpCode.CALL, OpCode.TCALL]:
+            argc = self.templates[instr.operand].arg_count
+            return (argc, 1) if op == OpCode.CALL else (argc, 0)
+        if op in ADAPTED_EFFECTS:
+            pops, pushes = ADAPTED_EFFECTS[op]
+            return (instr.operand if pops is None else pops, pushes)
+        # NOP, JMP, and JMPFP/JMPTP (which pop only when falling through)
+        return (0, 0)
+
+
+    def stack_depths(self, instrs, start_depth):
+        """Returns the operand stack depth before each reachable
+        instruction (None for unreachable ones).
+
+        """
+        depths = [None] * len(instrs)
+        pending = [(0, start_depth)]
+        while pending:
+            pc, depth = pending.pop()
+            while pc < len(instrs):
+                if depths[pc] is not None:
+                    if depths[pc] != depth:
+                        raise VMError(f'inconsistent stack depth at {pc}')
+                    break
+                depths[pc] = depth
+                instr = instrs[pc]
+                pops, pushes = self.stack_effect(instr)
+                depth = depth - pops + pushes
+                if instr.opcode in [OpCode.JMPFP, OpCode.JMPTP]:
+                    pending.append((instr.operand, depth))
+                    depth -= 1
+                elif instr.opcode == OpCode.JMPF:
+                    pending.append((instr.operand, depth))
+                elif instr.opcode == OpCode.JMP:
+                    pending.append((instr.operand, depth))
+                    break
+                if instr.opcode in [OpCode.RET, OpCode.TCALL]:
+                    break
+                pc += 1
+        return depths
+
+
+    #----------------------------------------------------------------------
+    # Lowering
+    #----------------------------------------------------------------------
+
+    def lower(self, template):
+        """Lower a (not linked) stack-code template.
+
+        Args:
+            template -- The VMFrameTemplate to lower.
+
+        Returns: The RegisterTemplate.
+
+        """
+        instrs = list(template.instructions)
+        argc = template.arg_count
+        # the prologue stores the arguments into the first variables; in
+        # register form the caller writes them there directly
+        prologue = [STORE(i) for i in range(argc)]
+        if [(i.opcode, i.operand) for i in instrs[:argc]] != [(i.opcode, i.operand) for i in prologue]:
+            raise VMError(f'cannot lower {template.function_name}: unexpected prologue')
+        depths = self.stack_depths(instrs, argc)
+        var_count = argc
+        for instr in instrs:
+            if instr.opcode in [OpCode.LOAD, OpCode.STORE]:
+                var_count = max(var_count, instr.operand + 1)
+        temp_count = max([d for d in depths if d is not None] + [0]) + 1
+        self.result = RegisterTemplate(template.function_name, argc,
+                                       var_count, temp_count)
+        self.result.reg_init = [None] * (var_count + temp_count)
+        self.consts = {}
+        # leaders: jump targets and instructions after jumps
+        leaders = set()
+        for pc, instr in enumerate(instrs):
+            if instr.opcode in REGISTER_JUMPS:
+                leaders.add(instr.operand)
+                leaders.add(pc + 1)
+        new_index = [0] * (len(instrs) + 1)
+        code = self.result.instructions
+        self.sym = []
+        self.last_dst = None
+        falls_through = False
+        for pc in range(argc, len(instrs)):
+            if depths[pc] is None:
+                new_index[pc] = len(code)
+                continue
+            if pc in leaders:
+                if falls_through:
+                    self.materialize(len(self.sym))
+                new_index[pc] = len(code)
+                self.sym = [self.temp(k) for k in range(depths[pc])]
+                self.last_dst = None
+            else:
+                new_index[pc] = len(code)
+            falls_through = self.lower_instr(instrs[pc])
+        new_index[len(instrs)] = len(code)
+        # patch jump targets
+        for i, instr in enumerate(code):
+            if instr.opcode == OpCode.JMP:
+                code[i] = VMInstr(OpCode.JMP, new_index[instr.operand])
+            elif instr.opcode in REGISTER_JUMPS:
+                reg, target = instr.operand
+                code[i] = VMInstr(instr.opcode, (reg, new_index[target]))
+        self.result.opcodes = [instr.opcode.value for instr in code]
+        self.result.operands = [instr.operand for instr in code]
+        return self.result
+
+
+    def temp(self, depth):
+        """Returns the register of the temporary for a stack depth."""
+        return self.result.var_count + depth
+
+
+    def const(self, value):
+        """Returns the register holding a constant."""
+        key = const_key(value)
+        if key not in self.consts:
+            self.consts[key] = len(self.result.reg_init)
+            self.result.reg_init.append(value)
+        return self.consts[key]
+
+
+    def emit(self, opcode, operand, dst=None):
+        """Add a register instruction (remembering it if it writes dst)."""
+        self.result.instructions.append(VMInstr(opcode, operand))
+        self.last_dst = dst
+
+
+    def materialize(self, count):
+        """Copy the bottom count symbolic stack values into their
+        stack-depth temporaries.
+
+        """
+        for k in range(count):
+            if self.sym[k] != self.temp(k):
+                self.emit(OpCode.MOV, (self.temp(k), self.sym[k]))
+                self.sym[k] = self.temp(k)
+        self.last_dst = None
+
+
+    def push_result(self):
+        """Returns the destination register for a pushed result."""
+        dst = self.temp(len(self.sym))
+        self.sym.append(dst)
+        return dst
+
+
+    def lower_instr(self, instr):
+        """Lower one stack instruction. Returns False if execution cannot
+        fall through to the next instruction.
+
+        """
+        op = GENERIC_OPCODES.get(instr.opcode, instr.opcode)
+        sym = self.sym
+        if op == OpCode.PUSH:
+            sym.append(self.const(instr.operand))
+        elif op == OpCode.LOAD:
+            sym.append(instr.operand)
+        elif op == OpCode.POP:
+            sym.pop()
+        elif op == OpCode.DUP:
+            sym.append(sym[-1])
+        elif op == OpCode.NOP:
+            pass
+        elif op == OpCode.STORE:
+            var = instr.operand
+            src = sym.pop()
+            pending = [k for k in range(len(sym)) if sym[k] == var]
+            # the instruction that computed the value can write the
+            # variable directly
+            if (not pending and self.last_dst is not None and
+                    src == self.last_dst and src == self.temp(len(sym))):
+                last = self.result.instructions[-1]
+                self.result.instructions[-1] = VMInstr(last.opcode, (var,) + last.operand[1:])
+            else:
+                for k in pending:
+                    self.emit(OpCode.MOV, (self.temp(k), var))
+                    sym[k] = self.temp(k)
+                self.emit(OpCode.MOV, (var, src))
+            self.last_dst = None
+        elif op in BINARY_OPCODES:
+            b = sym.pop()
+            a = sym.pop()
+            dst = self.push_result()
+            self.emit(op, (dst, a, b), dst)
+        elif op == OpCode.NOT:
+            a = sym.pop()
+            dst = self.push_result()
+            self.emit(op, (dst, a), dst)
+        elif op == OpCode.GETF:
+            obj = sym.pop()
+            dst = self.push_result()
+            self.emit(op, (dst, obj, instr.operand), dst)
+        elif op == OpCode.GETI:
+            index = sym.pop()
+            array = sym.pop()
+            dst = self.push_result()
+            self.emit(op, (dst, array, index), dst)
+        elif op == OpCode.SETF:
+            value = sym.pop()
+            obj = sym.pop()
+            self.emit(op, (obj, instr.operand, value))
+        elif op == OpCode.SETI:
+            value = sym.pop()
+            index = sym.pop()
+            array = sym.pop()
+            self.emit(op, (array, index, value))
+        elif op == OpCode.WRITE:
+            self.emit(op, sym.pop())
+        elif op in [OpCode.CALL, OpCode.TCALL]:
+            argc = self.templates[instr.operand].arg_count
+            args = tuple(sym[len(sym) - argc:])
+            del sym[len(sym) - argc:]
+            if op == OpCode.TCALL:
+                self.emit(op, (instr.operand, args))
+                return False
+            dst = self.push_result()
+            self.emit(op, (dst, instr.operand, args), dst)
+        elif op == OpCode.RET:
+            self.emit(op, sym.pop())
+            return False
+        elif op == OpCode.JMP:
+            self.materialize(len(sym))
+            self.emit(op, instr.operand)
+            return False
+        elif op == OpCode.JMPF:
+            cond = sym.pop()
+            self.materialize(len(sym))
+            self.emit(op, (cond, instr.operand))
+        elif op in [OpCode.JMPFP, OpCode.JMPTP]:
+            self.materialize(len(sym))
+            self.emit(op, (sym.pop(), instr.operand))
+        elif op in ADAPTED_OPCODES:
+            pops, pushes = self.stack_effect(instr)
+            srcs = tuple(sym[len(sym) - pops:]) if pops else ()
+            del sym[len(sym) - pops:]
+            dst = self.push_result() if pushes else None
+            self.emit(op, (dst, srcs, instr.operand), dst)
+        else:
+            raise VMError(f'cannot lower {instr}')
+        return True
+
+
+class RegisterVM(VM):
+    """VM that runs the register form of the generated code."""
+
+    def __init__(self, dispatch='table', gc_threshold=GC_THRESHOLD, heap='oid'):
+        """Creates a register VM (table dispatch and oid heap only).
+
+        Args:
+            dispatch -- Must be 'table'.
+            gc_threshold -- Number of heap allocations that triggers a
+                            garbage collection (0 turns collection off).
+            heap -- Must be 'oid'.
+
+        """
+        if dispatch != 'table' or heap != 'oid':
+            raise VMError('register mode requires table dispatch and the oid heap')
+        super().__init__(dispatch, gc_threshold, heap, quicken=False)
+        self.reg_templates = {}      # function name -> RegisterTemplate
+        self.reg_table = [None] * len(self.op_table)
+        for op in OpCode:
+            handler = getattr(self, 'rop_' + op.name.lower(), None)
+            if handler is None and op in ADAPTED_OPCODES:
+                handler = self.adapted(self.handlers[op])
+            self.reg_table[op.value] = handler
+
+
+    def __repr__(self):
+        """Returns a string representation of the register templates."""
+        self.lower()
+        s = ''
+        for name, template in self.reg_templates.items():
+            s += f'\nFrame {name} (v: {template.var_count}, t: {template.temp_count})\n'
+            for i, instr in enumerate(template.instructions):
+                s += f'  {i}: {template.instr_str(instr)}\n'
+        return s
+
+
+    def instr_str(self, template, instr):
+        """Returns the printable form of a register instruction (as in
+        the register listing).
+
+        """
+        return template.instr_str(instr)
+
+
+    def lower(self):
+        """Lower every frame template to its register form."""
+        if self.reg_templates:
+            return
+        lowering = RegisterLowering(self.frame_templates)
+        for name, template in self.frame_templates.items():
+            self.reg_templates[name] = lowering.lower(template)
+
+
+    def instruction_count(self):
+        """Returns the total number of register instructions."""
+        self.lower()
+        return sum(len(t.instructions) for t in self.reg_templates.values())
+
+
+    def run(self, debug=False):
+        """Run the virtual machine on the register form of the code."""
+        if not 'main' in self.frame_templates:
+            self.error('No "main" functrion')
+        self.lower()
+        template = self.reg_templates['main']
+        frame = VMFrame(template, 0, template.reg_init[:])
+        self.call_stack.append(frame)
+        reg_table = self.reg_table
+        if debug:
+            reg_table = [self.traced(i, op) for i, op in enumerate(reg_table)]
+        call_stack = self.call_stack
+        opcodes = template.opcodes
+        operands = template.operands
+        while call_stack:
+            pc = frame.pc
+            if pc >= len(opcodes):
+                break
+            frame.pc = pc + 1
+            next_frame = reg_table[opcodes[pc]](frame, operands[pc])
+            if next_frame is not None:
+                frame = next_frame
+                opcodes = frame.template.opcodes
+                operands = frame.template.operands
+
+
+    #----------------------------------------------------------------------
+    # Register handlers
+    #----------------------------------------------------------------------
+
+    def adapted(self, handler):
+        """Wrap a stack handler: push the source registers, run it, and pop
+        its result into the destination register.
+
+        """
+        def adapted_handler(frame, operand):
+            dst, srcs, arg = operand
+            regs = frame.variables
+            stack = frame.operand_stack
+            for src in srcs:
+                stack.append(regs[src])
+            handler(frame, arg)
+            if dst is not None:
+                regs[dst] = stack.pop()
+        return adapted_handler
+
+    def rop_mov(self, frame, operand):
+        regs = frame.variables
+        regs[operand[0]] = regs[operand[1]]
+
+    def rop_add(self, frame, operand):
+        dst, a, b = operand
+        regs = frame.variables
+        try:
+            regs[dst] = regs[a] + regs[b]
+        except TypeError:
+            self.error('null in add', frame)
+
+    def rop_sub(self, frame, operand):
+        dst, a, b = operand
+        regs = frame.variables
+        try:
+            regs[dst] = regs[a] - regs[b]
+        except TypeError:
+            self.error('null in sub', frame)
+
+    def rop_mul(self, frame, operand):
+        dst, a, b = operand
+        regs = frame.variables
+        try:
+            regs[dst] = regs[a] * regs[b]
+        except TypeError:
+            self.error('null in mul', frame)
+
+    def rop_div(self, frame, operand):
+        dst, a, b = operand
+        regs = frame.variables
+        x = regs[b]
+        y = regs[a]
+        if x in [0, 0.0]:
+            self.error('Divide by 0 error', frame)
+        if x is None or y is None:
+            self.error('null in div', frame)
+        regs[dst] = int(y / x) if type(x) is int else y / x
+
+    def rop_cmplt(self, frame, operand):
+        dst, a, b = operand
+        regs = frame.variables
+        try:
+            regs[dst] = regs[a] < regs[b]
+        except TypeError:
+            self.error('null in cmplt', frame)
+
+    def rop_cmple(self, frame, operand):
+        dst, a, b = operand
+        regs = frame.variables
+        try:
+            regs[dst] = regs[a] <= regs[b]
+        except TypeError:
+            self.error('null in cmple', frame)
+
+    def rop_cmpeq(self, frame, operand):
+        dst, a, b = operand
+        regs = frame.variables
+        regs[dst] = regs[a] == regs[b]
+
+    def rop_cmpne(self, frame, operand):
+        dst, a, b = operand
+        regs = frame.variables
+        regs[dst] = regs[a] != regs[b]
+
+    def rop_not(self, frame, operand):
+        regs = frame.variables
+        x = regs[operand[1]]
+        if x is None:
+            self.error('null in not', frame)
+        regs[operand[0]] = not x
+
+    def rop_jmp(self, frame, operand):
+        frame.pc = operand
+
+    def rop_jmpf(self, frame, operand):
+        if frame.variables[operand[0]] == False:
+            frame.pc = operand[1]
+
+    def rop_jmpfp(self, frame, operand):
+        x = frame.variables[operand[0]]
+        if x is False:
+            frame.pc = operand[1]
+        elif x is None:
+            self.error('null in and', frame)
+
+    def rop_jmptp(self, frame, operand):
+        x = frame.variables[operand[0]]
+        if x is True:
+            frame.pc = operand[1]
+        elif x is None:
+            self.error('null in or', frame)
+
+    def rop_call(self, frame, operand):
+        dst, name, args = operand
+        template = self.reg_templates[name]
+        regs = frame.variables
+        new_regs = template.reg_init[:]
+        for i, arg in enumerate(args):
+            new_regs[i] = regs[arg]
+        f = VMFrame(template, 0, new_regs)
+        self.call_stack.append(f)
+        return f
+
+    def rop_tcall(self, frame, operand):
+        name, args = operand
+        template = self.reg_templates[name]
+        regs = frame.variables
+        new_regs = template.reg_init[:]
+        for i, arg in enumerate(args):
+            new_regs[i] = regs[arg]
+        frame.template = template
+        frame.pc = 0
+        frame.variables = new_regs
+        return frame
+
+    def rop_ret(self, frame, operand):
+        value = frame.variables[operand]
+        self.call_stack.pop()
+        if self.call_stack:
+            frame = self.call_stack[-1]
+            # the caller's CALL instruction names the result register
+            dst = frame.template.operands[frame.pc - 1][0]
+            frame.variables[dst] = value
+        return frame
+
+    def rop_write(self, frame, operand):
+        x = frame.variables[operand]
+        if x is None:
+            x = 'null'
+        if type(x) is bool:
+            x = str(x).lower()
+        print(x, end='')
+
+    def rop_getf(self, frame, operand):
+        dst, obj, offset = operand
+        regs = frame.variables
+        x = regs[obj]
+        if x is None:
+            self.error('bad head index', frame)
+        regs[dst] = self.struct_heap[x][offset]
+
+    def rop_setf(self, frame, operand):
+        obj, offset, value = operand
+        regs = frame.variables
+        y = regs[obj]
+        if y is None:
+            self.error('bad heap index', frame)
+        self.struct_heap[y][offset] = regs[value]
+
+    def rop_geti(self, frame, operand):
+        dst, arr, index = operand
+        regs = frame.variables
+        x = regs[index]
+        y = regs[arr]
+        if x is None or y is None:
+            self.error('indicies can\'t be null', frame)
+        array = self.array_heap[y]
+        if x >= len(array) or x < 0:
+            self.error('bad array index', frame)
+        regs[dst] = array[x]
+
+    def rop_seti(self, frame, operand):
+        arr, index, value = operand
+        regs = frame.variables
+        y = regs[index]
+        z = regs[arr]
+        if y is None or z is None:
+            self.error('indicies can\'t be null', frame)
+        array = self.array_heap[z]
+        if y < 0 or y >= len(array):
+            self.error('bad index', frame)
+        array[y] = regs[value]
@@ -82,16 +82,16 @@ class SemanticChecker(Visitor):
             self.error('missing main function', None)
         # check each struct
         for struct in self.structs.values():
-            struct.accept(self)
+            walk(self, struct)
         # check each function
         for fun in self.functions.values():
-            fun.accept(self)
+            walk(self, fun)
         
         
     def visit_struct_def(self, struct_def):
         self.symbol_table.push_environment()
         for field in struct_def.fields:
-            field.accept(self)
+            yield field
         self.symbol_table.pop_environment()
         
 
@@ -102,26 +102,26 @@ class SemanticChecker(Visitor):
             self.error('invalid return type', fun_def.return_type.type_name) 
         self.symbol_table.add('return', fun_def.return_type)
         for param in fun_def.params:
-            param.accept(self)
+            yield param
             
         for stmt in fun_def.stmts:
-            stmt.accept(self)
+            yield stmt
         self.symbol_table.pop_environment()
         
         
     def visit_return_stmt(self, return_stmt):
         # TODO
-        return_stmt.expr.accept(self)
+        yield return_stmt.expr
         if self.curr_type.type_name.lexeme not in [ self.symbol_table.get('return').type_name.lexeme, 'void']:
             self.error('invalid return type', None)
         
         
             
     def visit_var_decl(self, var_decl):
-        var_decl.var_def.accept(self)
+        yield var_decl.var_def
         lval_type = self.curr_type
         if var_decl.expr != None:
-            var_decl.expr.accept(self)
+            yield var_decl.expr
         
        
         
@@ -176,7 +176,7 @@ class SemanticChecker(Visitor):
             ltype = first_type
        
         # curr type = expr  type
-        assign_stmt.expr.accept(self)
+        yield assign_stmt.expr
         
         
         # pdb.set_trace()
@@ -192,7 +192,7 @@ class SemanticChecker(Visitor):
     def visit_while_stmt(self, while_stmt):
         # TODO
         self.symbol_table.push_environment()
-        while_stmt.condition.accept(self)
+        yield while_stmt.condition
         
       
 
@@ -200,45 +200,45 @@ class SemanticChecker(Visitor):
             self.error('non boolean while condition', self.curr_type.type_name)
         
         for stmt in while_stmt.stmts:
-            stmt.accept(self)
+            yield stmt
         self.symbol_table.pop_environment()
         
     def visit_for_stmt(self, for_stmt):
         # TODO
         self.symbol_table.push_environment()
-        for_stmt.var_decl.accept(self)
-        for_stmt.condition.accept(self)
+        yield for_stmt.var_decl
+        yield for_stmt.condition
         if self.curr_type.type_name.lexeme != 'bool' or self.curr_type.is_array:
             self.error('non boolean for condition', None)
-        for_stmt.assign_stmt.accept(self)
+        yield for_stmt.assign_stmt
 
         for stmt in for_stmt.stmts:
-            stmt.accept(self)
+            yield stmt
         self.symbol_table.pop_environment()
         
     def visit_if_stmt(self, if_stmt):
         # TODO
         self.symbol_table.push_environment()
-        if_stmt.if_part.condition.accept(self)
+        yield if_stmt.if_part.condition
         if self.curr_type.type_name.lexeme != 'bool'or self.curr_type.is_array:
             self.error('non-bool type in if condition', None)
         for stmt in if_stmt.if_part.stmts:
-            stmt.accept(self)
+            yield stmt
         self.symbol_table.pop_environment()
 
         
         for else_if in if_stmt.else_ifs:
             self.symbol_table.push_environment()
-            else_if.condition.accept(self)
+            yield else_if.condition
             if self.curr_type.type_name.lexeme != 'bool' or self.curr_type.is_array:
                 self.error('non-bool type in if condition', None)
             for stmt in else_if.stmts:
-                stmt.accept(self)
+                yield stmt
             self.symbol_table.pop_environment()
         
         self.symbol_table.push_environment()
         for stmt in if_stmt.else_stmts:  
-            stmt.accept(self)
+            yield stmt
         self.symbol_table.pop_environment()      
 
         
@@ -252,7 +252,7 @@ class SemanticChecker(Visitor):
         if f_name == 'print':
             if len(call_expr.args) != 1:
                 self.error('wrong number of arguments in print', call_expr.fun_name)
-            call_expr.args[0].accept(self)
+            yield call_expr.args[0]
             if self.curr_type.type_name.lexeme not in ['string', 'double', 'int', 'bool'] or self.curr_type.is_array:
                 self.error('non string arg in print', call_expr.fun_name)
             self.curr_type = DataType(False, Token(TokenType.VOID_TYPE, 'void', None, None))
@@ -267,7 +267,7 @@ class SemanticChecker(Visitor):
         if f_name == 'itos':
             if len(call_expr.args) != 1:
                 self.error('wrong number of arguments in itos', call_expr.fun_name)
-            call_expr.args[0].accept(self)
+            yield call_expr.args[0]
             if self.curr_type.type_name.lexeme != 'int' or self.curr_type.is_array:
                 self.error('non int arg in itos', call_expr.fun_name)
             self.curr_type = DataType(False, Token(TokenType.STRING_TYPE, 'string', None, None))
@@ -276,7 +276,7 @@ class SemanticChecker(Visitor):
         if f_name == 'itod':
             if len(call_expr.args) != 1:
                 self.error('wrong number of arguments in itos', call_expr.fun_name)
-            call_expr.args[0].accept(self)
+            yield call_expr.args[0]
             if self.curr_type.type_name.lexeme != 'int' or self.curr_type.is_array:
                 self.error('non int arg in itod', call_expr.fun_name)
             self.curr_type = DataType(False, Token(TokenType.DOUBLE_TYPE, 'double', None, None))
@@ -285,7 +285,7 @@ class SemanticChecker(Visitor):
         if f_name == 'dtos':
             if len(call_expr.args) != 1:
                 self.error('wrong number of arguments in dtos', call_expr.fun_name)
-            call_expr.args[0].accept(self)
+            yield call_expr.args[0]
             if self.curr_type.type_name.lexeme != 'double' or self.curr_type.is_array:
                 self.error('non double arg in dtos', call_expr.fun_name)
             self.curr_type = DataType(False, Token(TokenType.STRING_TYPE, 'string', None, None))
@@ -294,7 +294,7 @@ class SemanticChecker(Visitor):
         if f_name == 'dtoi':
             if len(call_expr.args) != 1:
                 self.error('wrong number of arguments in dtoi', call_expr.fun_name)
-            call_expr.args[0].accept(self)
+            yield call_expr.args[0]
             if self.curr_type.type_name.lexeme != 'double' or self.curr_type.is_array:
                 self.error('non double arg in dtoi', call_expr.fun_name)
             self.curr_type = DataType(False, Token(TokenType.INT_TYPE, 'int', None, None))
@@ -303,7 +303,7 @@ class SemanticChecker(Visitor):
         if f_name == 'stoi':
             if len(call_expr.args) != 1:
                 self.error('wrong number of arguments in stoi', call_expr.fun_name)
-            call_expr.args[0].accept(self)
+            yield call_expr.args[0]
             if self.curr_type.type_name.lexeme != 'string' or self.curr_type.is_array:
                 self.error('non string arg in stoi', call_expr.fun_name)
             self.curr_type = DataType(False, Token(TokenType.INT_TYPE, 'int', None, None))
@@ -312,7 +312,7 @@ class SemanticChecker(Visitor):
         if f_name == "stod":
             if len(call_expr.args) != 1:
                 self.error('wrong number of arguments in stod', call_expr.fun_name)
-            call_expr.args[0].accept(self)
+            yield call_expr.args[0]
             if self.curr_type.type_name.lexeme != 'string' or self.curr_type.is_array:
                 self.error('non string arg in stod', call_expr.fun_name)
             self.curr_type = DataType(False, Token(TokenType.DOUBLE_TYPE, 'double', None, None))
@@ -321,7 +321,7 @@ class SemanticChecker(Visitor):
         if f_name == 'length':
             if len(call_expr.args) != 1:
                 self.error('wrong number of arguments in length', call_expr.fun_name)
-            call_expr.args[0].accept(self)
+            yield call_expr.args[0]
             if self.curr_type.type_name.lexeme != 'string' and not self.curr_type.is_array:
                 self.error('invalid arg in length', call_expr.fun_name)
             self.curr_type = DataType(False, Token(TokenType.INT_TYPE, 'int', None, None))
@@ -330,10 +330,10 @@ class SemanticChecker(Visitor):
         if f_name == 'get':
             if len(call_expr.args) != 2:
                 self.error('wrong number of arguments in length', call_expr.fun_name)
-            call_expr.args[0].accept(self)
+            yield call_expr.args[0]
             if self.curr_type.type_name.lexeme != 'int':
                 self.error('invalid arg in length', call_expr.fun_name)
-            call_expr.args[1].accept(self)
+            yield call_expr.args[1]
             if self.curr_type.type_name.lexeme != 'string' or self.curr_type.is_array:
                 self.error('invalid arg in length', call_expr.fun_name)
             self.curr_type = DataType(False, Token(TokenType.STRING_TYPE, 'string', None, None))
@@ -348,7 +348,7 @@ class SemanticChecker(Visitor):
             self.error('wrong amount of params', call_expr.fun_name)
         i = 0
         for arg in call_expr.args:
-            arg.accept(self)
+            yield arg
             if self.curr_type.type_name.lexeme not in [fun_def.params[i].data_type.type_name.lexeme, 'void']:
                 self.error('invalid parameter type', arg.first.rvalue.value)  
             i = i+1
@@ -357,11 +357,11 @@ class SemanticChecker(Visitor):
         
 
     def visit_expr(self, expr):
-        expr.first.accept(self)
+        yield expr.first
         first_type = self.curr_type
         
         if expr.op != None:
-            expr.rest.accept(self)
+            yield expr.rest
             rest_type = self.curr_type
             
         is_arr = False
@@ -372,6 +372,11 @@ class SemanticChecker(Visitor):
             
         
             
+            # record the (common) operand type for the code generator
+            if (f_type_name == r_type_name and not first_type.is_array and
+                    not rest_type.is_array):
+                expr.op_type = first_type
+            
             type_token = Token(None, None, None, None)
             
             if f_type_name != r_type_name and (r_type_name != 'void' and f_type_name != 'void'):
@@ -424,7 +429,7 @@ class SemanticChecker(Visitor):
             
     
     def visit_var_def(self, var_def):
-        var_def.data_type.accept(self)
+        yield var_def.data_type
 
        
         if self.symbol_table.exists_in_curr_env(var_def.var_name.lexeme):
@@ -435,12 +440,12 @@ class SemanticChecker(Visitor):
         
     def visit_simple_term(self, simple_term):
         # TODO
-        simple_term.rvalue.accept(self)
+        yield simple_term.rvalue
         
     
     def visit_complex_term(self, complex_term):
         # TODO
-        complex_term.expr.accept(self)
+        yield complex_term.expr
         
 
     def visit_simple_rvalue(self, simple_rvalue):
@@ -477,7 +482,7 @@ class SemanticChecker(Visitor):
         if new_rvalue.struct_params != None:
             i = 0
             for expr in new_rvalue.struct_params:
-                expr.accept(self)
+                yield expr
                 if self.curr_type.type_name.lexeme not in [struct_def.fields[i].data_type.type_name.lexeme, 'void']:
                     self.error('type error in struct creation params', new_rvalue.type_name)
                 i = i+1
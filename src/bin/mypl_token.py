@@ -6,8 +6,10 @@ CLASS: CPSC 326
 
 """
 
+from array import array
 from dataclasses import dataclass
 from enum import Enum
+from sys import intern
 
 
 TokenType = Enum('TokenType', [
@@ -29,7 +31,7 @@ TokenType = Enum('TokenType', [
 ])
     
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     token_type: TokenType
     lexeme: str
@@ -42,3 +44,103 @@ class Token:
 
 
 
+# token type value -> token type
+TOKEN_TYPES = [None] + list(TokenType)
+
+# characters of a token before its lexeme (the quote of a string and the
+# slashes of a comment)
+LEXEME_OFFSETS = {TokenType.STRING_VAL.value: 1, TokenType.COMMENT.value: 2}
+
+# token types whose lexemes are not interned (they are rarely repeated)
+UNINTERNED = [TokenType.STRING_VAL.value, TokenType.COMMENT.value]
+
+
+class TokenBuffer:
+    """A token stream stored by column: one array each for the token type
+    values, the start and end offsets of the lexemes in the source
+    text, and the lines and columns. Lexemes are sliced from the text
+    (and Token objects created) only when a token is read.
+
+    """
+
+    def __init__(self, text):
+        """Creates an empty buffer for tokens of the given source text."""
+        self.text = text
+        self.types = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.lines = array('I')
+        self.columns = array('I')
+        self.error = None    # lexer error after the last token (if any)
+        self.pos = 0         # index of the token next_token returns
+        self.line = 0        # line number of the last token created
+
+    def __len__(self):
+        return len(self.types)
+
+    def append(self, type_value, start, end, line, column):
+        """Add a token (given by its type value and lexeme offsets)."""
+        self.types.append(type_value)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line)
+        self.columns.append(column)
+
+    def pop(self):
+        """Remove the last token. Returns the offset the token starts at
+        in the text, and its line and column.
+
+        """
+        start = self.starts.pop() - LEXEME_OFFSETS.get(self.types.pop(), 0)
+        self.ends.pop()
+        return start, self.lines.pop(), self.columns.pop()
+
+    def token_type(self, i):
+        return TOKEN_TYPES[self.types[i]]
+
+    def lexeme(self, i):
+        return self.text[self.starts[i]:self.ends[i]]
+
+    def token(self, i):
+        """Returns the i-th token as a Token. The lexemes of names, reserved
+        words, and numbers are interned, and tokens on the same line share
+        one line number object, so the tokens an AST keeps take less
+        memory.
+
+        """
+        type_value = self.types[i]
+        lexeme = self.text[self.starts[i]:self.ends[i]]
+        if type_value not in UNINTERNED:
+            lexeme = intern(lexeme)
+        line = self.lines[i]
+        if line == self.line:
+            line = self.line
+        else:
+            self.line = line
+        return Token(TOKEN_TYPES[type_value], lexeme, line, self.columns[i])
+
+    def next_token(self):
+        """Returns the next token, like Lexer.next_token (staying on the
+        final EOS token, and raising the lexer error, if any, once the
+        tokens before it have been read).
+
+        """
+        i = self.pos
+        if i < len(self.types):
+            self.pos = i + 1
+        elif self.error is not None:
+            raise self.error
+        else:
+            i -= 1
+        return self.token(i)
+
+    def __iter__(self):
+        """Generates the tokens from the next one on (raising the lexer
+        error, if any, at the end).
+
+        """
+        for i in range(self.pos, len(self.types)):
+            self.pos = i + 1
+            yield self.token(i)
+        if self.error is not None:
+            raise self.error
@@ -6,31 +6,116 @@ CLASS: CPSC 326
 
 """
 
+import sys
+import time
 from mypl_error import *
 from mypl_opcode import *
 from mypl_frame import *
+from mypl_heap import VMArray, VMStruct, Oid
+from mypl_jit import (JITCompiler, JIT_THRESHOLD, JIT_OSR_THRESHOLD,
+                      JIT_SAMPLE_RATE, JIT_RECURSION_LIMIT,
+                      JIT_NATIVE_DEPTH)
 
 
-class VM:
+DISPATCH_MODES = ['table', 'switch']
+HEAP_MODES = ['oid', 'ref']
 
-    def __init__(self):
-        """Creates a VM."""
-        self.struct_heap = {}        # id -> dict
-        self.array_heap = {}         # id -> list
-        self.next_obj_id = 2024      # next available object id (int)
-        self.frame_templates = {}    # function name -> VMFrameTemplate
-        self.call_stack = []         # function call stack
+# number of heap allocations between garbage collections
+GC_THRESHOLD = 10000
 
+# generic opcode -> {operand type -> quickened opcode}
+QUICK_OPCODES = {
+    OpCode.ADD: {int: OpCode.QADDI, float: OpCode.QADDD, str: OpCode.QADDS},
+    OpCode.SUB: {int: OpCode.QSUBI, float: OpCode.QSUBD},
+    OpCode.MUL: {int: OpCode.QMULI, float: OpCode.QMULD},
+    OpCode.CMPLT: {int: OpCode.QCMPLTI},
+    OpCode.CMPLE: {int: OpCode.QCMPLEI},
+}
 
-       
+# deoptimizations after which an instruction stays generic
+MAX_DEOPTS = 4
 
+# template of the placeholder frame below an interpreted call made by
+# compiled code (its return value is left on the placeholder's stack)
+NATIVE_CALLER = VMFrameTemplate('<native>', 0)
 
 
+class VM:
 
+    def __init__(self, dispatch='table', gc_threshold=GC_THRESHOLD, heap='oid',
+                 quicken=True, jit=False, jit_threshold=JIT_THRESHOLD,
+                 osr_threshold=JIT_OSR_THRESHOLD):
+        """Creates a VM.
+
+        Args:
+            dispatch -- How run() finds the code for each instruction:
+                        'table' (one handler per opcode, looked up
+                        directly) or 'switch' (the original if/elif
+                        chain).
+            gc_threshold -- Number of heap allocations that triggers a
+                            garbage collection (0 turns collection off).
+            heap -- How structs and arrays are represented: 'oid' (ids
+                    into struct_heap and array_heap) or 'ref' (the
+                    objects themselves, reclaimed by Python; requires
+                    table dispatch).
+            quicken -- If true (and using table dispatch), generic
+                       operators rewrite themselves into guarded
+                       versions for the operand types they see.
+            jit -- If true (and using table dispatch), functions called
+                   jit_threshold times are compiled to Python functions
+                   (see mypl_jit.py).
+            jit_threshold -- Number of calls before a function is
+                             compiled.
+            osr_threshold -- Number of backward jumps in a function
+                             before the loop being run is compiled and
+                             entered on-stack (with jit).
 
+        """
+        if dispatch not in DISPATCH_MODES:
+            raise VMError(f'unknown dispatch mode "{dispatch}"')
+        if heap not in HEAP_MODES:
+            raise VMError(f'unknown heap mode "{heap}"')
+        if heap == 'ref' and dispatch != 'table':
+            raise VMError('ref heap mode requires table dispatch')
+        self.struct_heap = {}        # id -> list of field slots
+        self.array_heap = {}         # id -> list
+        self.next_obj_id = 2024      # next available object id (int)
+        self.frame_templates = {}    # function name -> VMFrameTemplate
+        self.call_stack = []         # function call stack
+        self.dispatch = dispatch     # 'table' or 'switch'
+        self.heap = heap             # 'oid' or 'ref'
+        # garbage collection settings and counters
+        self.gc_threshold = gc_threshold
+        self.gc_allocs = 0           # allocations since last collection
+        self.gc_collections = 0      # number of collections run
+        self.gc_freed = 0            # number of objects freed
+        self.gc_pause_time = 0.0     # total seconds spent collecting
+        # quickening setting and counters
+        self.quicken = quicken and dispatch == 'table'
+        self.quickened = 0           # instructions rewritten to quick ops
+        self.deoptimized = 0         # quick ops rewritten back to generic
+        self.deopt_counts = {}       # (function name, pc) -> deopts
+        # tiered execution setting
+        self.jit = JITCompiler(self) if jit and dispatch == 'table' else None
+        self.jit_threshold = jit_threshold
+        self.native_depth = 0        # compiled calls currently running
+        self.osr_threshold = osr_threshold
+        self.start_time = 0.0        # perf_counter() when run started
+        # opcode -> bound handler, each called as handler(frame, operand);
+        # heap-mode specific handlers are named op_<opcode>_<heap mode>
+        self.handlers = {}
+        for op in OpCode:
+            name = 'op_' + op.name.lower()
+            self.handlers[op] = getattr(self, f'{name}_{heap}', None) or getattr(self, name)
+        # the same handlers indexed by opcode value (for linked templates)
+        self.op_table = [None] * (max(op.value for op in OpCode) + 1)
+        for op, handler in self.handlers.items():
+            self.op_table[op.value] = handler
+        if self.quicken:
+            for op, quick_ops in QUICK_OPCODES.items():
+                self.op_table[op.value] = self.adaptive(self.handlers[op], quick_ops)
 
 
-    
     def __repr__(self):
         """Returns a string representation of frame templates."""
         s = ''
@@ -49,7 +134,45 @@ class VM:
         """
         self.frame_templates[template.function_name] = template
 
+
+    def link(self):
+        """Convert every frame template to its compact linked form (see
+        VMFrameTemplate.link). Run after code generation is finished.
+
+        """
+        for template in self.frame_templates.values():
+            template.link()
+
+    
+    def stats(self):
+        """Returns a dictionary of runtime statistics."""
+        stats = {}
+        if self.heap == 'oid':
+            stats['gc collections'] = self.gc_collections
+            stats['gc objects freed'] = self.gc_freed
+            stats['gc pause time (s)'] = round(self.gc_pause_time, 6)
+            stats['heap objects'] = len(self.struct_heap) + len(self.array_heap)
+        if self.quicken:
+            stats['quickened instructions'] = self.quickened
+            stats['deoptimized instructions'] = self.deoptimized
+        if self.jit is not None:
+            stats.update(self.jit.stats())
+        return stats
+
     
+    def trace(self, frame, instr):
+        """Print debugging info for the instruction about to run."""
+        print('\n')
+        print('\t FRAME.........:', frame.template.function_name)
+        print('\t PC............:', frame.pc)
+        print('\t INSTRUCTION...:', self.instr_str(frame.template, instr))
+        val = None if not frame.operand_stack else frame.operand_stack[-1]
+        print('\t NEXT OPERAND..:', val)
+        cs = self.call_stack
+        fun = cs[-1].template.function_name if cs else None
+        print('\t NEXT FUNCTION..:', fun)
+
+
     def error(self, msg, frame=None):
         """Report a VM error."""
         if not frame:
@@ -57,9 +180,17 @@ class VM:
         pc = frame.pc - 1
         instr = frame.template.instructions[pc]
         name = frame.template.function_name
-        msg += f' (in {name} at {pc}: {instr})'
+        msg += f' (in {name} at {pc}: {self.instr_str(frame.template, instr)})'
         raise VMError(msg)
 
+
+    def instr_str(self, template, instr):
+        """Returns the printable form of an instruction of the given
+        template (for error messages and traces).
+
+        """
+        return str(instr)
+
     
     #----------------------------------------------------------------------
     # RUN FUNCTION
@@ -73,6 +204,26 @@ class VM:
             self.error('No "main" functrion')
         frame = VMFrame(self.frame_templates['main'])
         self.call_stack.append(frame)
+        self.start_time = time.perf_counter()
+
+        if self.dispatch == 'table' and self.jit is not None and not debug:
+            # calls go through the tiers; compiled calls are Python calls
+            self.link()
+            self.op_table[OpCode.CALL.value] = self.op_call_jit
+            self.op_table[OpCode.TCALL.value] = self.op_tcall_jit
+            self.op_table[OpCode.JMP.value] = self.op_jmp_jit
+            limit = sys.getrecursionlimit()
+            sys.setrecursionlimit(max(limit, JIT_RECURSION_LIMIT))
+            try:
+                self.run_table(frame)
+            finally:
+                sys.setrecursionlimit(limit)
+            return
+
+        if self.dispatch == 'table':
+            self.link()
+            self.run_table(frame, debug)
+            return
 
         # run loop (continue until run out of call frames or instructions)
         while self.call_stack and frame.pc < len(frame.template.instructions):
@@ -82,15 +233,7 @@ class VM:
             frame.pc += 1
             # for debugging:
             if debug:
-                print('\n')
-                print('\t FRAME.........:', frame.template.function_name)
-                print('\t PC............:', frame.pc)
-                print('\t INSTRUCTION...:', instr)
-                val = None if not frame.operand_stack else frame.operand_stack[-1]
-                print('\t NEXT OPERAND..:', val)
-                cs = self.call_stack
-                fun = cs[-1].template.function_name if cs else None
-                print('\t NEXT FUNCTION..:', fun)
+                self.trace(frame, instr)
 
             #------------------------------------------------------------
             # Literals and Variables
@@ -361,10 +504,12 @@ class VM:
                 if size < 0:
                     self.error('size can\'t be negative', frame)
 
+                self.count_alloc()
                 list = [None for _ in range(size)]
 
-                self.array_heap[self.next_obj_id] = list
-                frame.operand_stack.append(self.next_obj_id)
+                oid = Oid(self.next_obj_id)
+                self.array_heap[oid] = list
+                frame.operand_stack.append(oid)
                 self.next_obj_id = self.next_obj_id + 1
 
                 
@@ -408,9 +553,11 @@ class VM:
            
             
             elif instr.opcode == OpCode.ALLOCS:
-                self.struct_heap[self.next_obj_id] = {}
+                self.count_alloc()
+                oid = Oid(self.next_obj_id)
+                self.struct_heap[oid] = [None] * instr.operand
 
-                frame.operand_stack.append(self.next_obj_id)
+                frame.operand_stack.append(oid)
                 self.next_obj_id = self.next_obj_id + 1
 
                 
@@ -437,6 +584,153 @@ class VM:
                 self.struct_heap[y][instr.operand] = x
           
             
+            #------------------------------------------------------------
+            # Later Additions (after the original instructions, so that
+            # those are found as quickly as before)
+            #------------------------------------------------------------
+
+            # typed operators (the operand types are checked, so null is
+            # the only bad value left and it raises a TypeError)
+            elif (instr.opcode == OpCode.ADDI or instr.opcode == OpCode.ADDD or
+                  instr.opcode == OpCode.ADDS):
+                x = frame.operand_stack.pop()
+                try:
+                    frame.operand_stack[-1] = frame.operand_stack[-1] + x
+                except TypeError:
+                    self.error('null in add', frame)
+
+            elif instr.opcode == OpCode.SUBI or instr.opcode == OpCode.SUBD:
+                x = frame.operand_stack.pop()
+                try:
+                    frame.operand_stack[-1] = frame.operand_stack[-1] - x
+                except TypeError:
+                    self.error('null in sub', frame)
+
+            elif instr.opcode == OpCode.MULI or instr.opcode == OpCode.MULD:
+                x = frame.operand_stack.pop()
+                try:
+                    frame.operand_stack[-1] = frame.operand_stack[-1] * x
+                except TypeError:
+                    self.error('null in mul', frame)
+
+            elif instr.opcode == OpCode.DIVI or instr.opcode == OpCode.DIVD:
+                x = frame.operand_stack.pop()
+                try:
+                    result = frame.operand_stack[-1] / x
+                except ZeroDivisionError:
+                    self.error('Divide by 0 error', frame)
+                except TypeError:
+                    if x == 0:
+                        self.error('Divide by 0 error', frame)
+                    self.error('null in div', frame)
+                if instr.opcode == OpCode.DIVI:
+                    result = int(result)
+                frame.operand_stack[-1] = result
+
+            elif instr.opcode == OpCode.CMPLTI:
+                x = frame.operand_stack.pop()
+                try:
+                    frame.operand_stack[-1] = frame.operand_stack[-1] < x
+                except TypeError:
+                    self.error('null in cmplt', frame)
+
+            elif instr.opcode == OpCode.CMPLEI:
+                x = frame.operand_stack.pop()
+                try:
+                    frame.operand_stack[-1] = frame.operand_stack[-1] <= x
+                except TypeError:
+                    self.error('null in cmple', frame)
+
+            # and/or jumps (keep the deciding value as the result)
+            elif instr.opcode == OpCode.JMPFP:
+                x = frame.operand_stack[-1]
+                if x is False:
+                    frame.pc = instr.operand
+                elif x is None:
+                    self.error('null in and', frame)
+                else:
+                    frame.operand_stack.pop()
+
+            elif instr.opcode == OpCode.JMPTP:
+                x = frame.operand_stack[-1]
+                if x is True:
+                    frame.pc = instr.operand
+                elif x is None:
+                    self.error('null in or', frame)
+                else:
+                    frame.operand_stack.pop()
+
+            elif instr.opcode == OpCode.TCALL:
+                # the callee takes over the frame
+                template = self.frame_templates[instr.operand]
+                args = [frame.operand_stack.pop() for _ in range(template.arg_count)]
+                frame.template = template
+                frame.pc = 0
+                frame.variables.clear()
+                frame.operand_stack.clear()
+                frame.operand_stack.extend(args)
+
+            elif instr.opcode == OpCode.INITS:
+                # pop A values, allocate struct object holding them
+                self.count_alloc()
+                if instr.operand:
+                    fields = frame.operand_stack[-instr.operand:]
+                    del frame.operand_stack[-instr.operand:]
+                else:
+                    fields = []
+                oid = Oid(self.next_obj_id)
+                self.struct_heap[oid] = fields
+                frame.operand_stack.append(oid)
+                self.next_obj_id = self.next_obj_id + 1
+
+            # superinstructions
+            elif instr.opcode == OpCode.JNLTVV or instr.opcode == OpCode.JNLEVV:
+                i, j, target = instr.operand
+                try:
+                    if instr.opcode == OpCode.JNLTVV:
+                        taken = not frame.variables[i] < frame.variables[j]
+                    else:
+                        taken = not frame.variables[i] <= frame.variables[j]
+                except TypeError:
+                    self.error('null in cmplt' if instr.opcode == OpCode.JNLTVV
+                               else 'null in cmple', frame)
+                if taken:
+                    frame.pc = target
+
+            elif instr.opcode == OpCode.JNLTVK or instr.opcode == OpCode.JNLEVK:
+                i, k, target = instr.operand
+                try:
+                    if instr.opcode == OpCode.JNLTVK:
+                        taken = not frame.variables[i] < k
+                    else:
+                        taken = not frame.variables[i] <= k
+                except TypeError:
+                    self.error('null in cmplt' if instr.opcode == OpCode.JNLTVK
+                               else 'null in cmple', frame)
+                if taken:
+                    frame.pc = target
+
+            elif instr.opcode == OpCode.INCL:
+                i, k = instr.operand
+                try:
+                    frame.variables[i] = frame.variables[i] + k
+                except TypeError:
+                    self.error('null in add', frame)
+
+            elif instr.opcode == OpCode.DECL:
+                i, k = instr.operand
+                try:
+                    frame.variables[i] = frame.variables[i] - k
+                except TypeError:
+                    self.error('null in sub', frame)
+
+            elif instr.opcode == OpCode.LOADGETF:
+                i, offset = instr.operand
+                x = frame.variables[i]
+                if x is None:
+                    self.error('bad head index', frame)
+                frame.operand_stack.append(self.struct_heap[x][offset])
+
             #------------------------------------------------------------
             # Special 
             #------------------------------------------------------------
@@ -451,4 +745,912 @@ class VM:
                 pass
 
             else:
-                self.error(f'unsupported operation {instr}')
+                # only instructions the switch loop never runs get here
+                # (quickened ones come from table dispatch, MOV is a
+                # register VM instruction)
+                handler = self.handlers.get(instr.opcode)
+                if handler is None:
+                    self.error(f'unsupported operation {instr}')
+                next_frame = handler(frame, instr.operand)
+                if next_frame is not None:
+                    frame = next_frame
+
+
+
+    #----------------------------------------------------------------------
+    # GARBAGE COLLECTION
+    #----------------------------------------------------------------------
+
+    def count_alloc(self):
+        """Record a heap allocation, collecting garbage first if the
+        allocation threshold has been reached.
+
+        """
+        self.gc_allocs += 1
+        if self.gc_threshold and self.gc_allocs >= self.gc_threshold:
+            self.collect_garbage()
+
+            
+    def collect_garbage(self):
+        """Mark-and-sweep collection of the struct and array heaps.
+
+        Roots are the variables and operand stacks of every frame on the
+        call stack. Object ids are Oid values (not plain ints), so marking
+        follows references only, never program ints that happen to equal
+        an object id. Returns the number of objects freed.
+
+        """
+        start = time.perf_counter()
+        struct_heap = self.struct_heap
+        array_heap = self.array_heap
+        marked = set()
+        pending = []
+        for frame in self.call_stack:
+            pending.extend(frame.variables)
+            pending.extend(frame.operand_stack)
+        if self.jit is not None:
+            pending.extend(self.jit.native_roots())
+        # mark
+        while pending:
+            val = pending.pop()
+            if type(val) is not Oid or val in marked:
+                continue
+            if val in struct_heap:
+                marked.add(val)
+                pending.extend(struct_heap[val])
+            elif val in array_heap:
+                marked.add(val)
+                pending.extend(array_heap[val])
+        # sweep
+        freed = 0
+        for heap in (struct_heap, array_heap):
+            for oid in [oid for oid in heap if oid not in marked]:
+                del heap[oid]
+                freed += 1
+        self.gc_allocs = 0
+        self.gc_collections += 1
+        self.gc_freed += freed
+        self.gc_pause_time += time.perf_counter() - start
+        return freed
+        
+    
+    #----------------------------------------------------------------------
+    # QUICKENING
+    #----------------------------------------------------------------------
+
+    def adaptive(self, handler, quick_ops):
+        """Wrap a generic binary operator handler so that, after it runs,
+        the instruction is rewritten to the quick opcode for the operand
+        type if both operands had that type.
+
+        Args:
+            handler -- The generic handler.
+            quick_ops -- Operand type to quick opcode mapping.
+
+        """
+        def adaptive_handler(frame, operand):
+            stack = frame.operand_stack
+            x_type = type(stack[-1])
+            y_type = type(stack[-2])
+            handler(frame, operand)
+            if x_type is y_type and x_type in quick_ops:
+                self.quicken_instr(frame, quick_ops[x_type])
+        return adaptive_handler
+
+    def quicken_instr(self, frame, opcode):
+        """Rewrite the instruction that just ran to the given opcode, unless
+        it has already been deoptimized too often.
+
+        """
+        pc = frame.pc - 1
+        if self.deopt_counts.get((frame.template.function_name, pc), 0) < MAX_DEOPTS:
+            frame.template.opcodes[pc] = opcode.value
+            self.quickened += 1
+
+    def deoptimize(self, frame, opcode):
+        """Rewrite the running quick instruction back to its generic
+        opcode.
+
+        """
+        pc = frame.pc - 1
+        key = (frame.template.function_name, pc)
+        self.deopt_counts[key] = self.deopt_counts.get(key, 0) + 1
+        frame.template.opcodes[pc] = opcode.value
+        self.deoptimized += 1
+
+
+    #----------------------------------------------------------------------
+    # TIERED EXECUTION
+    #----------------------------------------------------------------------
+
+    def op_call_jit(self, frame, operand):
+        # CALL that counts calls and runs compiled functions natively
+        template = self.frame_templates[operand]
+        template.calls += 1
+        calls = template.calls
+        if self.native_depth >= JIT_NATIVE_DEPTH:
+            return self.op_call(frame, operand)
+        if (template.native is None and calls != self.jit_threshold and
+                calls % JIT_SAMPLE_RATE):
+            return self.op_call(frame, operand)
+        stack = frame.operand_stack
+        start = len(stack) - template.arg_count
+        args = stack[start:]
+        del stack[start:]
+        stack.append(self.invoke(template, args))
+
+    def op_tcall_jit(self, frame, operand):
+        # a tail call to a compiled function returns its value
+        template = self.frame_templates[operand]
+        template.calls += 1
+        calls = template.calls
+        if self.native_depth >= JIT_NATIVE_DEPTH:
+            return self.op_tcall(frame, operand)
+        if (template.native is None and calls != self.jit_threshold and
+                calls % JIT_SAMPLE_RATE):
+            return self.op_tcall(frame, operand)
+        stack = frame.operand_stack
+        start = len(stack) - template.arg_count
+        args = stack[start:]
+        del stack[start:]
+        stack.append(self.invoke(template, args))
+        return self.op_ret(frame, operand)
+
+    def op_jmp_jit(self, frame, operand):
+        # JMP that counts loop iterations and moves the frame into an
+        # OSR version of its function once a loop is hot
+        backward = operand < frame.pc
+        frame.pc = operand
+        if not backward:
+            return
+        template = frame.template
+        template.loops += 1
+        if template.loops < self.osr_threshold:
+            return
+        if operand not in template.osr:
+            template.osr[operand] = None
+            self.jit.compile(template, operand)
+        entry = template.osr[operand]
+        if entry is None or self.native_depth >= JIT_NATIVE_DEPTH:
+            return
+        # the compiled loop runs the rest of the call
+        value = self.run_native(entry, (frame.variables, frame.operand_stack))
+        frame.operand_stack.clear()
+        frame.operand_stack.append(value)
+        return self.op_ret(frame, None)
+
+    def call_template(self, template, *args):
+        """Call a function from compiled code and return its value.
+
+        Args:
+            template -- The called function's template.
+            args -- The arguments (in order).
+
+        """
+        template.calls += 1
+        native = template.native
+        if (native is not None and template.calls % JIT_SAMPLE_RATE and
+                self.native_depth < JIT_NATIVE_DEPTH):
+            self.native_depth += 1
+            try:
+                return native(*args)
+            finally:
+                self.native_depth -= 1
+        return self.invoke(template, args)
+
+    def invoke(self, template, args):
+        """Run a call (already counted) in the best tier available,
+        compiling the function if it just became hot and timing one in
+        JIT_SAMPLE_RATE calls. Returns the call's value.
+
+        """
+        if template.native is None and template.calls == self.jit_threshold:
+            self.jit.compile(template)
+        if self.native_depth >= JIT_NATIVE_DEPTH:
+            # too deep for more Python frames: the call (and the calls it
+            # makes) run in the interpreter's frames
+            return self.interpret(VMFrame(template, 0, [], list(args[::-1])))
+        if (template.calls % JIT_SAMPLE_RATE == 0 and
+                not self.jit.profile(template).sampling):
+            return self.jit.sample(template, args)
+        if template.native is not None:
+            return self.run_native(template.native, args)
+        return self.interpret(VMFrame(template, 0, [], list(args[::-1])))
+
+    def run_native(self, native, args):
+        """Run a compiled function, counting its depth, and return its
+        value.
+
+        """
+        self.native_depth += 1
+        try:
+            return native(*args)
+        finally:
+            self.native_depth -= 1
+
+    def interpret(self, frame):
+        """Run a frame in the interpreter until it returns (for calls made
+        by compiled code) and return its value.
+
+        Args:
+            frame -- The frame to run, set up to start (or continue).
+
+        """
+        caller = VMFrame(NATIVE_CALLER)
+        self.call_stack.append(caller)
+        self.call_stack.append(frame)
+        self.run_table(frame, stop=caller)
+        self.call_stack.pop()
+        return caller.operand_stack.pop()
+
+    def alloc_object(self, heap, obj):
+        """Add an object to the given heap (for compiled code) and return
+        its oid.
+
+        """
+        self.count_alloc()
+        oid = Oid(self.next_obj_id)
+        heap[oid] = obj
+        self.next_obj_id += 1
+        return oid
+
+
+    #----------------------------------------------------------------------
+    # TABLE DISPATCH
+    #----------------------------------------------------------------------
+
+    def run_table(self, frame, debug=False, stop=None):
+        """Run loop that jumps straight to each instruction's handler.
+
+        Runs over linked templates: each step indexes the handler table
+        with the opcode value and passes the operand from the template's
+        constant pool. Handlers that switch frames (CALL and RET) return
+        the frame to continue with, all others return None.
+
+        Args:
+            frame -- The frame to start executing.
+            debug -- If true, trace each instruction before it runs.
+            stop -- If given, return as soon as execution returns to
+                    this frame.
+
+        """
+        op_table = self.op_table
+        if debug:
+            op_table = [self.traced(i, op) for i, op in enumerate(op_table)]
+        call_stack = self.call_stack
+        template = frame.template
+        opcodes = template.opcodes
+        operands = template.operands
+        consts = template.consts
+        while call_stack:
+            pc = frame.pc
+            if pc >= len(opcodes):
+                break
+            frame.pc = pc + 1
+            next_frame = op_table[opcodes[pc]](frame, consts[operands[pc]])
+            if next_frame is not None:
+                if next_frame is stop:
+                    return
+                frame = next_frame
+                template = frame.template
+                opcodes = template.opcodes
+                operands = template.operands
+                consts = template.consts
+
+    def traced(self, value, handler):
+        """Wrap the handler of the given opcode value so that it prints a
+        trace before running.
+
+        """
+        if handler is None:
+            return None
+        opcode = OpCode(value)
+        def traced_handler(frame, operand):
+            self.trace(frame, VMInstr(opcode, operand))
+            return handler(frame, operand)
+        return traced_handler
+
+    # Literals and Variables
+
+    def op_push(self, frame, operand):
+        frame.operand_stack.append(operand)
+
+    def op_pop(self, frame, operand):
+        frame.operand_stack.pop()
+
+    def op_store(self, frame, operand):
+        if operand == len(frame.variables):
+            frame.variables.append(frame.operand_stack.pop())
+        else:
+            frame.variables[operand] = frame.operand_stack.pop()
+
+    def op_load(self, frame, operand):
+        frame.operand_stack.append(frame.variables[operand])
+
+    # Operations
+
+    def op_add(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x is None or y is None:
+            self.error('null in add', frame)
+        frame.operand_stack.append(y + x)
+
+    def op_sub(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x is None or y is None:
+            self.error('null in sub', frame)
+        frame.operand_stack.append(y - x)
+
+    def op_mul(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x is None or y is None:
+            self.error('null in mul', frame)
+        frame.operand_stack.append(y * x)
+
+    def op_div(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x in [0, 0.0]:
+            self.error('Divide by 0 error', frame)
+        if x is None or y is None:
+            self.error('null in div', frame)
+        result = y / x
+        if type(x) is int:
+            result = int(result)
+        frame.operand_stack.append(result)
+
+    def op_cmpeq(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        frame.operand_stack.append(y == x)
+
+    def op_cmple(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x is None or y is None:
+            self.error('null in cmple', frame)
+        frame.operand_stack.append(y <= x)
+
+    def op_cmplt(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x is None or y is None:
+            self.error('null in cmplt', frame)
+        frame.operand_stack.append(y < x)
+
+    def op_cmpne(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        frame.operand_stack.append(y != x)
+
+    def op_and(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x is None or y is None:
+            self.error('null in and', frame)
+        frame.operand_stack.append(y and x)
+
+    def op_or(self, frame, operand):
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x is None or y is None:
+            self.error('null in or', frame)
+        frame.operand_stack.append(y or x)
+
+    def op_not(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x is None:
+            self.error('null in not', frame)
+        frame.operand_stack.append(not x)
+
+    # Typed operators: the semantic checker proved both operands have the
+    # same type, so the only bad value left is null, which makes Python
+    # raise a TypeError (no per-instruction null checks)
+
+    def op_addi(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        try:
+            stack[-1] = stack[-1] + x
+        except TypeError:
+            self.error('null in add', frame)
+
+    # in Python the double and string versions are the same code
+    op_addd = op_addi
+    op_adds = op_addi
+
+    def op_subi(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        try:
+            stack[-1] = stack[-1] - x
+        except TypeError:
+            self.error('null in sub', frame)
+
+    op_subd = op_subi
+
+    def op_muli(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        try:
+            stack[-1] = stack[-1] * x
+        except TypeError:
+            self.error('null in mul', frame)
+
+    op_muld = op_muli
+
+    def op_divi(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        try:
+            stack[-1] = int(stack[-1] / x)
+        except ZeroDivisionError:
+            self.error('Divide by 0 error', frame)
+        except TypeError:
+            if x == 0:
+                self.error('Divide by 0 error', frame)
+            self.error('null in div', frame)
+
+    def op_divd(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        try:
+            stack[-1] = stack[-1] / x
+        except ZeroDivisionError:
+            self.error('Divide by 0 error', frame)
+        except TypeError:
+            if x == 0:
+                self.error('Divide by 0 error', frame)
+            self.error('null in div', frame)
+
+    def op_cmplti(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        try:
+            stack[-1] = stack[-1] < x
+        except TypeError:
+            self.error('null in cmplt', frame)
+
+    def op_cmplei(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        try:
+            stack[-1] = stack[-1] <= x
+        except TypeError:
+            self.error('null in cmple', frame)
+
+    # Quickened operators: each checks that both operands still have the
+    # type it was specialized for, otherwise it deoptimizes and runs the
+    # generic handler
+
+    def op_qaddi(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        y = stack[-1]
+        if x.__class__ is int and y.__class__ is int:
+            stack[-1] = y + x
+        else:
+            stack.append(x)
+            self.deoptimize(frame, OpCode.ADD)
+            self.op_add(frame, operand)
+
+    def op_qaddd(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        y = stack[-1]
+        if x.__class__ is float and y.__class__ is float:
+            stack[-1] = y + x
+        else:
+            stack.append(x)
+            self.deoptimize(frame, OpCode.ADD)
+            self.op_add(frame, operand)
+
+    def op_qadds(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        y = stack[-1]
+        if x.__class__ is str and y.__class__ is str:
+            stack[-1] = y + x
+        else:
+            stack.append(x)
+            self.deoptimize(frame, OpCode.ADD)
+            self.op_add(frame, operand)
+
+    def op_qsubi(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        y = stack[-1]
+        if x.__class__ is int and y.__class__ is int:
+            stack[-1] = y - x
+        else:
+            stack.append(x)
+            self.deoptimize(frame, OpCode.SUB)
+            self.op_sub(frame, operand)
+
+    def op_qsubd(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        y = stack[-1]
+        if x.__class__ is float and y.__class__ is float:
+            stack[-1] = y - x
+        else:
+            stack.append(x)
+            self.deoptimize(frame, OpCode.SUB)
+            self.op_sub(frame, operand)
+
+    def op_qmuli(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        y = stack[-1]
+        if x.__class__ is int and y.__class__ is int:
+            stack[-1] = y * x
+        else:
+            stack.append(x)
+            self.deoptimize(frame, OpCode.MUL)
+            self.op_mul(frame, operand)
+
+    def op_qmuld(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        y = stack[-1]
+        if x.__class__ is float and y.__class__ is float:
+            stack[-1] = y * x
+        else:
+            stack.append(x)
+            self.deoptimize(frame, OpCode.MUL)
+            self.op_mul(frame, operand)
+
+    def op_qcmplti(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        y = stack[-1]
+        if x.__class__ is int and y.__class__ is int:
+            stack[-1] = y < x
+        else:
+            stack.append(x)
+            self.deoptimize(frame, OpCode.CMPLT)
+            self.op_cmplt(frame, operand)
+
+    def op_qcmplei(self, frame, operand):
+        stack = frame.operand_stack
+        x = stack.pop()
+        y = stack[-1]
+        if x.__class__ is int and y.__class__ is int:
+            stack[-1] = y <= x
+        else:
+            stack.append(x)
+            self.deoptimize(frame, OpCode.CMPLE)
+            self.op_cmple(frame, operand)
+
+    # Branching
+
+    def op_jmp(self, frame, operand):
+        frame.pc = operand
+
+    def op_jmpf(self, frame, operand):
+        if frame.operand_stack.pop() == False:
+            frame.pc = operand
+
+    def op_jmpfp(self, frame, operand):
+        x = frame.operand_stack[-1]
+        if x is False:
+            frame.pc = operand
+        elif x is None:
+            self.error('null in and', frame)
+        else:
+            frame.operand_stack.pop()
+
+    def op_jmptp(self, frame, operand):
+        x = frame.operand_stack[-1]
+        if x is True:
+            frame.pc = operand
+        elif x is None:
+            self.error('null in or', frame)
+        else:
+            frame.operand_stack.pop()
+
+    # Functions
+
+    def op_call(self, frame, operand):
+        f = VMFrame(self.frame_templates[operand])
+        self.call_stack.append(f)
+        # pop arguments from op stack, push to f operand stack
+        for _ in range(f.template.arg_count):
+            f.operand_stack.append(frame.operand_stack.pop())
+        return f
+
+    def op_ret(self, frame, operand):
+        r_val = frame.operand_stack.pop()
+        self.call_stack.pop()
+        if self.call_stack:
+            frame = self.call_stack[-1]
+            frame.operand_stack.append(r_val)
+        return frame
+
+    def op_tcall(self, frame, operand):
+        template = self.frame_templates[operand]
+        args = [frame.operand_stack.pop() for _ in range(template.arg_count)]
+        # the callee takes over the frame (and its return goes straight
+        # to our caller)
+        frame.template = template
+        frame.pc = 0
+        frame.variables.clear()
+        frame.operand_stack.clear()
+        frame.operand_stack.extend(args)
+        return frame
+
+    # Built-In Functions
+
+    def op_write(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x is None:
+            x = 'null'
+        if type(x) is bool:
+            x = str(x).lower()
+        print(x, end='')
+
+    def op_read(self, frame, operand):
+        frame.operand_stack.append(input())
+
+    def op_len(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x is None:
+            self.error('null has no length', frame)
+        if type(x) is str:
+            frame.operand_stack.append(len(x))
+        else:
+            frame.operand_stack.append(len(self.array_heap[x]))
+
+    def op_getc(self, frame, operand):
+        # x = string, y = index
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x is None or y is None:
+            self.error('null in array access', frame)
+        if y > len(x) - 1 or y < 0:
+            self.error('bad index', frame)
+        frame.operand_stack.append(x[y])
+
+    def op_toint(self, frame, operand):
+        x = frame.operand_stack.pop()
+        try:
+            x = int(x)
+        except (ValueError, TypeError):
+            self.error('bad int in cast', frame)
+        frame.operand_stack.append(x)
+
+    def op_todbl(self, frame, operand):
+        x = frame.operand_stack.pop()
+        try:
+            x = float(x)
+        except (ValueError, TypeError):
+            self.error('bad double in cast', frame)
+        frame.operand_stack.append(x)
+
+    def op_tostr(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x is None:
+            self.error('null in tostring', frame)
+        frame.operand_stack.append(str(x))
+
+    # Heap
+
+    def op_alloca(self, frame, operand):
+        size = frame.operand_stack.pop()
+        if type(size) is not int:
+            self.error('array size must be int', frame)
+        if size < 0:
+            self.error('size can\'t be negative', frame)
+        self.count_alloc()
+        oid = Oid(self.next_obj_id)
+        self.array_heap[oid] = [None] * size
+        frame.operand_stack.append(oid)
+        self.next_obj_id += 1
+
+    def op_geti(self, frame, operand):
+        # pop index x, pop oid y, push obj(y)[x] onto stack
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x is None or y is None:
+            self.error('indicies can\'t be null', frame)
+        array = self.array_heap[y]
+        if x >= len(array) or x < 0:
+            self.error('bad array index', frame)
+        frame.operand_stack.append(array[x])
+
+    def op_seti(self, frame, operand):
+        # pop value x, pop index y, pop oid z, set array obj(z)[y] = x
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        z = frame.operand_stack.pop()
+        if y is None or z is None:
+            self.error('indicies can\'t be null', frame)
+        array = self.array_heap[z]
+        if y < 0 or y >= len(array):
+            self.error('bad index', frame)
+        array[y] = x
+
+    def op_allocs(self, frame, operand):
+        self.count_alloc()
+        oid = Oid(self.next_obj_id)
+        self.struct_heap[oid] = [None] * operand
+        frame.operand_stack.append(oid)
+        self.next_obj_id += 1
+
+    def op_inits(self, frame, operand):
+        # pop A values, allocate struct object holding them, push oid
+        self.count_alloc()
+        if operand:
+            fields = frame.operand_stack[-operand:]
+            del frame.operand_stack[-operand:]
+        else:
+            fields = []
+        oid = Oid(self.next_obj_id)
+        self.struct_heap[oid] = fields
+        frame.operand_stack.append(oid)
+        self.next_obj_id += 1
+
+    def op_getf(self, frame, operand):
+        # pop oid x, push obj(x)[A] onto stack
+        x = frame.operand_stack.pop()
+        if x is None:
+            self.error('bad head index', frame)
+        frame.operand_stack.append(self.struct_heap[x][operand])
+
+    def op_setf(self, frame, operand):
+        # pop value x, pop oid y, set obj(y)[A] = x
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if y is None:
+            self.error('bad heap index', frame)
+        self.struct_heap[y][operand] = x
+
+    # Superinstructions (the comparisons report null operands through
+    # the TypeError they raise, like the typed operators)
+
+    def op_jnltvv(self, frame, operand):
+        i, j, target = operand
+        variables = frame.variables
+        try:
+            if not variables[i] < variables[j]:
+                frame.pc = target
+        except TypeError:
+            self.error('null in cmplt', frame)
+
+    def op_jnlevv(self, frame, operand):
+        i, j, target = operand
+        variables = frame.variables
+        try:
+            if not variables[i] <= variables[j]:
+                frame.pc = target
+        except TypeError:
+            self.error('null in cmple', frame)
+
+    def op_jnltvk(self, frame, operand):
+        i, k, target = operand
+        try:
+            if not frame.variables[i] < k:
+                frame.pc = target
+        except TypeError:
+            self.error('null in cmplt', frame)
+
+    def op_jnlevk(self, frame, operand):
+        i, k, target = operand
+        try:
+            if not frame.variables[i] <= k:
+                frame.pc = target
+        except TypeError:
+            self.error('null in cmple', frame)
+
+    def op_incl(self, frame, operand):
+        i, k = operand
+        variables = frame.variables
+        try:
+            variables[i] = variables[i] + k
+        except TypeError:
+            self.error('null in add', frame)
+
+    def op_decl(self, frame, operand):
+        i, k = operand
+        variables = frame.variables
+        try:
+            variables[i] = variables[i] - k
+        except TypeError:
+            self.error('null in sub', frame)
+
+    def op_loadgetf(self, frame, operand):
+        i, offset = operand
+        x = frame.variables[i]
+        if x is None:
+            self.error('bad head index', frame)
+        frame.operand_stack.append(self.struct_heap[x][offset])
+
+    # Special
+
+    def op_mov(self, frame, operand):
+        self.error('MOV is a register instruction', frame)
+
+    def op_dup(self, frame, operand):
+        frame.operand_stack.append(frame.operand_stack[-1])
+
+    def op_nop(self, frame, operand):
+        # do nothing
+        pass
+
+
+    #----------------------------------------------------------------------
+    # REF HEAP HANDLERS (struct and array values are the objects)
+    #----------------------------------------------------------------------
+
+    def op_len_ref(self, frame, operand):
+        x = frame.operand_stack.pop()
+        if x is None:
+            self.error('null has no length', frame)
+        frame.operand_stack.append(len(x))
+
+    def op_alloca_ref(self, frame, operand):
+        size = frame.operand_stack.pop()
+        if type(size) is not int:
+            self.error('array size must be int', frame)
+        if size < 0:
+            self.error('size can\'t be negative', frame)
+        frame.operand_stack.append(VMArray([None] * size))
+
+    def op_geti_ref(self, frame, operand):
+        # pop index x, pop array y, push y[x] onto stack
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if x is None or y is None:
+            self.error('indicies can\'t be null', frame)
+        if x >= len(y) or x < 0:
+            self.error('bad array index', frame)
+        frame.operand_stack.append(y[x])
+
+    def op_seti_ref(self, frame, operand):
+        # pop value x, pop index y, pop array z, set z[y] = x
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        z = frame.operand_stack.pop()
+        if y is None or z is None:
+            self.error('indicies can\'t be null', frame)
+        if y < 0 or y >= len(z):
+            self.error('bad index', frame)
+        z[y] = x
+
+    def op_allocs_ref(self, frame, operand):
+        frame.operand_stack.append(VMStruct([None] * operand))
+
+    def op_inits_ref(self, frame, operand):
+        # pop A values, push struct object holding them
+        if operand:
+            fields = VMStruct(frame.operand_stack[-operand:])
+            del frame.operand_stack[-operand:]
+        else:
+            fields = VMStruct()
+        frame.operand_stack.append(fields)
+
+    def op_getf_ref(self, frame, operand):
+        # pop struct x, push x[A] onto stack
+        x = frame.operand_stack.pop()
+        if x is None:
+            self.error('bad head index', frame)
+        frame.operand_stack.append(x[operand])
+
+    def op_loadgetf_ref(self, frame, operand):
+        # push variables[i][f] onto stack
+        i, offset = operand
+        x = frame.variables[i]
+        if x is None:
+            self.error('bad head index', frame)
+        frame.operand_stack.append(x[offset])
+
+    def op_setf_ref(self, frame, operand):
+        # pop value x, pop struct y, set y[A] = x
+        x = frame.operand_stack.pop()
+        y = frame.operand_stack.pop()
+        if y is None:
+            self.error('bad heap index', frame)
+        y[operand] = x